@@ -0,0 +1,245 @@
+#=======================================================================================
+"""
+Benchmark
+
+This file contains a scaling benchmark of the notebook pipeline on synthetic data
+(see synthetic_data_000). For every scale it times the end-to-end run of main.ipynb,
+from pd.read_csv through master_df_grouped_by_route_v12, and, through
+instrumentation_000, every dw_ and fe_ function called on the way.
+
+Results can be stored as a json baseline and later runs compared against it:
+
+    python benchmark_000.py --scales 1000000 10000000 --save-baseline benchmark_baseline.json
+    ... change the code ...
+    python benchmark_000.py --scales 1000000 10000000 --baseline benchmark_baseline.json
+
+"""
+#=======================================================================================
+import argparse
+import json
+import os
+import platform
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import feature_engineering_000 as fe
+import instrumentation_000
+import pipeline_000
+from synthetic_data_000 import generate_synthetic_csv_files
+
+# the fe_ steps of main.ipynb after the grouping, in order (v1 -> v12)
+FE_CHAIN = [
+    'fe_create_multiple_mean_values_with_count',
+    'fe_calculate_route_delay_cost',
+    'fe_calculate_round_trip_route_dio_cost',
+    'fe_calculate_round_trip_route_fomc_cost',
+    'fe_calculate_round_trip_route_fare_revenue',
+    'fe_calculate_round_trip_route_baggage_revenue',
+    'fe_calculate_round_trip_total_revenue',
+    'fe_calculate_round_trip_total_variable_cost',
+    'fe_calculate_per_round_trip_route_profit',
+    'fe_calculate_break_even_point_in_number_of_round_trip_flights_for_route',
+    'fe_calculate_total_profit_for_route_2019q1',
+]
+
+END_TO_END = 'end_to_end'
+READ_CSV = 'read_csv'
+
+RESULT_COLUMNS = ['scale', 'function', 'calls', 'wall_s', 'cpu_s']
+
+
+#=======================================================================================
+# running
+#=======================================================================================
+def run_notebook_pipeline(paths):
+    """
+    Runs main.ipynb end to end on a set of csv files.
+
+    Parameters:
+    - paths: A dict with the 'airport_codes', 'flights' and 'tickets' file paths.
+
+    Returns:
+    - master_df_grouped_by_route_v12: The final per-route dataframe.
+    """
+    airport_codes_initial = pd.read_csv(paths['airport_codes'])
+    tickets_initial = pd.read_csv(paths['tickets'])
+    flights_initial = pd.read_csv(paths['flights'])
+
+    grouped_data = pipeline_000.dw_run_route_pipeline(airport_codes_initial, flights_initial, tickets_initial)
+    for name in FE_CHAIN:
+        # looked up on the module, so the instrumented version is called
+        grouped_data = getattr(fe, name)(grouped_data)
+
+    return grouped_data
+
+
+def _time_read_csv(paths):
+    start = time.perf_counter()
+    for path in paths.values():
+        pd.read_csv(path)
+
+    return time.perf_counter() - start
+
+
+def run_benchmark(scales=(1_000_000,), directory='benchmark_data', seed=0, repeat=1):
+    """
+    Times the notebook pipeline at every scale. The synthetic files are generated
+    once per scale and seed and reused by later runs.
+
+    Parameters:
+    - scales: The numbers of flight rows to benchmark.
+    - directory: Where the synthetic files are kept, one subdirectory per scale and seed.
+    - seed: The random seed of the synthetic data.
+    - repeat: How often each scale is run; the fastest run is kept.
+
+    Returns:
+    - results: One row per scale and function ('end_to_end' and 'read_csv' included)
+      with the calls and the wall and cpu seconds.
+    """
+    frames = []
+    for scale in scales:
+        scale_directory = os.path.join(directory, f'{scale}_seed{seed}')
+        paths = {name: os.path.join(scale_directory, f'{file}.csv') for name, file in
+                 [('airport_codes', 'Airport_Codes'), ('flights', 'Flights'), ('tickets', 'Tickets')]}
+        if not all(os.path.exists(path) for path in paths.values()):
+            paths = generate_synthetic_csv_files(scale_directory, n_flights=scale, seed=seed)
+
+        best = None
+        for _ in range(repeat):
+            recorder = instrumentation_000.instrument(namespaces=[vars(pipeline_000)], track_memory=False)
+            try:
+                wall_start, cpu_start = time.perf_counter(), time.process_time()
+                run_notebook_pipeline(paths)
+                wall_s, cpu_s = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            finally:
+                instrumentation_000.uninstrument()
+
+            # only the outermost call of a function counts, nested calls are inside it
+            report = recorder.report()
+            report = report[report['depth'] == 0]
+            run = report.groupby('function', sort=False).agg(
+                calls=('call', 'size'), wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum')).reset_index()
+            run = pd.concat([pd.DataFrame({'function': [END_TO_END, READ_CSV], 'calls': [1, 1],
+                                           'wall_s': [wall_s, _time_read_csv(paths)], 'cpu_s': [cpu_s, None]}),
+                             run], ignore_index=True)
+            best = run if best is None else _fastest(best, run)
+
+        best.insert(0, 'scale', scale)
+        frames.append(best)
+
+    return pd.concat(frames, ignore_index=True)[RESULT_COLUMNS]
+
+
+def _fastest(a, b):
+    """Keeps the faster timing of each function over two runs."""
+    both = a.merge(b[['function', 'wall_s', 'cpu_s']], on='function', how='outer', suffixes=('', '_other'))
+    faster = both['wall_s_other'] < both['wall_s']
+    both.loc[faster, ['wall_s', 'cpu_s']] = both.loc[faster, ['wall_s_other', 'cpu_s_other']].to_numpy()
+
+    return both.drop(columns=['wall_s_other', 'cpu_s_other'])
+
+
+#=======================================================================================
+# baselines
+#=======================================================================================
+def save_baseline(results, path):
+    """
+    Stores benchmark results as a json baseline, with the machine and versions they
+    were measured on.
+    """
+    baseline = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'pandas': pd.__version__, 'cpus': os.cpu_count()},
+        'results': results.astype(object).where(results.notna(), None).to_dict(orient='records'),
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def load_baseline(path):
+    """
+    Reads a json baseline written by save_baseline back into a results dataframe.
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+
+    return pd.DataFrame(baseline['results'], columns=RESULT_COLUMNS)
+
+
+def compare_to_baseline(results, baseline, tolerance=0.1):
+    """
+    Compares benchmark results with a baseline, per scale and function.
+
+    Parameters:
+    - results: The current results from run_benchmark.
+    - baseline: A results dataframe or the path of a json baseline.
+    - tolerance: Relative wall time change still counted as 'same' (0.1 = 10%).
+
+    Returns:
+    - comparison: One row per scale and function with 'baseline_s', 'current_s',
+      'ratio' (current / baseline) and 'status': 'slower', 'faster', 'same', or
+      'new' / 'missing' when the function is only in one of the two.
+    """
+    if isinstance(baseline, str):
+        baseline = load_baseline(baseline)
+
+    comparison = baseline[['scale', 'function', 'wall_s']].rename(columns={'wall_s': 'baseline_s'}).merge(
+        results[['scale', 'function', 'wall_s']].rename(columns={'wall_s': 'current_s'}),
+        on=['scale', 'function'], how='outer')
+    comparison['ratio'] = comparison['current_s'] / comparison['baseline_s']
+
+    comparison['status'] = 'same'
+    comparison.loc[comparison['ratio'] > 1 + tolerance, 'status'] = 'slower'
+    comparison.loc[comparison['ratio'] < 1 - tolerance, 'status'] = 'faster'
+    comparison.loc[comparison['baseline_s'].isna(), 'status'] = 'new'
+    comparison.loc[comparison['current_s'].isna(), 'status'] = 'missing'
+
+    return comparison.sort_values(['scale', 'baseline_s'], ascending=[True, False]).reset_index(drop=True)
+
+
+def format_comparison(comparison):
+    """
+    Returns a comparison as a readable report, per scale, with the regressions first.
+    """
+    lines = []
+    for scale, rows in comparison.groupby('scale', sort=True):
+        slower = (rows['status'] == 'slower').sum()
+        faster = (rows['status'] == 'faster').sum()
+        lines.append(f"scale {scale:,} rows: {slower} slower, {faster} faster")
+        rows = rows.assign(order=rows['status'].map({'slower': 0, 'faster': 1}).fillna(2))
+        lines.append(rows.sort_values('order', kind='stable').drop(columns=['scale', 'order'])
+                     .to_string(index=False, float_format='{:.3f}'.format, na_rep='-'))
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+#=======================================================================================
+# command line
+#=======================================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the notebook pipeline on synthetic data.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1_000_000], help='numbers of flight rows')
+    parser.add_argument('--directory', default='benchmark_data', help='where the synthetic files are kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--baseline', help='json baseline to compare against')
+    parser.add_argument('--save-baseline', help='store the results as a json baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.scales, args.directory, args.seed, args.repeat)
+    print(results.to_string(index=False, float_format='{:.3f}'.format, na_rep='-'))
+
+    if args.baseline:
+        print()
+        print(format_comparison(compare_to_baseline(results, args.baseline, args.tolerance)))
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+
+
+if __name__ == '__main__':
+    main()
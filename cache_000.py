@@ -0,0 +1,354 @@
+#=======================================================================================
+"""
+Caching
+
+This file contains a small on-disk cache for the cleaned intermediates of the
+data wrangling stages (airport_codes_v2, flights_v3, tickets_v3 and the route
+grouped fares), so that a warm run does not reparse the csv files.
+
+Every entry is keyed by a hash of the source file contents, the stage name and
+the stage's code version (the source code of the modules that define the functions
+the stage runs, so their helpers, schemas and constants count too).
+Each dataframe column is stored as its own .npy file and loaded back memory-mapped.
+Text columns are stored as integer codes plus a small json list of distinct values.
+The cache has a size cap and evicts the least recently used entries.
+
+"""
+#=======================================================================================
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_wrangling_000 import (
+    dw_load_airport_codes,
+    dw_load_flights,
+    dw_load_tickets,
+    dw_replace_itin_fare_with_group_mean,
+    dw_subset_airport_codes_for_merger,
+    dw_transform_calculate_mean_fare_by_route_to_merge_with_flights,
+)
+from feature_engineering_000 import fe_create_mean_route_fare_per_passenger, fe_create_route
+
+#=======================================================================================
+# hashing
+#=======================================================================================
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def _file_digest(path):
+    """Hashes the contents of a file in 1 MB blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _local_modules(functions):
+    """
+    The modules defining the functions, plus the modules of this repository they
+    use in turn (e.g. data_wrangling_000 gathers with feature_engineering_000).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    pending = [inspect.getmodule(function) for function in functions]
+    modules = {}
+    while pending:
+        module = pending.pop()
+        path = getattr(module, '__file__', None)
+        if module is None or module.__name__ in modules or path is None \
+                or os.path.dirname(os.path.abspath(path)) != here:
+            continue
+        modules[module.__name__] = module
+        pending.extend(inspect.getmodule(value) for value in vars(module).values()
+                       if inspect.isfunction(value) or inspect.isclass(value) or inspect.ismodule(value))
+
+    return [modules[name] for name in sorted(modules)]
+
+
+def _code_version(functions):
+    """
+    Hashes the source code a stage runs: the whole modules that define its functions
+    (and the repository modules those use). A stage's functions call helpers, schemas
+    and constants of their module, so any edit there changes the version too.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for module in _local_modules(functions):
+        digest.update(module.__name__.encode())
+        digest.update(inspect.getsource(module).encode())
+    for function in functions:
+        # functions defined outside the repository (or interactively) still count by name
+        digest.update(function.__qualname__.encode())
+
+    return digest.hexdigest()
+
+
+#=======================================================================================
+# column storage
+#=======================================================================================
+def _save_column(directory, position, series):
+    """
+    Writes one column as .npy file(s) and returns the json description needed to load it.
+    """
+    prefix = os.path.join(directory, f'col_{position}')
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        np.save(prefix + '.npy', series.cat.codes.to_numpy())
+        return {'kind': 'category', 'values': series.cat.categories.tolist(),
+                'ordered': bool(dtype.ordered)}
+
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'iufb':
+        # nullable numbers: data (missing values as 0) and mask stored side by side
+        np.save(prefix + '.npy', series.to_numpy(dtype=dtype.numpy_dtype, na_value=dtype.numpy_dtype.type(0)))
+        np.save(prefix + '_mask.npy', series.isna().to_numpy())
+        return {'kind': 'masked', 'dtype': str(dtype)}
+
+    if dtype.kind in 'iufbmM':
+        np.save(prefix + '.npy', series.to_numpy())
+        return {'kind': 'numpy'}
+
+    # object / string columns: integer codes plus the distinct values
+    codes, distinct = pd.factorize(series)
+    np.save(prefix + '.npy', codes.astype(np.int32))
+    return {'kind': 'text', 'values': [value.item() if hasattr(value, 'item') else value
+                                       for value in distinct],
+            'dtype': str(dtype)}
+
+
+def _load_column(directory, position, description):
+    """
+    Loads one column written by _save_column. Numeric data is memory-mapped.
+    """
+    prefix = os.path.join(directory, f'col_{position}')
+    # plain ndarray views; the np.memmap they view keeps the file mapped
+    data = np.load(prefix + '.npy', mmap_mode='r').view(np.ndarray)
+    kind = description['kind']
+
+    if kind == 'numpy':
+        return data
+
+    if kind == 'masked':
+        mask = np.load(prefix + '_mask.npy', mmap_mode='r').view(np.ndarray)
+        kind = pd.api.types.pandas_dtype(description['dtype']).kind
+        array_type = {'b': pd.arrays.BooleanArray, 'f': pd.arrays.FloatingArray}.get(kind, pd.arrays.IntegerArray)
+        return array_type(data, mask)
+
+    if kind == 'category':
+        return pd.Categorical.from_codes(data, categories=description['values'],
+                                         ordered=description['ordered'])
+
+    # text: gather the distinct values, -1 codes are missing values
+    distinct = np.array(description['values'] + [np.nan], dtype=object)
+    return pd.Series(distinct[data], dtype=description['dtype'], copy=False)
+
+
+#=======================================================================================
+# cache
+#=======================================================================================
+class StageCache:
+    """
+    A content-addressed on-disk cache of dataframes with a size cap and LRU eviction.
+
+    Parameters:
+    - directory: Where the cache lives. Created if missing.
+    - max_bytes: The size cap. Least recently used entries are evicted beyond it.
+    """
+
+    def __init__(self, directory='.dw_cache', max_bytes=4 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, 'index.json')
+        self._index = self._read_index()
+
+    #-----------------------------------------------------------------------------------
+    def _read_index(self):
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                return json.load(f)
+        return {'entries': {}, 'files': {}}
+
+    def _write_index(self):
+        temporary_path = self._index_path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(temporary_path, self._index_path)
+
+    #-----------------------------------------------------------------------------------
+    def source_digest(self, path):
+        """
+        Returns the content hash of a source file. The hash is remembered for the
+        file's size and modification time, so an unchanged file is not rehashed.
+        """
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        known = self._index['files'].get(os.path.abspath(path))
+        if known and known['signature'] == signature:
+            return known['digest']
+
+        digest = _file_digest(path)
+        self._index['files'][os.path.abspath(path)] = {'signature': signature, 'digest': digest}
+        self._write_index()
+
+        return digest
+
+    def key(self, stage, sources=(), functions=(), params=None):
+        """
+        Builds the cache key of a stage from the source file contents,
+        the stage name, the code of its functions and any parameters.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(stage.encode())
+        for path in sources:
+            digest.update(self.source_digest(path).encode())
+        digest.update(_code_version(functions).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+
+        return digest.hexdigest()
+
+    #-----------------------------------------------------------------------------------
+    def get(self, key):
+        """
+        Returns the cached dataframe for a key (memory-mapped), or None on a miss.
+        """
+        entry = self._index['entries'].get(key)
+        entry_directory = os.path.join(self.directory, key)
+        if entry is None or not os.path.isdir(entry_directory):
+            return None
+
+        with open(os.path.join(entry_directory, 'meta.json')) as f:
+            meta = json.load(f)
+
+        columns = {name: _load_column(entry_directory, position, description)
+                   for position, (name, description) in enumerate(zip(meta['columns'], meta['descriptions']))}
+        df = pd.DataFrame(columns, copy=False)
+        if meta['index'] is not None:
+            df.index = _load_column(entry_directory, 'index', meta['index'])
+
+        entry['last_used'] = time.time()
+        self._write_index()
+
+        return df
+
+    def put(self, key, df, stage=''):
+        """
+        Stores a dataframe under a key and evicts old entries beyond the size cap.
+        """
+        entry_directory = os.path.join(self.directory, key)
+        temporary_directory = entry_directory + '.tmp'
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        os.makedirs(temporary_directory)
+
+        descriptions = [_save_column(temporary_directory, position, df.iloc[:, position])
+                        for position in range(df.shape[1])]
+        index_description = None
+        if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+            index_description = _save_column(temporary_directory, 'index', df.index.to_series())
+
+        with open(os.path.join(temporary_directory, 'meta.json'), 'w') as f:
+            json.dump({'columns': [str(column) for column in df.columns],
+                       'descriptions': descriptions,
+                       'index': index_description}, f)
+
+        shutil.rmtree(entry_directory, ignore_errors=True)
+        os.replace(temporary_directory, entry_directory)
+
+        size = sum(entry.stat().st_size for entry in os.scandir(entry_directory))
+        self._index['entries'][key] = {'stage': stage, 'bytes': size, 'last_used': time.time()}
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits its size cap.
+        The most recently used entry is always kept.
+        """
+        entries = self._index['entries']
+        by_age = sorted(entries, key=lambda key: entries[key]['last_used'])
+        total = sum(entry['bytes'] for entry in entries.values())
+
+        while total > self.max_bytes and len(by_age) > 1:
+            key = by_age.pop(0)
+            total -= entries.pop(key)['bytes']
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+        self._write_index()
+
+    #-----------------------------------------------------------------------------------
+    def run(self, stage, sources, functions, compute, params=None):
+        """
+        Returns the cached result of a stage, or computes and stores it.
+
+        Parameters:
+        - stage: The stage name, e.g. 'flights_v3'.
+        - sources: The csv files the stage reads (directly or through earlier stages).
+        - functions: The functions whose modules' code defines the stage's version.
+        - compute: A function without arguments that produces the dataframe.
+        - params: Optional json-serializable parameters that change the result.
+
+        Returns:
+        - df: The stage's dataframe.
+        """
+        key = self.key(stage, sources, functions, params)
+        df = self.get(key)
+        if df is None:
+            df = compute()
+            self.put(key, df, stage)
+
+        return df
+
+
+#=======================================================================================
+# cached wrangling stages
+#=======================================================================================
+def dw_load_cleaned_intermediates(airport_codes_path, flights_path, tickets_path, cache=None):
+    """
+    Loads the cleaned intermediates of the notebook through the cache:
+    airport_codes_v2, flights_v3, tickets_v3 and the route grouped fares
+    (tickets_w_routes_grouped_v2). On a warm run no csv file is parsed.
+
+    Parameters:
+    - airport_codes_path, flights_path, tickets_path: The csv file paths.
+    - cache: A StageCache (default: StageCache() in '.dw_cache').
+
+    Returns:
+    - a dict of stage name -> dataframe.
+    """
+    cache = cache or StageCache()
+
+    airport_codes_v2 = cache.run(
+        'airport_codes_v2', [airport_codes_path],
+        [dw_load_airport_codes, dw_subset_airport_codes_for_merger],
+        lambda: dw_subset_airport_codes_for_merger(dw_load_airport_codes(airport_codes_path)))
+
+    flights_v3 = cache.run(
+        'flights_v3', [flights_path],
+        [dw_load_flights],
+        lambda: dw_load_flights(flights_path))
+
+    tickets_v3 = cache.run(
+        'tickets_v3', [tickets_path],
+        [dw_load_tickets, dw_replace_itin_fare_with_group_mean],
+        lambda: dw_replace_itin_fare_with_group_mean(dw_load_tickets(tickets_path)))
+
+    route_fares = cache.run(
+        'tickets_w_routes_grouped_v2', [tickets_path],
+        [dw_load_tickets, dw_replace_itin_fare_with_group_mean, fe_create_route,
+         dw_transform_calculate_mean_fare_by_route_to_merge_with_flights,
+         fe_create_mean_route_fare_per_passenger],
+        lambda: fe_create_mean_route_fare_per_passenger(
+            dw_transform_calculate_mean_fare_by_route_to_merge_with_flights(
+                fe_create_route(tickets_v3.copy()))))
+
+    return {
+        'airport_codes_v2': airport_codes_v2,
+        'flights_v3': flights_v3,
+        'tickets_v3': tickets_v3,
+        'tickets_w_routes_grouped_v2': route_fares,
+    }
@@ -0,0 +1,224 @@
+#=======================================================================================
+"""
+Command Line
+
+This file contains a command-line entry point that runs main.ipynb's pipeline in one
+invocation: from the three csv files through master_df_grouped_by_route_v12, and
+optionally the notebook's charts.
+
+    python cli_000.py --airport-codes Airport_Codes.csv --flights Flights.csv \\
+        --tickets Tickets.csv --output routes.csv --plots charts
+
+Only the standard library is imported at start-up. pandas and the pipeline modules
+are imported when the pipeline runs, and matplotlib and seaborn only when charts are
+requested, so a worker that only wrangles never loads the plotting stack.
+--import-time reports what importing a module costs in a fresh interpreter
+(python -X importtime) and fails past a budget, to keep worker cold starts low:
+
+    python cli_000.py --import-time pipeline_000 --max-import-ms 800
+
+"""
+#=======================================================================================
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# the modules a pipeline worker imports
+WORKER_MODULES = ['pipeline_000', 'data_wrangling_000', 'feature_engineering_000']
+
+
+#=======================================================================================
+# import time
+#=======================================================================================
+def measure_import_time(module, python=sys.executable):
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    Parameters:
+    - module: The module name.
+    - python: The interpreter to run.
+
+    Returns:
+    - timings: A list of (module, depth, self_ms, cumulative_ms) for every module imported,
+      in the order -X importtime reports them (a module after its own imports, the
+      measured module last at depth 0).
+    """
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise ImportError(f"Importing '{module}' failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    return timings
+
+
+def report_import_time(modules=WORKER_MODULES, top=5, max_import_ms=None):
+    """
+    Prints the import time of each module and its most expensive top-level imports.
+
+    Returns:
+    - ok: False if a module took longer than max_import_ms.
+    """
+    ok = True
+    for module in modules:
+        timings = measure_import_time(module)
+        total = timings[-1][3]
+        # the module's own imports are the depth 1 entries since the previous depth 0 entry
+        first = max([i + 1 for i, timing in enumerate(timings[:-1]) if timing[1] == 0], default=0)
+        direct = [(name, cumulative) for name, depth, _, cumulative in timings[first:-1] if depth == 1]
+        print(f"{module}: {total:.0f} ms")
+        for name, cumulative in sorted(direct, key=lambda item: -item[1])[:top]:
+            print(f"    {name:<30} {cumulative:8.1f} ms")
+        if max_import_ms is not None and total > max_import_ms:
+            print(f"    over the budget of {max_import_ms:.0f} ms")
+            ok = False
+
+    return ok
+
+
+#=======================================================================================
+# pipeline
+#=======================================================================================
+def run_pipeline(airport_codes_path, flights_path, tickets_path, workers=1):
+    """
+    Runs the notebook's pipeline from the csv files to master_df_grouped_by_route_v12.
+
+    Parameters:
+    - airport_codes_path, flights_path, tickets_path: The csv files.
+    - workers: The number of processes (1 = the serial path of main.ipynb).
+
+    Returns:
+    - df: The final route table.
+    """
+    import pandas as pd
+
+    from feature_engineering_000 import fe_calculate_route_economics, fe_create_multiple_mean_values_with_count
+    from pipeline_000 import dw_run_route_pipeline, dw_run_route_pipeline_sharded
+
+    start = time.perf_counter()
+    airport_codes_initial = pd.read_csv(airport_codes_path)
+    flights_initial = pd.read_csv(flights_path)
+    tickets_initial = pd.read_csv(tickets_path)
+    print(f"read the csv files in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    if workers == 1:
+        grouped_data = dw_run_route_pipeline(airport_codes_initial, flights_initial, tickets_initial)
+    else:
+        grouped_data = dw_run_route_pipeline_sharded(airport_codes_initial, flights_initial, tickets_initial,
+                                                     workers=workers or None)
+    # the one-pass equivalent of the fe_calculate_* chain
+    df = fe_calculate_route_economics(fe_create_multiple_mean_values_with_count(grouped_data))
+    print(f"ran the pipeline in {time.perf_counter() - start:.1f} s: {len(df)} routes")
+
+    return df
+
+
+#=======================================================================================
+# charts
+#=======================================================================================
+def save_route_plots(df, directory):
+    """
+    Saves the notebook's route charts as png files.
+
+    Parameters:
+    - df: The final route table.
+    - directory: Where to write the charts.
+
+    Returns:
+    - paths: The files written.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    os.makedirs(directory, exist_ok=True)
+    sns.set(style="whitegrid")
+    paths = []
+
+    def save(name):
+        path = os.path.join(directory, name)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close()
+        paths.append(path)
+
+    top_routes = df.set_index('fe_route')['fe_number_of_flights_per_route'].nlargest(10)
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x=top_routes.values, y=top_routes.index, color='skyblue')
+    plt.xlabel('Number of Flights')
+    plt.ylabel('Routes')
+    plt.title('Top Ten Round Trip Routes Domestic With Greatest Number Of Flights 2019 Q1')
+    save('top_routes_by_flights.png')
+
+    top_profit_routes = df.nlargest(10, 'fe_total_profit_for_route_2019q1')
+    plt.figure(figsize=(10, 6))
+    scatter = sns.scatterplot(data=top_profit_routes, x='fe_number_of_flights_per_route',
+                              y='fe_total_profit_for_route_2019q1', hue='fe_route', palette='tab10')
+    scatter.set(xlabel='Number of Flights for Route', ylabel='Total Profit for Route',
+                title='Top 10 Routes by Total Profit vs Number of Flights Per Route (2019 Q1)')
+    plt.legend(title='Route')
+    save('top_routes_by_profit.png')
+
+    slow_competitors = df.sort_values(by='fe_route_delay_cost', ascending=False).head(20)
+    plt.figure(figsize=(10, 8))
+    barplot = sns.barplot(data=slow_competitors, y='fe_route', x='fe_route_delay_cost', hue='fe_route',
+                          palette='tab20', legend=False)
+    barplot.set(xlabel='Route Delay Cost', ylabel='Route',
+                title='Top 20 Routes with Greatest Delay Cost (as a Proxy for Poor Punctuality)')
+    save('top_routes_by_delay_cost.png')
+
+    return paths
+
+
+#=======================================================================================
+# command line
+#=======================================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the route pipeline of main.ipynb from the csv files.')
+    parser.add_argument('--airport-codes', help='Airport_Codes.csv')
+    parser.add_argument('--flights', help='Flights.csv')
+    parser.add_argument('--tickets', help='Tickets.csv')
+    parser.add_argument('--output', default='master_df_grouped_by_route_v12.csv', help='csv of the final route table')
+    parser.add_argument('--store', help='also write a route metrics store (route_store_000) to this directory')
+    parser.add_argument('--plots', help='also save the charts to this directory')
+    parser.add_argument('--workers', type=int, default=1, help='processes for the sharded pipeline (0 = all cores)')
+    parser.add_argument('--import-time', nargs='*', metavar='MODULE',
+                        help=f'report the import time of modules (default: {" ".join(WORKER_MODULES)}) and exit')
+    parser.add_argument('--max-import-ms', type=float, help='with --import-time: fail past this many ms')
+    args = parser.parse_args(argv)
+
+    if args.import_time is not None:
+        return 0 if report_import_time(args.import_time or WORKER_MODULES, max_import_ms=args.max_import_ms) else 1
+
+    missing = [name for name in ('airport_codes', 'flights', 'tickets') if getattr(args, name) is None]
+    if missing:
+        parser.error('the pipeline needs ' + ', '.join('--' + name.replace('_', '-') for name in missing))
+
+    df = run_pipeline(args.airport_codes, args.flights, args.tickets, args.workers)
+    df.to_csv(args.output, index=False)
+    print(f"wrote {args.output}")
+
+    if args.store:
+        from route_store_000 import dw_save_route_metrics
+        print(f"wrote {dw_save_route_metrics(df, args.store)}")
+    if args.plots:
+        for path in save_route_plots(df, args.plots):
+            print(f"wrote {path}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
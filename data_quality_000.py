@@ -0,0 +1,233 @@
+#=======================================================================================
+"""
+Data Quality
+
+This file contains a profiler for the data quality checks main.ipynb does by hand,
+one full scan each:
+
+    airport_codes_v1[airport_codes_v1['iata_code'].isna()].shape
+    flights_v2[flights_v2['distance'].isna()].shape
+    tickets_v2['itin_fare'].value_counts().head(20)
+    tickets_v3['passengers'].unique()
+
+The checks are declared per column (ColumnCheck) and a QualityProfile computes all
+of them in one pass per dataset, or per chunk when streaming. Each checked column
+is reduced once to the counts of its distinct values, and every check (sentinel
+frequencies, dtype coercion failures, out-of-range values, top-k values) is then
+evaluated on the distinct values only. The counts add up, so profiles of chunks,
+files or workers merge exactly into one report.
+
+    profile = QualityProfile(TICKETS_CHECKS)
+    for chunk in pd.read_csv(path, chunksize=500_000):
+        profile.update(chunk)
+    profile.report()
+
+or through dw_read_csv_in_chunks(..., profile=profile).
+
+"""
+#=======================================================================================
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from data_wrangling_000 import DEFAULT_CHUNKSIZE
+
+REPORT_COLUMNS = ['column', 'rows', 'nulls', 'null_share', 'coercion_failures', 'sentinels',
+                  'below_min', 'above_max', 'distinct', 'rejected_tokens', 'sentinel_counts', 'top_values']
+
+
+@dataclass(frozen=True)
+class ColumnCheck:
+    """
+    The checks of one column (its null count is always checked).
+
+    Parameters:
+    - numeric: Count the values that do not parse as numbers (e.g. '****' in 'distance').
+    - sentinels: Numeric placeholder values to count (e.g. the 11.0 'itin_fare').
+    - min_value, max_value: Count the numeric values outside this range (None = open).
+    - top_k: Report the k most frequent values.
+    """
+    numeric: bool = False
+    sentinels: tuple = ()
+    min_value: float = None
+    max_value: float = None
+    top_k: int = 0
+
+    @property
+    def needs_counts(self):
+        return (self.numeric or bool(self.sentinels) or self.min_value is not None
+                or self.max_value is not None or self.top_k > 0)
+
+
+# the checks of main.ipynb (lowercase column names)
+AIRPORT_CODES_CHECKS = {
+    'iata_code': ColumnCheck(),
+    'type': ColumnCheck(top_k=10),
+    'iso_country': ColumnCheck(top_k=10),
+}
+
+FLIGHTS_CHECKS = {
+    'origin': ColumnCheck(),
+    'destination': ColumnCheck(),
+    'op_carrier': ColumnCheck(top_k=20),
+    'cancelled': ColumnCheck(min_value=0, max_value=1, top_k=5),
+    'distance': ColumnCheck(numeric=True, min_value=0),
+    'air_time': ColumnCheck(numeric=True, min_value=0),
+    'dep_delay': ColumnCheck(numeric=True),
+    'arr_delay': ColumnCheck(numeric=True),
+    'occupancy_rate': ColumnCheck(numeric=True, min_value=0, max_value=1),
+}
+
+TICKETS_CHECKS = {
+    'origin': ColumnCheck(),
+    'destination': ColumnCheck(),
+    'reporting_carrier': ColumnCheck(top_k=20),
+    'roundtrip': ColumnCheck(min_value=0, max_value=1, top_k=5),
+    # the planes have 200 seats
+    'passengers': ColumnCheck(numeric=True, min_value=1, max_value=200, top_k=20),
+    'itin_fare': ColumnCheck(numeric=True, sentinels=(11.0, 0.0), min_value=0, top_k=20),
+}
+
+
+#=======================================================================================
+# the profile
+#=======================================================================================
+class QualityProfile:
+    """
+    Row, null and distinct value counts of the checked columns, accumulated over chunks.
+
+    Parameters:
+    - checks: A dict of column name -> ColumnCheck, e.g. TICKETS_CHECKS. The names
+      are matched in lowercase.
+    """
+
+    def __init__(self, checks):
+        self.checks = {column.lower(): check for column, check in checks.items()}
+        self.rows = 0
+        self.nulls = dict.fromkeys(self.checks, 0)
+        self.seen_columns = set()
+        self.counts = {column: pd.Series(dtype=np.int64) for column, check in self.checks.items()
+                       if check.needs_counts}
+
+    #-----------------------------------------------------------------------------------
+    def update(self, df):
+        """
+        Folds a chunk into the profile.
+
+        Returns:
+        - self
+        """
+        lowercase = {column.lower(): column for column in df.columns}
+        self.rows += len(df)
+
+        for column in self.checks:
+            if column not in lowercase:
+                continue
+            self.seen_columns.add(column)
+            values = df[lowercase[column]]
+            self.nulls[column] += int(values.isna().sum())
+            if column in self.counts:
+                # the one scan of the column: everything else is read off its distinct values
+                self.counts[column] = self.counts[column].add(values.value_counts(), fill_value=0)
+
+        return self
+
+    def merge(self, other):
+        """
+        Combines another QualityProfile (of the same checks) into this one.
+
+        Returns:
+        - self
+        """
+        self.rows += other.rows
+        for column in self.checks:
+            self.nulls[column] += other.nulls[column]
+        for column in self.counts:
+            self.counts[column] = self.counts[column].add(other.counts[column], fill_value=0)
+        self.seen_columns |= other.seen_columns
+
+        return self
+
+    #-----------------------------------------------------------------------------------
+    def _column_report(self, column, check):
+        nulls = self.nulls[column]
+        result = {'column': column, 'rows': self.rows, 'nulls': nulls,
+                  'null_share': nulls / self.rows if self.rows else np.nan}
+        if column not in self.counts:
+            return result
+
+        counts = self.counts[column].astype(np.int64)
+        tokens = counts.index.to_numpy(dtype=object)
+        parsed = pd.to_numeric(pd.Series(tokens, dtype=object), errors='coerce').to_numpy(dtype=float,
+                                                                                          na_value=np.nan)
+        weights = counts.to_numpy()
+        result['distinct'] = len(counts)
+
+        if check.numeric:
+            bad = np.isnan(parsed)
+            rejected = pd.Series(weights[bad], index=[str(token) for token in tokens[bad]])
+            result['coercion_failures'] = int(rejected.sum())
+            result['rejected_tokens'] = rejected.sort_values(ascending=False, kind='stable').head(10).to_dict()
+        if check.sentinels:
+            sentinel_counts = {sentinel: int(weights[parsed == sentinel].sum()) for sentinel in check.sentinels}
+            result['sentinels'] = sum(sentinel_counts.values())
+            result['sentinel_counts'] = sentinel_counts
+        if check.min_value is not None:
+            result['below_min'] = int(weights[parsed < check.min_value].sum())
+        if check.max_value is not None:
+            result['above_max'] = int(weights[parsed > check.max_value].sum())
+        if check.top_k:
+            top = counts.sort_values(ascending=False, kind='stable').head(check.top_k)
+            result['top_values'] = dict(zip(top.index.tolist(), top.tolist()))
+
+        return result
+
+    def report(self):
+        """
+        Returns one row per checked column: the rows, nulls and null share, and, where
+        declared, the coercion failures (with the most frequent rejected tokens), the
+        sentinel counts, the values below the minimum / above the maximum and the
+        top values. Columns absent from every chunk are left out.
+        """
+        rows = [self._column_report(column, check) for column, check in self.checks.items()
+                if column in self.seen_columns]
+
+        return pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+    def top_values(self, column, k=20):
+        """
+        Returns the k most frequent values of a counted column with their counts (as value_counts().head(k)).
+        """
+        return self.counts[column.lower()].astype(np.int64).sort_values(ascending=False, kind='stable').head(k)
+
+
+#=======================================================================================
+# files
+#=======================================================================================
+def dw_profile_csv(path, schema, checks, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Profiles a csv file in one chunked pass, reading only the checked columns.
+
+    Parameters:
+    - path: The csv file path.
+    - schema: A dict of lowercase column name -> dtype, e.g. TICKETS_SCHEMA (the dirty
+      numeric columns are read as strings, so their coercion failures can be counted).
+    - checks: A dict of column name -> ColumnCheck, e.g. TICKETS_CHECKS.
+    - chunksize: The number of csv rows read at a time.
+
+    Returns:
+    - profile: The QualityProfile of the file.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    file_columns = {column.lower(): column for column in header}
+    wanted = [column for column in checks if column.lower() in file_columns]
+
+    profile = QualityProfile(checks)
+    reader = pd.read_csv(path, usecols=[file_columns[column.lower()] for column in wanted],
+                         dtype={file_columns[column.lower()]: schema.get(column.lower(), 'object') for column in wanted},
+                         chunksize=chunksize)
+    for chunk in reader:
+        profile.update(chunk)
+
+    return profile
@@ -12,8 +12,8 @@ import os
 import glob
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
+
+from feature_engineering_000 import IATA_CODE_SPACE, fe_encode_airport_codes
 
 #=======================================================================================
 # Initial data wrangling
@@ -111,6 +111,55 @@ def process_dataframe(df):
     return df
 
 
+#---------------------------------------------------------------------------------------
+def dw_parse_dirty_numeric(values, dtype='float'):
+    """
+    Converts a dirty numeric column (numbers mixed with junk strings like '****')
+    in one pass, with the same results as pd.to_numeric(errors='coerce').
+
+    The column is factorized once and only its distinct tokens are parsed, which is
+    much cheaper than parsing every row (a column like 'distance' has a few thousand
+    distinct values over millions of rows). The token counts come for free, so the
+    rejected values are reported instead of silently becoming NaN.
+
+    Parameters:
+    - values: The column (a series or array), as read from the csv.
+    - dtype: 'float' for float64, or 'int' for the smallest integer dtype when no
+      value is missing (as pd.to_numeric(downcast='integer')), float64 otherwise.
+
+    Returns:
+    - parsed: A series with the converted values (same index as values, if a series).
+    - rejected: A series of counts per distinct rejected token, most frequent first.
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    name = values.name if isinstance(values, pd.Series) else None
+
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        parsed = pd.Series(np.asarray(values, dtype=float), index=index, name=name)
+        rejected = pd.Series(dtype=np.int64, name=name, index=pd.Index([], dtype=object))
+    else:
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=True)
+        parsed_uniques = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(
+            dtype=float, na_value=np.nan)
+        # code -1 (missing) picks the NaN appended at the end
+        parsed = pd.Series(np.append(parsed_uniques, np.nan)[codes], index=index, name=name)
+
+        bad = np.isnan(parsed_uniques)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        rejected = pd.Series(counts[bad], index=pd.Index([str(token) for token in uniques[bad]], dtype=object),
+                             name=name).sort_values(ascending=False, kind='stable')
+
+    if dtype == 'int':
+        parsed = pd.to_numeric(parsed, downcast='integer')
+
+    return parsed, rejected
+
+
+def _dw_print_rejected(column_name, rejected):
+    if len(rejected):
+        print(f"Rejected {rejected.sum()} non-numeric value(s) in '{column_name}': {rejected.head(10).to_dict()}")
+
+
 #=======================================================================================
 # airport_codes data wrangling
 #=======================================================================================
@@ -189,8 +238,9 @@ def dw_convert_distance_column_to_int(df):
     
     if column_name in df.columns:
         try:
-            df[column_name] = pd.to_numeric(df[column_name], errors='coerce', downcast='integer')
+            df[column_name], rejected = dw_parse_dirty_numeric(df[column_name], dtype='int')
             print(f"Successfully converted '{column_name}' column to dtype int.")
+            _dw_print_rejected(column_name, rejected)
         except ValueError:
             print(f"An error occurred while converting '{column_name}' column. Converting non-integer values to NaN.")
             df[column_name] = np.nan
@@ -216,8 +266,9 @@ def dw_convert_air_time_column_to_float(df):
     
     if column_name in df.columns:
         try:
-            df[column_name] = pd.to_numeric(df[column_name], errors='coerce')
+            df[column_name], rejected = dw_parse_dirty_numeric(df[column_name])
             print(f"Successfully converted '{column_name}' column to dtype float.")
+            _dw_print_rejected(column_name, rejected)
         except ValueError:
             print(f"An error occurred while converting '{column_name}' column. Converting non-float values to NaN.")
             df[column_name] = np.nan
@@ -260,7 +311,7 @@ def dw_convert_itin_fare_column_to_float(df):
     df: df with 'itin_fare' column now as a float datatype.
     """
     if 'itin_fare' in df.columns:
-        df['itin_fare'] = pd.to_numeric(df['itin_fare'], errors='coerce').astype(float)
+        df['itin_fare'], _ = dw_parse_dirty_numeric(df['itin_fare'])
     return df
 
 #---------------------------------------------------------------------------------------
@@ -279,20 +330,116 @@ def dw_replace_itin_fare_with_group_mean(df):
     Returns:
         df: A new dataframe with problem 'itin_fare' values replaced by group means.
     """
-    grouped_means = df[df['itin_fare'] != 11.0].groupby('reporting_carrier')['itin_fare'].mean()
-    df_copy = df.copy()
-
-    for index, row in df_copy.iterrows():
-        if row['itin_fare'] == 11.0:
-            carrier = row['reporting_carrier']
-            if carrier in grouped_means:
-                df_copy.at[index, 'itin_fare'] = grouped_means[carrier]
+    df_copy, replaced_counts = dw_impute_sentinel_values(df,
+                                                         column='itin_fare',
+                                                         sentinels=[11.0],
+                                                         group_keys='reporting_carrier',
+                                                         statistic='mean')
 
     return df_copy
 
 
 #---------------------------------------------------------------------------------------
-def dw_transform_calculate_mean_fare_by_route_to_merge_with_flights(df):
+def _dw_group_statistic(values, keys, column, statistic, trim):
+    """
+    Computes one statistic of 'column' per group of 'keys' in a single groupby.
+    The trimmed mean sorts once and drops the lowest and highest 'trim' share
+    of each group by position, so there is no per-group Python either.
+    """
+    if statistic == 'mean':
+        return values.groupby(keys)[column].mean()
+    if statistic == 'median':
+        return values.groupby(keys)[column].median()
+    if statistic == 'trimmed_mean':
+        values = values.sort_values(keys + [column])
+        grouped = values.groupby(keys, sort=False)[column]
+        position = grouped.cumcount()
+        group_size = grouped.transform('size')
+        cut = np.floor(group_size * trim)
+        kept = values[(position >= cut) & (position < group_size - cut)]
+        return kept.groupby(keys)[column].mean()
+
+    raise ValueError(f"Unknown statistic '{statistic}'. Use 'mean', 'median' or 'trimmed_mean'.")
+
+
+def dw_impute_sentinel_values(df, column='itin_fare', sentinels=(11.0,),
+                              group_keys='reporting_carrier', fallback_keys=None,
+                              statistic='mean', trim=0.1):
+    """
+    Replaces sentinel values in a column with a group statistic computed
+    over the non-sentinel values of the same column. Everything is done with
+    groupby and index lookups, so no Python code runs per row.
+
+    The groups are tried in order: first 'group_keys', then each entry of
+    'fallback_keys'. A sentinel that cannot be filled at one level (its group
+    has no usable values) is passed on to the next. Sentinels that no level
+    can fill are left as they are.
+
+    Parameters:
+    - df: The input dataframe (intended: the tickets dataframe).
+    - column: The column holding the sentinel values.
+    - sentinels: The values to be treated as missing, e.g. [11.0].
+    - group_keys: A column name or list of column names to group by,
+      e.g. 'reporting_carrier', 'fe_route' or ['reporting_carrier', 'fe_route'].
+    - fallback_keys: An optional list of further groupings, tried in order.
+    - statistic: 'mean', 'median' or 'trimmed_mean'.
+    - trim: The share cut from each end of a group for 'trimmed_mean'.
+
+    Returns:
+    - df: A new dataframe with the sentinel values replaced.
+    - replaced_counts: A dataframe with one row per group that received values:
+      the grouping 'level', the group key columns, the 'fill_value' used and
+      the 'replaced_count'. This allows auditing without rescanning the frame.
+    """
+    levels = [group_keys] + list(fallback_keys or [])
+    levels = [[keys] if isinstance(keys, str) else list(keys) for keys in levels]
+
+    values = df[column]
+    is_sentinel = values.isin(list(sentinels)).to_numpy()
+    all_keys = list(dict.fromkeys(key for keys in levels for key in keys))
+    usable = df.loc[~is_sentinel & values.notna().to_numpy(), all_keys + [column]]
+
+    filled = values.to_numpy(dtype=float, na_value=np.nan, copy=True)
+    pending = np.flatnonzero(is_sentinel)
+    audit_frames = []
+
+    for keys in levels:
+        if len(pending) == 0:
+            break
+
+        group_stat = _dw_group_statistic(usable, keys, column, statistic, trim).dropna()
+
+        pending_keys = df[keys].iloc[pending]
+        if len(keys) == 1:
+            lookup = pd.Index(pending_keys[keys[0]])
+        else:
+            lookup = pd.MultiIndex.from_frame(pending_keys)
+        position = group_stat.index.get_indexer(lookup)
+
+        hit = position >= 0
+        filled[pending[hit]] = group_stat.to_numpy(dtype=float)[position[hit]]
+
+        # one audit row per group that had sentinels replaced at this level
+        group_position, replaced = np.unique(position[hit], return_counts=True)
+        audit = group_stat.iloc[group_position].rename('fill_value').reset_index()
+        audit.insert(0, 'level', '+'.join(keys))
+        audit['replaced_count'] = replaced
+        audit_frames.append(audit)
+
+        pending = pending[~hit]
+
+    df_imputed = df.assign(**{column: filled})
+
+    if audit_frames:
+        replaced_counts = pd.concat(audit_frames, ignore_index=True)
+    else:
+        replaced_counts = pd.DataFrame(columns=['level'] + all_keys + ['fill_value', 'replaced_count'])
+
+    return df_imputed, replaced_counts
+
+
+#---------------------------------------------------------------------------------------
+def dw_transform_calculate_mean_fare_by_route_to_merge_with_flights(df, route_column='fe_route'):
     """
     Calculate the mean 'itin_fare' 
     for each 'fe_route' in the input dataframe.
@@ -302,11 +449,13 @@ def dw_transform_calculate_mean_fare_by_route_to_merge_with_flights(df):
 
     Parameters:
     dataframe: Input dataframe with 'fe_route' and 'itin_fare' columns.
+    route_column: The route key to group by; 'fe_route_id' groups on the
+    integer route ids from fe_create_route_id(df) instead of the strings.
     
     Returns:
     pandas.Series: A series containing the mean fare for each route. This 
     """
-    grouped = df.groupby('fe_route')['itin_fare'].mean().reset_index()
+    grouped = df.groupby(route_column, observed=True)['itin_fare'].mean().reset_index()
     
     return grouped
 
@@ -339,18 +488,78 @@ def dw_merge_dataframes_with_origin_destination_sizes(df1, df2, df3):
     2. Merge df3 with the result of step 1 on 'iata_code' in df3 and 'destination' 
         in the result. Columns in df3 receive the '_destination' suffix.
     The final merged result is returned.
+
+    When every 'iata_code' is a unique three letter code (the usual case for
+    airport_codes_v2), the same result is produced without a join: each airport
+    table gets a dense index over all possible codes, every column is filled with
+    one gather, and flights with an unknown airport are dropped by a mask.
     """
+    origin_index = dw_build_airport_index(df2)
+    destination_index = dw_build_airport_index(df3)
+
+    if origin_index is None or destination_index is None:
+        # Step 1: Merge df2 with df1
+        merged_step1 = pd.merge(df1, df2, left_on='origin', right_on='iata_code', how='inner', suffixes=('', '_origin'))
 
-    # Step 1: Merge df2 with df1
-    merged_step1 = pd.merge(df1, df2, left_on='origin', right_on='iata_code', how='inner', suffixes=('', '_origin'))
+        # Step 2: Merge df3 with the result of step 1
+        merged_result = pd.merge(merged_step1, df3, left_on='destination', right_on='iata_code', how='inner', suffixes=('_origin', '_destination'))
 
-    # Step 2: Merge df3 with the result of step 1
-    merged_result = pd.merge(merged_step1, df3, left_on='destination', right_on='iata_code', how='inner', suffixes=('_origin', '_destination'))
+        return merged_result
+
+    origin_rows = dw_lookup_airport_rows(origin_index, df1['origin'])
+    destination_rows = dw_lookup_airport_rows(destination_index, df1['destination'])
+    known = (origin_rows >= 0) & (destination_rows >= 0)
+
+    merged_result = df1[known].reset_index(drop=True)
+    for airports, rows, suffix in [(df2, origin_rows[known], '_origin'),
+                                   (df3, destination_rows[known], '_destination')]:
+        for column in airports.columns:
+            merged_result[column + suffix] = airports[column].iloc[rows].reset_index(drop=True)
 
     return merged_result
 
 #---------------------------------------------------------------------------------------
-def dw_merge_dataframes_with_fe_route(df1, df2):
+def dw_build_airport_index(df):
+    """
+    Builds a dense airport index: an array with one slot per possible
+    three letter IATA code (26**3), holding the row position of that airport
+    in the airport codes dataframe, or -1 when the code is not in it.
+
+    Parameters:
+    - df: An airport codes dataframe with an 'iata_code' column (e.g. airport_codes_v2).
+
+    Returns:
+    - index: The numpy int32 array, or None when some 'iata_code' is repeated or
+      is not a three letter code, since a single slot could not represent it.
+    """
+    codes = df['iata_code'].dropna()
+    airport_ids = fe_encode_airport_codes(codes)
+    if (airport_ids < 0).any() or codes.duplicated().any():
+        return None
+
+    index = np.full(IATA_CODE_SPACE, -1, dtype=np.int32)
+    index[airport_ids] = np.flatnonzero(df['iata_code'].notna().to_numpy())
+
+    return index
+
+#---------------------------------------------------------------------------------------
+def dw_lookup_airport_rows(index, codes):
+    """
+    Looks up the airport codes dataframe row of each code with one gather.
+
+    Parameters:
+    - index: An index from dw_build_airport_index.
+    - codes: A series of airport codes, e.g. the 'origin' column of flights.
+
+    Returns:
+    - rows: A numpy int32 array of row positions, -1 for unknown airports.
+    """
+    airport_ids = fe_encode_airport_codes(codes)
+
+    return np.where(airport_ids >= 0, index[airport_ids], -1)
+
+#---------------------------------------------------------------------------------------
+def dw_merge_dataframes_with_fe_route(df1, df2, route_column='fe_route'):
     """
     Merges two dataframes based on the 'fe_route' column. 
     I use an inner join for expediency.
@@ -358,11 +567,12 @@ def dw_merge_dataframes_with_fe_route(df1, df2):
     parameters:
     - df1: The first dataframe (with flights and route data).
     - df2: The second dataframe (with aggregated tickets and route data).
+    - route_column: The route key to merge on ('fe_route' or 'fe_route_id').
 
     Returns:
     - merged_df: The merged dataframe.
     """
-    merged_df = df1.merge(df2, on='fe_route', how='inner')
+    merged_df = df1.merge(df2, on=route_column, how='inner')
     
     return merged_df
 
@@ -371,7 +581,7 @@ def dw_merge_dataframes_with_fe_route(df1, df2):
 #=======================================================================================
 
 
-def dw_transform_calculate_varied_grouped_means_with_count(df):
+def dw_transform_calculate_varied_grouped_means_with_count(df, route_column='fe_route'):
     """
     This function performs grouping and aggregation transformations on the entire merged
     dataframe. It groups the dataframe by the 'fe_route' column and calculates mean values
@@ -385,12 +595,13 @@ def dw_transform_calculate_varied_grouped_means_with_count(df):
     Parameters:
     - df: The dataframe that merges data from the original 
       airport codes, flights, and tickets datasets.
+    - route_column: The route key to group by ('fe_route' or 'fe_route_id').
 
     Returns:
     - grouped_data: A dataframe containing the mean values for various specified columns,
       the count of distinct 'op_carrier' values, and the count of rows per 'fe_route'.
     """
-    grouped_data = df.groupby('fe_route').agg({
+    grouped_data = df.groupby(route_column, observed=True).agg({
         'air_time': 'mean',
         'distance': 'mean',
         'occupancy_rate': 'mean',
@@ -402,11 +613,343 @@ def dw_transform_calculate_varied_grouped_means_with_count(df):
     }).reset_index()
     
     # Count of rows per 'fe_route'
-    grouped_data['fe_number_of_flights_per_route'] = df.groupby('fe_route').size().values
+    grouped_data['fe_number_of_flights_per_route'] = df.groupby(route_column, observed=True).size().values
     
     return grouped_data
 
 
+#=======================================================================================
+# chunked loading
+#=======================================================================================
+# Explicit read schemas (lowercase column names). The dirty numeric columns
+# ('distance', 'air_time', 'itin_fare') are read as strings and coerced per chunk,
+# which avoids the mixed-type DtypeWarning and the full-file object columns.
+
+AIRPORT_CODES_SCHEMA = {
+    'type': 'object',
+    'name': 'object',
+    'elevation_ft': 'float64',
+    'continent': 'object',
+    'iso_country': 'object',
+    'municipality': 'object',
+    'iata_code': 'object',
+    'coordinates': 'object',
+}
+
+FLIGHTS_SCHEMA = {
+    'fl_date': 'object',
+    'op_carrier': 'object',
+    'tail_num': 'object',
+    'op_carrier_fl_num': 'object',
+    'origin_airport_id': 'Int64',
+    'origin': 'object',
+    'origin_city_name': 'object',
+    'dest_airport_id': 'Int64',
+    'destination': 'object',
+    'dest_city_name': 'object',
+    'dep_delay': 'float64',
+    'arr_delay': 'float64',
+    'cancelled': 'float64',
+    'air_time': 'object',
+    'distance': 'object',
+    'occupancy_rate': 'float64',
+}
+
+TICKETS_SCHEMA = {
+    'itin_id': 'Int64',
+    'year': 'Int64',
+    'quarter': 'Int64',
+    'origin': 'object',
+    'origin_country': 'object',
+    'origin_state_abr': 'object',
+    'destination': 'object',
+    'roundtrip': 'float64',
+    'reporting_carrier': 'object',
+    'passengers': 'float64',
+    'itin_fare': 'object',
+}
+
+FLIGHTS_NUMERIC_COLUMNS = ['distance', 'air_time']
+TICKETS_NUMERIC_COLUMNS = ['itin_fare']
+
+DEFAULT_CHUNKSIZE = 500_000
+
+
+#---------------------------------------------------------------------------------------
+def dw_read_csv_in_chunks(path, schema, filters=(), numeric_columns=(),
+                          chunksize=DEFAULT_CHUNKSIZE, columns=None, rejected=None, deduplicator=None,
+                          profile=None):
+    """
+    Reads a csv file in bounded-size chunks and yields the cleaned rows of each chunk.
+    Every chunk gets lowercase column names, has duplicate rows dropped, has its
+    dirty numeric columns parsed to float (junk becomes NaN, see
+    dw_parse_dirty_numeric) and is then passed
+    through the filter functions, so only surviving rows are ever kept.
+
+    Parameters:
+    - path: The csv file path.
+    - schema: A dict of lowercase column name -> dtype, e.g. FLIGHTS_SCHEMA.
+    - filters: Functions that take a dataframe and return its subset,
+      e.g. [dw_subset_flights_not_cancelled_only].
+    - numeric_columns: Columns to parse with dw_parse_dirty_numeric.
+    - chunksize: The number of csv rows read at a time.
+    - columns: Optional subset of the schema columns to read (default: all).
+    - rejected: Optional dict that collects, per numeric column, the counts of the
+      rejected tokens (see dw_parse_dirty_numeric) over all chunks read so far.
+    - deduplicator: Optional RowDeduplicator (dedup_000). Duplicates are then dropped
+      across all chunks (and across files sharing it) instead of within each chunk,
+      and counted per file.
+    - profile: Optional QualityProfile (data_quality_000) that every raw chunk is
+      folded into, before any row is dropped or parsed.
+
+    Returns:
+    - a generator of dataframes, one per chunk.
+    """
+    # match the schema to the file's own (usually uppercase) header
+    header = pd.read_csv(path, nrows=0).columns
+    file_columns = {column.lower(): column for column in header}
+    wanted = [column for column in (columns or schema) if column in file_columns]
+
+    reader = pd.read_csv(path,
+                         usecols=[file_columns[column] for column in wanted],
+                         dtype={file_columns[column]: schema[column] for column in wanted},
+                         chunksize=chunksize)
+
+    for chunk in reader:
+        if profile is not None:
+            profile.update(chunk)
+
+        if deduplicator is None:
+            chunk = process_dataframe(chunk)
+        else:
+            chunk.columns = chunk.columns.str.lower()
+            chunk = deduplicator.filter(chunk, source=path)
+
+        for column in numeric_columns:
+            if column in chunk.columns:
+                chunk[column], chunk_rejected = dw_parse_dirty_numeric(chunk[column])
+                if rejected is not None:
+                    rejected[column] = pd.concat([rejected.get(column), chunk_rejected]).groupby(level=0).sum() \
+                                           .sort_values(ascending=False, kind='stable')
+
+        for subset in filters:
+            chunk = subset(chunk)
+
+        yield chunk
+
+
+#---------------------------------------------------------------------------------------
+def dw_load_csv_filtered(path, schema, filters=(), numeric_columns=(),
+                         chunksize=DEFAULT_CHUNKSIZE, columns=None, rejected=None, deduplicator=None,
+                         profile=None):
+    """
+    Concatenates the surviving rows of dw_read_csv_in_chunks(...) into one dataframe.
+    Without a deduplicator, duplicates that span two chunks are dropped once more
+    at the end, on the (already filtered) result. Peak memory is one raw chunk plus
+    the survivors.
+
+    Parameters:
+    - see dw_read_csv_in_chunks.
+
+    Returns:
+    - df: The filtered dataframe.
+    """
+    chunks = list(dw_read_csv_in_chunks(path, schema, filters, numeric_columns, chunksize, columns, rejected,
+                                        deduplicator, profile))
+    if not chunks:
+        return pd.DataFrame({column: pd.Series(dtype=schema[column]) for column in (columns or schema)})
+
+    df = pd.concat(chunks, ignore_index=True)
+    if deduplicator is None:
+        df = df.drop_duplicates()
+
+    return df
+
+
+#---------------------------------------------------------------------------------------
+def dw_subset_for_known_airports(df, airport_codes):
+    """
+    Retains only rows whose 'origin' and 'destination' both appear in the
+    'iata_code' column of the airport codes dataframe. This is the row filter
+    equivalent of the inner merges with the (medium/large, US only) airport codes.
+
+    Parameters:
+    - df: A flights or tickets dataframe.
+    - airport_codes: The subsetted airport codes dataframe (e.g. airport_codes_v2).
+
+    Returns:
+    - df: The subsetted dataframe.
+    """
+    known = airport_codes['iata_code'].dropna().unique()
+
+    return df[df['origin'].isin(known) & df['destination'].isin(known)]
+
+
+#---------------------------------------------------------------------------------------
+def dw_load_airport_codes(path, chunksize=DEFAULT_CHUNKSIZE, optimize_dtypes=False):
+    """
+    Loads Airport_Codes.csv keeping only medium and large US airports
+    (the notebook's airport_codes_v1). With optimize_dtypes=True the compact
+    dtype plan (dw_optimize_dtypes) is applied right after loading.
+    """
+    df = dw_load_csv_filtered(path, AIRPORT_CODES_SCHEMA,
+                              filters=[dw_subset_airport_codes_for_m_l_airports_US_only],
+                              chunksize=chunksize)
+
+    return dw_optimize_dtypes(df) if optimize_dtypes else df
+
+
+def dw_load_flights(path, airport_codes=None, chunksize=DEFAULT_CHUNKSIZE, optimize_dtypes=False):
+    """
+    Loads Flights.csv keeping only non-cancelled flights, with 'distance'
+    and 'air_time' already converted (the notebook's flights_v3).
+    If airport_codes is given, flights from or to other airports are dropped as well.
+    With optimize_dtypes=True the compact dtype plan is applied right after loading.
+    """
+    filters = [dw_subset_flights_not_cancelled_only]
+    if airport_codes is not None:
+        filters.append(lambda chunk: dw_subset_for_known_airports(chunk, airport_codes))
+
+    df = dw_load_csv_filtered(path, FLIGHTS_SCHEMA, filters, FLIGHTS_NUMERIC_COLUMNS, chunksize)
+
+    return dw_optimize_dtypes(df) if optimize_dtypes else df
+
+
+def dw_load_tickets(path, chunksize=DEFAULT_CHUNKSIZE, optimize_dtypes=False):
+    """
+    Loads Tickets.csv keeping only round trip tickets, with 'itin_fare'
+    already converted (the notebook's tickets_v2).
+    Tickets are not filtered by airport here: the carrier fare means used by
+    dw_replace_itin_fare_with_group_mean are taken over all round trip tickets.
+    With optimize_dtypes=True the compact dtype plan is applied right after loading.
+    """
+    df = dw_load_csv_filtered(path, TICKETS_SCHEMA,
+                              filters=[dw_subset_tickets_roundtrip_only],
+                              numeric_columns=TICKETS_NUMERIC_COLUMNS,
+                              chunksize=chunksize)
+
+    return dw_optimize_dtypes(df) if optimize_dtypes else df
+
+
+#=======================================================================================
+# compact dtypes and memory
+#=======================================================================================
+# Columns that hold codes, carriers, airport types and other repeated labels
+CATEGORICAL_COLUMNS = [
+    'origin', 'destination', 'op_carrier', 'reporting_carrier', 'type',
+    'type_origin', 'type_destination', 'iata_code', 'iata_code_origin',
+    'iata_code_destination', 'fe_route', 'iso_country', 'continent',
+    'origin_country', 'origin_state_abr', 'origin_city_name', 'dest_city_name',
+    'fl_date',
+]
+
+# Other text columns become categorical when at most this share of values is distinct
+CATEGORICAL_MAX_DISTINCT_SHARE = 0.5
+
+
+#---------------------------------------------------------------------------------------
+def dw_memory_usage_mb(df):
+    """
+    Returns the resident size of a dataframe in MB, including the python strings.
+    """
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def _dw_compact_column(series, categorical):
+    """
+    Returns the most compact dtype version of a column that keeps every value:
+    - categorical for code/carrier columns and repetitive text,
+    - the smallest integer type for whole numbers without NaN (nullable integer
+      columns stay nullable),
+    - float32 only where every value survives the round trip exactly.
+    Float columns with NaN stay float, so masks and NaN checks behave as before.
+    """
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series
+
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        if categorical or series.nunique(dropna=True) <= CATEGORICAL_MAX_DISTINCT_SHARE * len(series):
+            return series.astype('category')
+        return series
+
+    if pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype):
+        return series
+
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    present = values[~np.isnan(values)]
+    has_nan = len(present) < len(values)
+    # a float column with NaN would become a nullable one, whose pd.NA breaks masks
+    may_be_integer = not has_nan or pd.api.types.is_integer_dtype(dtype)
+    if may_be_integer and len(present) and np.array_equal(present, np.round(present)):
+        sizes = [size for size in (8, 16, 32, 64)
+                 if np.iinfo(f'int{size}').min <= present.min() and present.max() < np.iinfo(f'int{size}').max + 1.0]
+        if sizes:
+            return series.astype(f'Int{sizes[0]}' if has_nan else f'int{sizes[0]}')
+        # beyond int64 (e.g. large uint64 values): keep the column as it is
+        return series
+
+    if dtype == np.float64 and np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+        return series.astype(np.float32)
+
+    return series
+
+
+def dw_optimize_dtypes(df, categorical_columns=CATEGORICAL_COLUMNS, verbose=True):
+    """
+    Applies the compact dtype plan to a dataframe, right after loading:
+    categoricals for codes and carriers (and other repetitive text), downcast
+    integers for whole-number columns without NaN and float32 where it is lossless.
+    Columns with NaN (e.g. 'distance', the delays) keep NaN as their missing value.
+    No value changes, only its storage.
+
+    Parameters:
+    - df: The input dataframe.
+    - categorical_columns: The columns that always become categorical.
+    - verbose: Print the memory before and after.
+
+    Returns:
+    - df: A new dataframe with compact dtypes.
+    """
+    before = dw_memory_usage_mb(df)
+    df = df.assign(**{str(column): _dw_compact_column(df[column], column in categorical_columns)
+                      for column in df.columns})
+    after = dw_memory_usage_mb(df)
+
+    if verbose:
+        print(f"Optimized dtypes: {before:.1f} MB -> {after:.1f} MB "
+              f"({100 * (1 - after / before) if before else 0:.0f}% smaller).")
+
+    return df
+
+
+#---------------------------------------------------------------------------------------
+def dw_memory_report(frames, budgets_mb=None):
+    """
+    Reports the resident size of each stage's dataframe, and whether it
+    stays within its memory budget.
+
+    Parameters:
+    - frames: A dict of stage name -> dataframe, e.g. {'flights_v3': flights_v3}.
+    - budgets_mb: An optional dict of stage name -> budget in MB.
+
+    Returns:
+    - report: A dataframe with 'stage', 'rows', 'columns', 'memory_mb',
+      'budget_mb' and 'over_budget'.
+    """
+    budgets_mb = budgets_mb or {}
+    report = pd.DataFrame([{'stage': name,
+                            'rows': df.shape[0],
+                            'columns': df.shape[1],
+                            'memory_mb': dw_memory_usage_mb(df),
+                            'budget_mb': budgets_mb.get(name, np.nan)}
+                           for name, df in frames.items()])
+    report['over_budget'] = report['memory_mb'] > report['budget_mb']
+
+    return report
+
+
 #---------------------------------------------------------------------------------------
 #---------------------------------------------------------------------------------------
 #---------------------------------------------------------------------------------------
@@ -0,0 +1,171 @@
+#=======================================================================================
+"""
+Deduplication
+
+This file contains a hash-based replacement for the drop_duplicates() step of
+process_dataframe that works across chunks, shards and files. Every row is
+fingerprinted with a vectorized 64-bit hash (pd.util.hash_pandas_object) over a
+key set of columns (default: all). Only the hashes of the rows kept so far are
+remembered, as sorted uint64 arrays: 8 bytes per distinct row, whatever the width
+of the rows. Past a limit the hashes are spilled to disk as sorted runs that are
+memory-mapped for lookups.
+
+Use it on its own:
+
+    dedup = RowDeduplicator()
+    for path in paths:
+        for chunk in pd.read_csv(path, chunksize=500_000):
+            chunk = dedup.filter(chunk, source=path)
+    print(dedup.report())
+
+or through dw_read_csv_in_chunks(..., deduplicator=dedup). close() (or a with
+block) releases the hashes and removes the spilled runs:
+
+    with RowDeduplicator() as dedup:
+        df = dw_load_csv_filtered(path, FLIGHTS_SCHEMA, deduplicator=dedup)
+
+Two different rows with the same 64-bit hash would be taken for duplicates. For
+100M distinct rows the chance of that happening at all is about 3 in 10,000.
+
+"""
+#=======================================================================================
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# in-memory runs are merged into one past this count, so a lookup stays a few binary searches
+_MAX_MEMORY_RUNS = 8
+
+
+#=======================================================================================
+# the deduplicator
+#=======================================================================================
+class RowDeduplicator:
+    """
+    Drops rows already seen, in this or any earlier chunk, and counts them per source.
+
+    Parameters:
+    - columns: The key columns that define a duplicate (default: all columns).
+      The column names are matched in lowercase. Chunks must have the same dtypes
+      for these columns (e.g. read with one of the dw_ schemas), since a value
+      hashes differently as a float and as a string.
+    - max_memory_hashes: How many hashes are kept in memory before they are
+      spilled to disk (8 bytes each, so 50M = 400 MB).
+    - spill_directory: Where the spilled runs go (default: the system temporary
+      directory). Each deduplicator writes its runs into a subdirectory of its own,
+      removed by close(); the given directory itself is left in place.
+    """
+
+    def __init__(self, columns=None, max_memory_hashes=50_000_000, spill_directory=None):
+        self.columns = [column.lower() for column in columns] if columns is not None else None
+        self.max_memory_hashes = max_memory_hashes
+        self.spill_directory = spill_directory
+        # the subdirectory of spill_directory holding this deduplicator's runs
+        self._run_directory = None
+        self.sources = {}
+        # sorted runs of hashes in memory (merged when there are too many) and on disk
+        self._memory = []
+        self._runs = []
+
+    #-----------------------------------------------------------------------------------
+    def fingerprint(self, df):
+        """
+        Returns the 64-bit hash of each row over the key columns.
+        """
+        if self.columns is not None:
+            lowercase = {column.lower(): column for column in df.columns}
+            df = df[[lowercase[column] for column in self.columns]]
+
+        return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+    def _seen(self, hashes):
+        """Whether each hash is in the memory set or one of the spilled runs."""
+        seen = np.zeros(len(hashes), dtype=bool)
+        for run in self._memory + self._runs:
+            if len(run):
+                position = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+                seen |= run[position] == hashes
+        return seen
+
+    def filter(self, df, source=None):
+        """
+        Returns df without the rows seen before, keeping the first occurrence of
+        each row as drop_duplicates() does, and remembers the new rows.
+
+        Parameters:
+        - df: A chunk.
+        - source: A label to count the rows and duplicates under, e.g. the file path.
+
+        Returns:
+        - df: The chunk without duplicates.
+        """
+        hashes = self.fingerprint(df)
+
+        # first occurrence within the chunk, then not seen in earlier chunks
+        unique, first = np.unique(hashes, return_index=True)
+        new = ~self._seen(unique)
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[first[new]] = True
+
+        # np.unique already sorted them
+        self._memory.append(unique[new])
+        if len(self._memory) > _MAX_MEMORY_RUNS:
+            self._memory = [np.sort(np.concatenate(self._memory))]
+        if sum(len(run) for run in self._memory) > self.max_memory_hashes:
+            self._spill()
+
+        counts = self.sources.setdefault(source, {'rows': 0, 'duplicates': 0})
+        counts['rows'] += len(df)
+        counts['duplicates'] += len(df) - int(keep.sum())
+
+        return df[keep]
+
+    def _spill(self):
+        """Writes the in-memory hashes to disk as a sorted run and maps it back read-only."""
+        if self._run_directory is None:
+            if self.spill_directory is not None:
+                os.makedirs(self.spill_directory, exist_ok=True)
+            # its own subdirectory, so deduplicators sharing a spill_directory never share run files
+            self._run_directory = tempfile.mkdtemp(prefix='dw_dedup_', dir=self.spill_directory)
+
+        path = os.path.join(self._run_directory, f'run_{len(self._runs):04d}.npy')
+        np.save(path, np.sort(np.concatenate(self._memory)))
+        self._runs.append(np.load(path, mmap_mode='r'))
+        self._memory = []
+
+    def close(self):
+        """
+        Forgets the hashes, closes the memory-mapped runs and removes the
+        subdirectory they were spilled to. The source counts are kept.
+        """
+        self._memory = []
+        self._runs = []
+        if self._run_directory is not None:
+            shutil.rmtree(self._run_directory, ignore_errors=True)
+            self._run_directory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #-----------------------------------------------------------------------------------
+    def distinct_rows(self):
+        """
+        Returns the number of distinct rows kept so far.
+        """
+        return sum(len(run) for run in self._memory + self._runs)
+
+    def report(self):
+        """
+        Returns the rows read and duplicates dropped per source.
+        """
+        report = pd.DataFrame([{'source': source, **counts} for source, counts in self.sources.items()],
+                              columns=['source', 'rows', 'duplicates'])
+        report['duplicate_share'] = report['duplicates'] / report['rows'].where(report['rows'] > 0)
+
+        return report
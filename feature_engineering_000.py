@@ -1,6 +1,144 @@
+# FEATURE ENGINEERING
 
+from dataclasses import dataclass, fields
 
-# FEATURE ENGINEERING
+import numpy as np
+import pandas as pd
+
+#-----------------------------------------------------------------------------------
+# Route encoding
+#
+# IATA codes are three uppercase letters, so every airport has a fixed integer id
+# in [0, 26**3) and every unordered airport pair has a fixed integer route id.
+# The encoding is pure arithmetic, so it acts as one shared route dictionary:
+# the same id means the same route in flights, tickets and all grouped outputs,
+# no matter which frame was encoded first. Ids that cannot be encoded are -1.
+#-----------------------------------------------------------------------------------
+IATA_CODE_SPACE = 26 ** 3
+
+
+def fe_encode_airport_codes(codes):
+    """
+    Maps IATA airport codes to integer airport ids in bulk.
+    Only the distinct codes are inspected; the result is then gathered
+    for every row with a single array lookup.
+
+    Parameters:
+    - codes: A series (or array) of airport codes, e.g. the 'origin' column.
+
+    Returns:
+    - airport_ids: A numpy int32 array, -1 where the value is not a three letter code.
+    """
+    row_codes, distinct_codes = pd.factorize(pd.Series(codes, copy=False))
+    distinct_codes = pd.Series(distinct_codes, dtype=object)
+
+    distinct_ids = np.full(len(distinct_codes), -1, dtype=np.int32)
+    valid = distinct_codes.str.fullmatch('[A-Z]{3}', na=False).to_numpy(dtype=bool)
+    if valid.any():
+        letters = np.array(distinct_codes[valid].tolist(), dtype='S3').view(np.uint8).reshape(-1, 3)
+        letters = letters.astype(np.int32) - ord('A')
+        distinct_ids[valid] = letters[:, 0] * 676 + letters[:, 1] * 26 + letters[:, 2]
+
+    # append a -1 slot so the factorize code -1 (missing values) maps to -1
+    return np.append(distinct_ids, np.int32(-1))[row_codes]
+
+
+def fe_decode_airport_ids(airport_ids):
+    """
+    Turns integer airport ids back into their three letter IATA codes.
+
+    Parameters:
+    - airport_ids: An array of airport ids.
+
+    Returns:
+    - codes: A numpy object array of codes, NaN where the id is -1.
+    """
+    airport_ids = np.asarray(airport_ids)
+    letters = np.stack([airport_ids // 676, airport_ids // 26 % 26, airport_ids % 26], axis=-1)
+    codes = (letters + ord('A')).astype(np.uint8).view('S3').ravel().astype(str).astype(object)
+    codes[airport_ids < 0] = np.nan
+
+    return codes
+
+
+def fe_encode_route(origin, destination):
+    """
+    Creates order independent integer route ids from origin and destination codes,
+    so ATL->LGA and LGA->ATL share one id.
+
+    Parameters:
+    - origin: A series of origin codes.
+    - destination: A series of destination codes.
+
+    Returns:
+    - route_ids: A numpy int32 array of route ids, -1 where either code is unusable.
+    """
+    origin_ids = fe_encode_airport_codes(origin)
+    destination_ids = fe_encode_airport_codes(destination)
+
+    low = np.minimum(origin_ids, destination_ids)
+    high = np.maximum(origin_ids, destination_ids)
+    route_ids = low * IATA_CODE_SPACE + high
+    route_ids[low < 0] = -1
+
+    return route_ids
+
+
+def fe_decode_route_ids(route_ids):
+    """
+    Materializes the readable 'AAA_BBB' label for route ids. Only the distinct
+    ids are decoded, so this is cheap enough to call when a result is displayed.
+
+    Parameters:
+    - route_ids: An array (or series) of route ids.
+
+    Returns:
+    - labels: A numpy object array of route labels, NaN where the id is -1.
+    """
+    row_routes, distinct_routes = pd.factorize(np.asarray(route_ids), sort=False)
+    decodable = np.maximum(distinct_routes, 0)
+    low = fe_decode_airport_ids(decodable // IATA_CODE_SPACE)
+    high = fe_decode_airport_ids(decodable % IATA_CODE_SPACE)
+
+    distinct_labels = (low + '_' + high).astype(object)
+    distinct_labels[distinct_routes < 0] = np.nan
+
+    return distinct_labels[row_routes]
+
+
+#-----------------------------------------------------------------------------------
+def fe_create_route_id(df):
+    """
+    Creates a new integer 'fe_route_id' column from 'origin' and 'destination'.
+    This is the compact counterpart to 'fe_route': groupbys and merges on it
+    avoid building a string per row. Use fe_add_route_label(df) to get the
+    readable label back for display.
+
+    Parameters:
+    - df: The input dataframe.
+
+    Returns:
+    - df: The input dataframe with the added 'fe_route_id' column.
+    """
+    df['fe_route_id'] = fe_encode_route(df['origin'], df['destination'])
+
+    return df
+
+#-----------------------------------------------------------------------------------
+def fe_add_route_label(df):
+    """
+    Adds the readable 'fe_route' label (e.g. 'ATL_LGA') to a dataframe keyed
+    by 'fe_route_id', typically a small grouped table right before display.
+
+    Parameters:
+    - df: The input dataframe with a 'fe_route_id' column.
+
+    Returns:
+    - df: The input dataframe with the added 'fe_route' column.
+    """
+    df['fe_route'] = fe_decode_route_ids(df['fe_route_id'])
+
+    return df
 
 #-----------------------------------------------------------------------------------
 def fe_create_route(df):
@@ -8,15 +146,67 @@ def fe_create_route(df):
     Creates a new 'fe_route' column by combining and sorting 'origin' and 'destination',
     separated by an underscore, and adds it to the dataframe.
 
+    The routes are encoded as integer ids first, and the label is built once per
+    distinct route rather than once per row. Codes that are not three letters
+    (rare) fall back to a vectorized string comparison.
+
     Parameters:
     - df: The input dataframe.
 
     Returns:
     - df: The input dataframe with the added 'fe_route' column.
     """
-    df['fe_route'] = df.apply(lambda row: '_'.join(sorted([row['origin'], row['destination']])), axis=1)
-    
+    route_ids = fe_encode_route(df['origin'], df['destination'])
+    labels = fe_decode_route_ids(route_ids)
+
+    unencoded = route_ids < 0
+    if unencoded.any():
+        origin = df['origin'].to_numpy()[unencoded].astype(str)
+        destination = df['destination'].to_numpy()[unencoded].astype(str)
+        first = np.where(origin <= destination, origin, destination)
+        second = np.where(origin <= destination, destination, origin)
+        labels[unencoded] = np.char.add(np.char.add(first, '_'), second)
+
+    df['fe_route'] = labels
+
     return df
+#-----------------------------------------------------------------------------------
+# Route economics parameters
+#-----------------------------------------------------------------------------------
+@dataclass(frozen=True)
+class RouteEconomicsParameters:
+    """
+    The assumptions behind the fe_calculate_* cost and revenue columns.
+    The defaults are the values used in the 2019 Q1 analysis. Use
+    dataclasses.replace(ROUTE_ECONOMICS_DEFAULTS, ...) to try others.
+
+    - large_airport_fee, medium_airport_fee: The charge per airport visit.
+    - delay_threshold_minutes, delay_cost_per_minute: Delays beyond the
+      threshold cost this much per minute.
+    - dio_cost_per_mile: Depreciation, insurance and other cost per mile.
+    - fomc_cost_per_mile: Fuel, oil, maintenance and crew cost per mile.
+    - seats_per_round_trip: 200 seats each way.
+    - bag_share: The share of passengers that check one bag each way.
+    - bag_fee_per_round_trip: The round trip baggage charge.
+    - aircraft_cost: The fixed (upfront) cost of the airplane.
+    """
+    large_airport_fee: float = 10000
+    medium_airport_fee: float = 5000
+    delay_threshold_minutes: float = 15
+    delay_cost_per_minute: float = 75
+    dio_cost_per_mile: float = 1.18
+    fomc_cost_per_mile: float = 8
+    seats_per_round_trip: float = 400
+    bag_share: float = 0.5
+    bag_fee_per_round_trip: float = 70
+    aircraft_cost: float = 90000000
+
+    def as_dict(self):
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+
+ROUTE_ECONOMICS_DEFAULTS = RouteEconomicsParameters()
+
 #----------------------------------------------------------------------------------
 def fe_create_mean_route_fare_per_passenger(df):
     """
@@ -37,7 +227,7 @@ def fe_create_mean_route_fare_per_passenger(df):
 
 #----------------------------------------------------------------------------------
 
-def fe_calculate_route_airport_operations_cost(df):
+def fe_calculate_route_airport_operations_cost(df, parameters=ROUTE_ECONOMICS_DEFAULTS):
     """
     This function creates new columns 'airport_origin_cost' and 'airport_destination_cost'
     based on airport sizes and then calculates the 'fe_route_airport_operations_cost' column
@@ -47,16 +237,24 @@ def fe_calculate_route_airport_operations_cost(df):
 
     parameter:
     df: the input dataframe
+    parameters: the RouteEconomicsParameters with the airport fees
     
     returns:
     df: the input dataframe now with the added columns.
     """
-    df['airport_origin_cost'] = df['type_origin'].apply(lambda x: 10000 if x == 'large_airport' else (5000 if x == 'medium_airport' else 0))
-    df['airport_destination_cost'] = df['type_destination'].apply(lambda x: 10000 if x == 'large_airport' else (5000 if x == 'medium_airport' else 0))
+    df['airport_origin_cost'] = _fe_airport_fee(df['type_origin'], parameters)
+    df['airport_destination_cost'] = _fe_airport_fee(df['type_destination'], parameters)
     df['fe_route_airport_operations_cost'] = df['airport_origin_cost'] + df['airport_destination_cost']
     
     return df
 
+def _fe_airport_fee(airport_types, parameters):
+    """The fee for each airport type: large, medium, or 0 for anything else."""
+    airport_types = np.asarray(airport_types, dtype=object)
+
+    return np.select([airport_types == 'large_airport', airport_types == 'medium_airport'],
+                     [parameters.large_airport_fee, parameters.medium_airport_fee], 0)
+
 #--------------------------------------------------------------------------
 
 def fe_create_multiple_mean_values_with_count(df):
@@ -99,34 +297,46 @@ def fe_create_multiple_mean_values_with_count(df):
 
 #--------------------------------------------------------------------------
 
-def fe_calculate_route_delay_cost(df):
+def fe_calculate_route_delay_cost(df, parameters=ROUTE_ECONOMICS_DEFAULTS, method='mean'):
     """
     Calculates the value for the 'fe_route_delay_cost' column based on
     charge for 15+ min airport delays and adds it to the dataframe. It uses the
     mean departure and mean arrival delay columns for this calculation.
     It ads these values in the column ['fe_route_delay_cost'].
 
+    With method='distribution' the charge is taken per flight instead of on the
+    mean: it uses the expected minutes beyond the threshold per flight
+    ('fe_route_mean_dep_delay_excess', 'fe_route_mean_arr_delay_excess', added by
+    route_sketches_000.fe_add_route_distribution_features with the same parameters).
+    A route with mostly early flights and a few very late ones is then charged.
+
     Parameters:
     - df: The input dataframe.
+    - parameters: The RouteEconomicsParameters (default: the 2019 Q1 assumptions).
+    - method: 'mean' (the notebook's calculation) or 'distribution'.
 
     Returns:
     - df: The input dataframe with the added 'fe_route_delay_cost' column.
     """
-    def calculate_delay_cost(value):
-        adjusted_value = value - 15
-        if adjusted_value <= 0:
-            return 0
-        else:
-            return adjusted_value * 75
-
-    df['fe_route_delay_cost'] = (df['fe_route_mean_dep_delay'].apply(calculate_delay_cost) +
-                                 df['fe_route_mean_arr_delay'].apply(calculate_delay_cost))
+    if method == 'distribution':
+        df['fe_route_delay_cost'] = ((df['fe_route_mean_dep_delay_excess'] + df['fe_route_mean_arr_delay_excess'])
+                                     * parameters.delay_cost_per_minute)
+        return df
+    if method != 'mean':
+        raise ValueError(f"Unknown method '{method}'. Use 'mean' or 'distribution'.")
+
+    df['fe_route_delay_cost'] = (_fe_delay_cost(df['fe_route_mean_dep_delay'], parameters) +
+                                 _fe_delay_cost(df['fe_route_mean_arr_delay'], parameters))
     
     return df
 
+def _fe_delay_cost(delay, parameters):
+    """The cost of the minutes of delay beyond the threshold (NaN stays NaN)."""
+    return np.maximum(delay - parameters.delay_threshold_minutes, 0) * parameters.delay_cost_per_minute
+
 #--------------------------------------------------------------------------
 
-def fe_calculate_round_trip_route_dio_cost(df):
+def fe_calculate_round_trip_route_dio_cost(df, parameters=ROUTE_ECONOMICS_DEFAULTS):
     """
     Calculates the round trip route depreciation, insurance, 
     and other cost and adds it to the dataframe as the column
@@ -134,18 +344,19 @@ def fe_calculate_round_trip_route_dio_cost(df):
 
     Parameters:
     - df: The input dataframe.
+    - parameters: The RouteEconomicsParameters (default: the 2019 Q1 assumptions).
 
     Returns:
     - df: The input dataframe with the added 'fe_round_trip_route_dio_cost' column.
     """
     total_route_distance = df['fe_route_mean_distance'] * 2
-    df['fe_round_trip_route_dio_cost'] = total_route_distance * 1.18
+    df['fe_round_trip_route_dio_cost'] = total_route_distance * parameters.dio_cost_per_mile
     
     return df
 
 #-------------------------------------------------------------------
 
-def fe_calculate_round_trip_route_fomc_cost(df):
+def fe_calculate_round_trip_route_fomc_cost(df, parameters=ROUTE_ECONOMICS_DEFAULTS):
     """
     Calculates the round trip route fuel, oil, maintenance, 
     and crew cost and adds it to the dataframe as the column
@@ -153,18 +364,19 @@ def fe_calculate_round_trip_route_fomc_cost(df):
 
     Parameters:
     - df: The input dataframe.
+    - parameters: The RouteEconomicsParameters (default: the 2019 Q1 assumptions).
 
     Returns:
     - df: The input dataframe with the added ['fe_round_trip_route_fomc_cost']column.
     """
     total_route_distance = df['fe_route_mean_distance'] * 2
-    df['fe_round_trip_route_fomc_cost'] = total_route_distance * 8
+    df['fe_round_trip_route_fomc_cost'] = total_route_distance * parameters.fomc_cost_per_mile
     
     return df
 
 #-------------------------------------------------------------------
 
-def fe_calculate_round_trip_route_fare_revenue(df):
+def fe_calculate_round_trip_route_fare_revenue(df, parameters=ROUTE_ECONOMICS_DEFAULTS):
     """
     Calculates the round trip fare revenue for the route and creates the column ['fe_round_trip_route_fare_revenue'].
     It does this my multiplying the total route passenger number (400 = 200 departure flight + 200 return flight) by mean route occupancy rate.
@@ -172,11 +384,12 @@ def fe_calculate_round_trip_route_fare_revenue(df):
 
     Parameters:
     - df: The input dataframe.
+    - parameters: The RouteEconomicsParameters (default: the 2019 Q1 assumptions).
 
     Returns:
     - df: The input dataframe with the added ['fe_round_trip_route_fare_revenue']  column.
     """
-    adjusted_passenger_count = df['fe_route_mean_occupancy_rate'] * 400
+    adjusted_passenger_count = df['fe_route_mean_occupancy_rate'] * parameters.seats_per_round_trip
     df['fe_round_trip_route_fare_revenue'] = (df['fe_mean_route_fare_per_passenger'] * adjusted_passenger_count) 
     
     return df
@@ -184,19 +397,20 @@ def fe_calculate_round_trip_route_fare_revenue(df):
 #--------------------------------------------------------------------------
 
 
-def fe_calculate_round_trip_route_baggage_revenue(df):
+def fe_calculate_round_trip_route_baggage_revenue(df, parameters=ROUTE_ECONOMICS_DEFAULTS):
     """
     Calculates the round trip baggage revenue for the route and creates the column ['fe_round_trip_route_baggage_revenue'].
     It does this my multiplying the total route passenger number (400 = 200 departure flight + 200 return flight) by mean route occupancy rate and discounts this number by half (in line with the prompt estimate that 50% of passengers carry 1 bag each way). It then multiplies this by the 70 total round trip baggage charge. For simplicity I assume this estimate fully captures anticipated baggage revenue for a round trip flight on a route.
 
     Parameters:
     - df: The input dataframe.
+    - parameters: The RouteEconomicsParameters (default: the 2019 Q1 assumptions).
 
     Returns:
     - df: The input dataframe with the added '['fe_round_trip_route_baggage_revenue'] column.
     """
-    adjusted_bag_carrying_passenger_count = (df['fe_route_mean_occupancy_rate'] * 400 * 0.5)
-    df['fe_round_trip_route_baggage_revenue'] = (    adjusted_bag_carrying_passenger_count * 70) 
+    adjusted_bag_carrying_passenger_count = (df['fe_route_mean_occupancy_rate'] * parameters.seats_per_round_trip * parameters.bag_share)
+    df['fe_round_trip_route_baggage_revenue'] = (    adjusted_bag_carrying_passenger_count * parameters.bag_fee_per_round_trip) 
     
     return df
 
@@ -257,17 +471,18 @@ def fe_calculate_per_round_trip_route_profit(df):
 
 #--------------------------------------------------------------------------
 
-def fe_calculate_break_even_point_in_number_of_round_trip_flights_for_route(df):
+def fe_calculate_break_even_point_in_number_of_round_trip_flights_for_route(df, parameters=ROUTE_ECONOMICS_DEFAULTS):
     """
     Calculates the break-even point in terms of the number of round trip flights needed to cover the fixed cost of the airplane, and adds the result to the dataframe.
 
     Parameters:
     - df: The input dataframe.
+    - parameters: The RouteEconomicsParameters (default: the 2019 Q1 assumptions).
 
     Returns:
     - df: The input dataframe with the added 'fe_break_even_point_in_number_of_round_trip_flights_for_route' column.
     """
-    fixed_cost_of_airplane = 90000000
+    fixed_cost_of_airplane = parameters.aircraft_cost
     df['fe_break_even_point_in_number_of_round_trip_flights_for_route'] = fixed_cost_of_airplane / df['fe_per_round_trip_route_profit']
     
     return df
@@ -290,7 +505,172 @@ def fe_calculate_total_profit_for_route_2019q1(df):
     Returns:
     - df: The input dataframe with the added 'fe_total_profit_for_route_2019q1' column.
     """
-    df['fe_total_profit_for_route_2019q1'] = df['fe_per_round_trip_route_profit'] * df['fe_number_of_flights_per_route']
+    return fe_calculate_total_profit_for_route(df, period='2019q1')
+
+#--------------------------------------------------------------------------
+
+def fe_calculate_total_profit_for_route(df, period='2019q1'):
+    """
+    Calculates the total profit for each route over the period the
+    grouped dataframe covers (one quarter, or a window of quarters
+    merged from the quarterly route partitions).
+
+    Parameters:
+    - df: The input dataframe containing 'fe_per_round_trip_route_profit' and 'fe_number_of_flights_per_route' columns.
+    - period: The label of the period, used in the column name (e.g. '2019q1', '2019ytd', 'last_4q').
+
+    Returns:
+    - df: The input dataframe with the added 'fe_total_profit_for_route_<period>' column.
+    """
+    df[f'fe_total_profit_for_route_{period}'] = df['fe_per_round_trip_route_profit'] * df['fe_number_of_flights_per_route']
+    return df
+
+#--------------------------------------------------------------------------
+
+# ROUTE ECONOMICS ENGINE
+
+#--------------------------------------------------------------------------
+# The grouped route table columns the engine reads
+ROUTE_ECONOMICS_INPUTS = {
+    'distance': 'fe_route_mean_distance',
+    'occupancy_rate': 'fe_route_mean_occupancy_rate',
+    'fare': 'fe_mean_route_fare_per_passenger',
+    'dep_delay': 'fe_route_mean_dep_delay',
+    'arr_delay': 'fe_route_mean_arr_delay',
+    'airport_cost': 'fe_route_airport_operations_cost',
+    'flights': 'fe_number_of_flights_per_route',
+}
+
+# The columns the engine can emit, in the order of the fe_calculate_* chain
+ROUTE_ECONOMICS_COLUMNS = [
+    'fe_route_delay_cost',
+    'fe_round_trip_route_dio_cost',
+    'fe_round_trip_route_fomc_cost',
+    'fe_round_trip_route_fare_revenue',
+    'fe_round_trip_route_baggage_revenue',
+    'fe_round_trip_total_revenue',
+    'fe_round_trip_total_variable_cost',
+    'fe_per_round_trip_route_profit',
+    'fe_break_even_point_in_number_of_round_trip_flights_for_route',
+    'fe_total_profit_for_route_2019q1',
+]
+
+
+def fe_route_economics_arrays(inputs, parameters=ROUTE_ECONOMICS_DEFAULTS):
+    """
+    The cost/revenue model on plain numpy arrays. The arithmetic is the same,
+    step for step, as in the fe_calculate_* functions. The parameters may be
+    scalars or arrays that broadcast against the inputs.
+
+    Parameters:
+    - inputs: A dict with the keys of ROUTE_ECONOMICS_INPUTS mapped to arrays.
+    - parameters: A RouteEconomicsParameters (or any object with the same attributes).
+
+    Returns:
+    - a dict of output column name -> array, for all ROUTE_ECONOMICS_COLUMNS.
+    """
+    total_route_distance = inputs['distance'] * 2
+    adjusted_passenger_count = inputs['occupancy_rate'] * parameters.seats_per_round_trip
+
+    delay_cost = (_fe_delay_cost(inputs['dep_delay'], parameters) +
+                  _fe_delay_cost(inputs['arr_delay'], parameters))
+    dio_cost = total_route_distance * parameters.dio_cost_per_mile
+    fomc_cost = total_route_distance * parameters.fomc_cost_per_mile
+    fare_revenue = inputs['fare'] * adjusted_passenger_count
+    baggage_revenue = (adjusted_passenger_count * parameters.bag_share) * parameters.bag_fee_per_round_trip
+    total_revenue = baggage_revenue + fare_revenue
+    total_variable_cost = fomc_cost + dio_cost + delay_cost + inputs['airport_cost']
+    profit = total_revenue - total_variable_cost
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        break_even = parameters.aircraft_cost / profit
+
+    return {
+        'fe_route_delay_cost': delay_cost,
+        'fe_round_trip_route_dio_cost': dio_cost,
+        'fe_round_trip_route_fomc_cost': fomc_cost,
+        'fe_round_trip_route_fare_revenue': fare_revenue,
+        'fe_round_trip_route_baggage_revenue': baggage_revenue,
+        'fe_round_trip_total_revenue': total_revenue,
+        'fe_round_trip_total_variable_cost': total_variable_cost,
+        'fe_per_round_trip_route_profit': profit,
+        'fe_break_even_point_in_number_of_round_trip_flights_for_route': break_even,
+        'fe_total_profit_for_route_2019q1': profit * inputs['flights'],
+    }
+
+#--------------------------------------------------------------------------
+def fe_route_ids_from_labels(labels):
+    """
+    Turns 'AAA_BBB' route labels back into integer route ids (-1 if not encodable).
+    """
+    airports = pd.Series(labels, copy=False).str.split('_', n=1)
+
+    return fe_encode_route(airports.str[0], airports.str[1])
+
+#--------------------------------------------------------------------------
+def fe_route_airport_fees(route_ids, airport_codes, parameters=ROUTE_ECONOMICS_DEFAULTS):
+    """
+    Prices the two airport visits of each route from its endpoint airport types.
+    This lets the engine apply different airport fees to an already grouped
+    route table, whose 'fe_route_airport_operations_cost' was priced upstream.
+
+    Parameters:
+    - route_ids: An array of route ids.
+    - airport_codes: The airport codes table with 'iata_code' and 'type' (airport_codes_v2).
+    - parameters: The RouteEconomicsParameters with the airport fees.
+
+    Returns:
+    - fees: A numpy float array, NaN where the route id is -1.
+    """
+    airport_ids = fe_encode_airport_codes(airport_codes['iata_code'])
+    known = airport_ids >= 0
+    fee_by_airport = np.zeros(IATA_CODE_SPACE)
+    fee_by_airport[airport_ids[known]] = _fe_airport_fee(airport_codes['type'].to_numpy()[known], parameters)
+
+    route_ids = np.asarray(route_ids)
+    usable = np.maximum(route_ids, 0)
+    fees = fee_by_airport[usable // IATA_CODE_SPACE] + fee_by_airport[usable % IATA_CODE_SPACE]
+
+    return np.where(route_ids >= 0, fees, np.nan)
+
+#--------------------------------------------------------------------------
+def fe_calculate_route_economics(df, parameters=ROUTE_ECONOMICS_DEFAULTS, outputs=None, airport_codes=None):
+    """
+    Calculates the revenue, cost, profit, break-even and total profit columns of
+    the grouped route table in one pass. This replaces running the chain
+    fe_calculate_route_delay_cost ... fe_calculate_total_profit_for_route_2019q1,
+    with the same results for the same parameters.
+
+    Parameters:
+    - df: The grouped route table (after fe_create_multiple_mean_values_with_count).
+    - parameters: The RouteEconomicsParameters to evaluate.
+    - outputs: Optional list of the ROUTE_ECONOMICS_COLUMNS to add (default: all).
+    - airport_codes: Optional airport codes table. If given, the airport
+      operations cost is re-priced from the route endpoints with the parameter
+      fees, instead of taking the 'fe_route_airport_operations_cost' column.
+
+    Returns:
+    - df: The input dataframe with the requested columns added.
+    """
+    outputs = ROUTE_ECONOMICS_COLUMNS if outputs is None else list(outputs)
+    unknown = [column for column in outputs if column not in ROUTE_ECONOMICS_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown route economics columns: {unknown}")
+
+    inputs = {name: df[column].to_numpy(dtype=float, na_value=np.nan)
+              for name, column in ROUTE_ECONOMICS_INPUTS.items()
+              if not (name == 'airport_cost' and airport_codes is not None)}
+    if airport_codes is not None:
+        if 'fe_route_id' in df.columns:
+            route_ids = df['fe_route_id'].to_numpy()
+        else:
+            route_ids = fe_route_ids_from_labels(df['fe_route'])
+        inputs['airport_cost'] = fe_route_airport_fees(route_ids, airport_codes, parameters)
+
+    results = fe_route_economics_arrays(inputs, parameters)
+    for column in outputs:
+        df[column] = results[column]
+
     return df
 
 #--------------------------------------------------------------------------
@@ -0,0 +1,226 @@
+#=======================================================================================
+"""
+Instrumentation
+
+This file contains stage-level instrumentation for the dw_ and fe_ functions.
+instrument() wraps every public function of data_wrangling_000 and
+feature_engineering_000 (or other given modules). For each call it records:
+wall time, cpu time, peak allocated memory delta, input and output row
+counts, and the rows dropped by filters and inner joins.
+
+Switching off is cheap: with recorder.enabled = False each wrapper does one
+attribute check before calling through. uninstrument() puts the original
+functions back, so there is no overhead at all.
+
+Typical use in the notebook:
+
+    import instrumentation_000 as ins
+    recorder = ins.instrument(namespaces=[globals()])
+    ... run the cells ...
+    print(recorder.format_table())
+    recorder.to_json('run_report.json')
+
+"""
+#=======================================================================================
+import functools
+import inspect
+import json
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import data_wrangling_000
+import feature_engineering_000
+
+# functions whose smaller output means rows were dropped (filters, dedup, inner joins)
+ROW_DROPPING_PREFIXES = ('dw_subset_', 'dw_merge_', 'process_dataframe')
+
+REPORT_COLUMNS = [
+    'call', 'function', 'depth', 'wall_s', 'cpu_s', 'peak_memory_mb',
+    'rows_in', 'rows_out', 'rows_dropped',
+]
+
+
+#=======================================================================================
+# recording
+#=======================================================================================
+class StageRecorder:
+    """
+    Collects one record per instrumented call of a run.
+
+    Parameters:
+    - track_memory: Measure the peak allocated memory with tracemalloc. This is the
+      most expensive measurement (numpy and pandas allocations are traced), so it
+      can be left out for production timings.
+    """
+
+    def __init__(self, track_memory=True):
+        self.enabled = True
+        self.track_memory = track_memory
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = datetime.now(timezone.utc).isoformat()
+        self.records = []
+        self._depth = 0
+        # per active call: the highest peak seen before nested calls reset it
+        self._peaks = []
+
+    #-----------------------------------------------------------------------------------
+    def call(self, function, args, kwargs):
+        """Runs one call of an instrumented function and records it."""
+        rows_in = _row_count(args[0]) if args else None
+        record = {'call': len(self.records), 'function': function.__name__, 'depth': self._depth}
+        self.records.append(record)
+
+        tracing = self.track_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.track_memory:
+            traced_before, peak_so_far = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak_so_far)
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        self._depth += 1
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            self._depth -= 1
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            if self.track_memory:
+                _, traced_peak = tracemalloc.get_traced_memory()
+                traced_peak = max(traced_peak, self._peaks.pop())
+                record['peak_memory_mb'] = (traced_peak - traced_before) / 1024 ** 2
+            if tracing:
+                tracemalloc.stop()
+
+        rows_out = _row_count(result[0] if isinstance(result, tuple) and result else result)
+        record['rows_in'] = rows_in
+        record['rows_out'] = rows_out
+        if function.__name__.startswith(ROW_DROPPING_PREFIXES) and rows_in is not None and rows_out is not None:
+            record['rows_dropped'] = rows_in - rows_out
+
+        return result
+
+    #-----------------------------------------------------------------------------------
+    def report(self):
+        """
+        Returns the records of the run as a dataframe, one row per call.
+        """
+        return pd.DataFrame(self.records, columns=REPORT_COLUMNS)
+
+    def summary(self):
+        """
+        Returns the records summed per function: calls, time, peak memory and rows dropped.
+        """
+        report = self.report()
+
+        return report.groupby('function', sort=False).agg(
+            calls=('call', 'size'),
+            wall_s=('wall_s', 'sum'),
+            cpu_s=('cpu_s', 'sum'),
+            peak_memory_mb=('peak_memory_mb', 'max'),
+            rows_dropped=('rows_dropped', 'sum'),
+        ).sort_values('wall_s', ascending=False)
+
+    def to_json(self, path=None):
+        """
+        Exports the run (run id, start time and all records) as json.
+        Writes it to path if given, and returns the json text.
+        """
+        report = self.report().astype(object)
+        records = report.where(report.notna(), None).to_dict(orient='records')
+        text = json.dumps({'run_id': self.run_id, 'started': self.started, 'records': records},
+                          indent=2, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+
+        return text
+
+    def format_table(self):
+        """
+        Returns the run as a readable table, nested calls indented.
+        """
+        report = self.report()
+        report['function'] = ['  ' * depth + name for depth, name in zip(report['depth'], report['function'])]
+
+        return (f"run {self.run_id} ({self.started})\n" +
+                report.drop(columns=['call', 'depth']).to_string(index=False, float_format='{:.4f}'.format,
+                                                               na_rep='-'))
+
+
+def _row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    return None
+
+
+#=======================================================================================
+# wrapping
+#=======================================================================================
+_ORIGINALS = {}
+
+
+def _public_functions(module):
+    return {name: value for name, value in vars(module).items()
+            if inspect.isfunction(value) and not name.startswith('_')
+            and value.__module__ == module.__name__}
+
+
+def _wrap(function, recorder):
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+        if not recorder.enabled:
+            return function(*args, **kwargs)
+        return recorder.call(function, args, kwargs)
+
+    instrumented.__instrumented__ = function
+    return instrumented
+
+
+def instrument(modules=(data_wrangling_000, feature_engineering_000), namespaces=(),
+               recorder=None, track_memory=True):
+    """
+    Wraps every public function of the given modules with a recorder.
+
+    Parameters:
+    - modules: The modules to instrument (default: the dw_ and fe_ modules).
+    - namespaces: Other dicts holding references to those functions that should be
+      patched too, e.g. globals() of a notebook that did 'from data_wrangling_000 import *',
+      or vars(pipeline_000).
+    - recorder: An existing StageRecorder (default: a new one).
+    - track_memory: See StageRecorder.
+
+    Returns:
+    - recorder: The StageRecorder collecting the run.
+    """
+    uninstrument()
+    recorder = recorder or StageRecorder(track_memory=track_memory)
+
+    wrapped = {}
+    for module in modules:
+        for name, function in _public_functions(module).items():
+            wrapped[function] = _wrap(function, recorder)
+
+    for namespace in [vars(module) for module in modules] + list(namespaces):
+        for name, value in list(namespace.items()):
+            if inspect.isfunction(value) and value in wrapped:
+                _ORIGINALS[(id(namespace), name)] = (namespace, name, value)
+                namespace[name] = wrapped[value]
+
+    return recorder
+
+
+def uninstrument():
+    """
+    Puts the original functions back everywhere instrument() patched them.
+    """
+    for namespace, name, original in _ORIGINALS.values():
+        namespace[name] = original
+    _ORIGINALS.clear()
@@ -0,0 +1,218 @@
+#=======================================================================================
+"""
+Pipeline
+
+This file contains the notebook's wrangling pipeline as functions, from the raw
+csv dataframes through dw_transform_calculate_varied_grouped_means_with_count,
+in two execution modes:
+
+- dw_run_route_pipeline: the serial path, step for step as in main.ipynb.
+- dw_run_route_pipeline_sharded: flights and tickets are hash-partitioned by route
+  and every shard is cleaned, imputed, merged and aggregated in a process pool.
+  The shards are combined at the end and the result is identical to the serial path.
+
+"""
+#=======================================================================================
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_wrangling_000 import (
+    _dw_print_rejected,
+    dw_convert_air_time_column_to_float,
+    dw_convert_distance_column_to_int,
+    dw_convert_itin_fare_column_to_float,
+    dw_merge_dataframes_with_fe_route,
+    dw_merge_dataframes_with_origin_destination_sizes,
+    dw_parse_dirty_numeric,
+    dw_replace_itin_fare_with_group_mean,
+    dw_subset_airport_codes_for_m_l_airports_US_only,
+    dw_subset_airport_codes_for_merger,
+    dw_subset_flights_not_cancelled_only,
+    dw_subset_tickets_roundtrip_only,
+    dw_transform_calculate_mean_fare_by_route_to_merge_with_flights,
+    dw_transform_calculate_varied_grouped_means_with_count,
+    process_dataframe,
+)
+from feature_engineering_000 import (
+    fe_calculate_route_airport_operations_cost,
+    fe_create_mean_route_fare_per_passenger,
+    fe_create_route,
+    fe_encode_route,
+)
+
+#=======================================================================================
+# serial path
+#=======================================================================================
+def dw_prepare_airport_codes(airport_codes_initial):
+    """
+    Cleans the raw airport codes dataframe into airport_codes_v2.
+    """
+    airport_codes_v1 = dw_subset_airport_codes_for_m_l_airports_US_only(process_dataframe(airport_codes_initial))
+
+    return dw_subset_airport_codes_for_merger(airport_codes_v1)
+
+
+# the flights columns dw_convert_distance_column_to_int / dw_convert_air_time_column_to_float parse
+_FLIGHTS_CONVERSIONS = {'distance': 'int', 'air_time': 'float'}
+
+
+def _clean_flights(flights_initial, rejected=None):
+    """
+    Raw flights -> flights_v3 with the 'fe_route' column. Given a dict, the rejected
+    tokens per column are collected in it instead of printed (for the workers).
+    """
+    flights_v1 = dw_subset_flights_not_cancelled_only(process_dataframe(flights_initial))
+    if rejected is None:
+        flights_v3 = dw_convert_air_time_column_to_float(dw_convert_distance_column_to_int(flights_v1.copy()))
+    else:
+        flights_v3 = flights_v1.copy()
+        for column, dtype in _FLIGHTS_CONVERSIONS.items():
+            flights_v3[column], rejected[column] = dw_parse_dirty_numeric(flights_v3[column], dtype)
+
+    return fe_create_route(flights_v3)
+
+
+def _clean_tickets(tickets_initial):
+    """Raw tickets -> tickets_v2 (before the fare imputation)."""
+    tickets_v1 = dw_subset_tickets_roundtrip_only(process_dataframe(tickets_initial))
+
+    return dw_convert_itin_fare_column_to_float(tickets_v1.copy())
+
+
+def _aggregate_routes(flights_w_routes, tickets_w_routes, airport_codes_v2):
+    """Route fares, both merges, the airport operations cost and the per-route aggregation."""
+    tickets_grouped = fe_create_mean_route_fare_per_passenger(
+        dw_transform_calculate_mean_fare_by_route_to_merge_with_flights(tickets_w_routes))
+    merged_flights_tickets = dw_merge_dataframes_with_fe_route(flights_w_routes, tickets_grouped)
+    master_df = dw_merge_dataframes_with_origin_destination_sizes(merged_flights_tickets,
+                                                                 airport_codes_v2, airport_codes_v2)
+    master_df = fe_calculate_route_airport_operations_cost(master_df)
+
+    return dw_transform_calculate_varied_grouped_means_with_count(master_df)
+
+
+def dw_run_route_pipeline(airport_codes_initial, flights_initial, tickets_initial):
+    """
+    Runs the wrangling pipeline of main.ipynb serially.
+
+    Parameters:
+    - airport_codes_initial, flights_initial, tickets_initial: The raw dataframes
+      as read by pd.read_csv.
+
+    Returns:
+    - grouped_data: The per-route dataframe (the notebook's master_df_grouped_by_route_v1).
+    """
+    airport_codes_v2 = dw_prepare_airport_codes(airport_codes_initial)
+    tickets_v3 = dw_replace_itin_fare_with_group_mean(_clean_tickets(tickets_initial))
+
+    return _aggregate_routes(_clean_flights(flights_initial), fe_create_route(tickets_v3), airport_codes_v2)
+
+
+#=======================================================================================
+# sharded path
+#=======================================================================================
+# Read-only tables shared with the workers. They are set once per worker
+# process by the pool initializer instead of being pickled with every task.
+_WORKER_TABLES = {}
+
+
+def _init_worker(airport_codes_v2):
+    _WORKER_TABLES['airport_codes_v2'] = airport_codes_v2
+
+
+def _run_tickets_shard(tickets_shard):
+    return _clean_tickets(tickets_shard)
+
+
+def _run_route_shard(task):
+    flights_shard, tickets_v2_shard, carrier_means = task
+
+    # the same replacement as dw_replace_itin_fare_with_group_mean, with the carrier means of all tickets
+    fares = tickets_v2_shard['itin_fare']
+    fill = tickets_v2_shard['reporting_carrier'].map(carrier_means)
+    tickets_v3_shard = tickets_v2_shard.assign(itin_fare=fares.mask((fares == 11.0) & fill.notna(), fill))
+
+    # the conversion report is printed once by the parent, not interleaved by every worker
+    rejected = {}
+    grouped_shard = _aggregate_routes(_clean_flights(flights_shard, rejected), fe_create_route(tickets_v3_shard),
+                                      _WORKER_TABLES['airport_codes_v2'])
+
+    return grouped_shard, rejected
+
+
+def dw_partition_by_route(df, n_shards):
+    """
+    Hash-partitions a raw dataframe by its (order independent) route.
+    All rows of a route, and so all duplicate rows, end up in the same shard,
+    in their original order.
+
+    Parameters:
+    - df: A raw flights or tickets dataframe (column names in any case).
+    - n_shards: The number of shards.
+
+    Returns:
+    - shards: A list of n_shards dataframes.
+    """
+    columns = {column.lower(): column for column in df.columns}
+    route_ids = fe_encode_route(df[columns['origin']], df[columns['destination']]).astype(np.int64)
+
+    # multiplicative hashing spreads neighbouring route ids over the shards
+    shard = (route_ids * 2654435761 % 2 ** 32) % n_shards
+    order = np.argsort(shard, kind='stable')
+    bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+
+    return [df.iloc[order[bounds[i]:bounds[i + 1]]] for i in range(n_shards)]
+
+
+def dw_run_route_pipeline_sharded(airport_codes_initial, flights_initial, tickets_initial,
+                                  workers=None, n_shards=None):
+    """
+    Runs the same pipeline as dw_run_route_pipeline in a process pool, one task per
+    route shard, and combines the per-route results.
+
+    The only step that needs all tickets, the carrier fare means of the 11.0 fare
+    imputation, runs in between two parallel phases: the workers first clean their
+    ticket shards, the means are taken over all cleaned tickets in their original
+    order (so they are bit-for-bit the serial means), and then each worker imputes,
+    merges and aggregates its shard.
+    The workers return the tokens their conversions rejected, and the parent prints
+    one conversion report for all shards.
+
+    Parameters:
+    - airport_codes_initial, flights_initial, tickets_initial: The raw dataframes.
+    - workers: The number of processes (default: all cores).
+    - n_shards: The number of route shards (default: 4 per worker, for balance).
+
+    Returns:
+    - grouped_data: The per-route dataframe, identical to dw_run_route_pipeline.
+    """
+    workers = workers or os.cpu_count()
+    n_shards = n_shards or 4 * workers
+
+    airport_codes_v2 = dw_prepare_airport_codes(airport_codes_initial)
+    flights_shards = dw_partition_by_route(flights_initial, n_shards)
+    tickets_shards = dw_partition_by_route(tickets_initial, n_shards)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(airport_codes_v2,)) as pool:
+        tickets_v2_shards = list(pool.map(_run_tickets_shard, tickets_shards))
+
+        fares = pd.concat([shard[['reporting_carrier', 'itin_fare']] for shard in tickets_v2_shards]).sort_index()
+        usable = fares[(fares['itin_fare'] != 11.0) & fares['itin_fare'].notna()]
+        carrier_means = usable.groupby('reporting_carrier')['itin_fare'].mean().dropna()
+
+        tasks = [(flights, tickets, carrier_means) for flights, tickets in zip(flights_shards, tickets_v2_shards)]
+        grouped_shards, rejected_shards = zip(*pool.map(_run_route_shard, tasks))
+
+    for column, dtype in _FLIGHTS_CONVERSIONS.items():
+        rejected = pd.concat([shard[column] for shard in rejected_shards]).groupby(level=0).sum() \
+                     .sort_values(ascending=False, kind='stable')
+        print(f"Successfully converted '{column}' column to dtype {dtype}.")
+        _dw_print_rejected(column, rejected)
+
+    grouped_data = pd.concat(grouped_shards, ignore_index=True)
+
+    return grouped_data.sort_values('fe_route', kind='stable').reset_index(drop=True)
@@ -0,0 +1,337 @@
+#=======================================================================================
+"""
+Pipeline DAG
+
+This file contains a lazy, memoized version of the main.ipynb chain. Instead of
+keeping flights_v1 ... master_df_grouped_by_route_v12 alive as notebook variables,
+the dw_ and fe_ stages are declared once as a DAG of named nodes:
+
+    dag = dw_notebook_dag('Airport_Codes.csv', 'Flights.csv', 'Tickets.csv')
+    dag['master_df_grouped_by_route_v12']        # computes only what v12 needs
+    dw_set_route_economics_parameters(dag, replace(ROUTE_ECONOMICS_DEFAULTS, fomc_cost_per_mile=9))
+    dag['master_df_grouped_by_route_v12']        # reruns only v5 ... v12
+
+Results are memoized. When the cached results exceed the memory budget the least
+recently used ones are dropped and recomputed on demand. Changing a stage's
+parameters invalidates that stage and everything downstream of it, nothing else.
+
+"""
+#=======================================================================================
+import inspect
+import sys
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+import data_wrangling_000 as dw
+import feature_engineering_000 as fe
+from feature_engineering_000 import ROUTE_ECONOMICS_DEFAULTS
+
+#=======================================================================================
+# the DAG
+#=======================================================================================
+@dataclass
+class Stage:
+    """
+    One node of the DAG: the result of function(*inputs, **params).
+    A source node has no function and holds a value given from outside.
+    """
+    name: str
+    function: object = None
+    inputs: tuple = ()
+    params: dict = field(default_factory=dict)
+
+
+# text columns are sized from about this many of their values
+_SIZE_SAMPLE = 1000
+
+
+def _column_bytes(series):
+    """
+    The size of a column: its arrays, plus for text the python strings, estimated
+    from a strided sample instead of measuring every value (memory_usage(deep=True)).
+    """
+    size = series.memory_usage(index=False, deep=False)
+    dtype = series.dtype
+    if not isinstance(dtype, pd.CategoricalDtype) and (pd.api.types.is_object_dtype(dtype)
+                                                       or pd.api.types.is_string_dtype(dtype)):
+        sample = series.iloc[::max(1, len(series) // _SIZE_SAMPLE)].to_numpy(dtype=object)
+        if len(sample):
+            size += len(series) * sum(sys.getsizeof(value) for value in sample) / len(sample)
+    return size
+
+
+def _size_mb(value):
+    if isinstance(value, pd.DataFrame):
+        size = value.index.memory_usage(deep=False) + sum(_column_bytes(value.iloc[:, position])
+                                                           for position in range(value.shape[1]))
+        return size / 1024 ** 2
+    if isinstance(value, pd.Series):
+        return (value.index.memory_usage(deep=False) + _column_bytes(value)) / 1024 ** 2
+    return sys.getsizeof(value) / 1024 ** 2
+
+
+class PipelineDAG:
+    """
+    A DAG of named stages, evaluated lazily with memoized results.
+
+    Most dw_ and fe_ functions add columns to the dataframe they are given. So
+    that memoized results are never modified by a later stage, every stage gets
+    shallow copies of its dataframe inputs (cheap: the column data is shared
+    until it is written to).
+
+    Parameters:
+    - memory_budget_mb: Upper bound for the memoized results. The size of each
+      result is estimated when it is stored (text columns from a sample of their
+      values, so storing stays cheap); results sharing columns are counted in full
+      each, so the bound is conservative.
+    """
+
+    def __init__(self, memory_budget_mb=2048):
+        self.memory_budget_mb = memory_budget_mb
+        self.stages = {}
+        self.stats = Counter()
+        # name -> (value, size in MB), least recently used first
+        self._cache = OrderedDict()
+
+    #-----------------------------------------------------------------------------------
+    # declaring
+    #-----------------------------------------------------------------------------------
+    def add_source(self, name, value):
+        """
+        Adds (or replaces) a node holding a given value, e.g. a raw dataframe.
+        Sources are never evicted, since they cannot be recomputed.
+        Replacing a source invalidates everything downstream of it.
+        """
+        if name in self.stages:
+            self.invalidate(name)
+        self.stages[name] = Stage(name)
+        self._cache[name] = (value, 0.0)
+
+        return self
+
+    def add_stage(self, name, function, inputs=(), **params):
+        """
+        Adds a stage computing function(*[value of each input], **params).
+        The inputs must be declared before, which keeps the graph acyclic.
+        """
+        missing = [node for node in inputs if node not in self.stages]
+        if missing:
+            raise KeyError(f"Stage '{name}' needs undeclared inputs: {missing}")
+        if name in self.stages:
+            self.invalidate(name)
+        self.stages[name] = Stage(name, function, tuple(inputs), dict(params))
+
+        return self
+
+    def downstream(self, name):
+        """
+        Returns the names of all stages depending on a node, directly or not,
+        in declaration (= topological) order.
+        """
+        affected = {name}
+        for stage in self.stages.values():
+            if any(node in affected for node in stage.inputs):
+                affected.add(stage.name)
+        affected.discard(name)
+
+        return [stage for stage in self.stages if stage in affected]
+
+    #-----------------------------------------------------------------------------------
+    # changing
+    #-----------------------------------------------------------------------------------
+    def set_params(self, name, **params):
+        """
+        Updates the parameters of a stage. If any value actually changes, the
+        stage and its downstream stages are invalidated.
+
+        Returns:
+        - changed: Whether anything was invalidated.
+        """
+        stage = self.stages[name]
+        changed = any(key not in stage.params or stage.params[key] != value for key, value in params.items())
+        stage.params.update(params)
+        if changed:
+            self.invalidate(name)
+
+        return changed
+
+    def invalidate(self, name):
+        """
+        Drops the memoized results of a stage (not of a source) and of everything downstream of it.
+        """
+        for node in [name] + self.downstream(name):
+            if self.stages[node].function is not None and node in self._cache:
+                del self._cache[node]
+                self.stats['invalidated'] += 1
+
+    #-----------------------------------------------------------------------------------
+    # evaluating
+    #-----------------------------------------------------------------------------------
+    def get(self, name):
+        """
+        Returns the value of a node, computing only the stages it needs that are
+        not memoized.
+        """
+        if name in self._cache:
+            self._cache.move_to_end(name)
+            self.stats['hits'] += 1
+            return self._cache[name][0]
+
+        stage = self.stages[name]
+        if stage.function is None:
+            raise KeyError(f"Source '{name}' has no value.")
+
+        values = [self.get(node) for node in stage.inputs]
+        values = [value.copy(deep=False) if isinstance(value, (pd.DataFrame, pd.Series)) else value
+                  for value in values]
+        result = stage.function(*values, **stage.params)
+        self.stats['computed'] += 1
+
+        self._cache[name] = (result, _size_mb(result))
+        self._evict(keep=name)
+
+        return result
+
+    __getitem__ = get
+
+    def _evict(self, keep):
+        """Drops the least recently used computed results until the cache fits the budget."""
+        for node in list(self._cache):
+            if self.memory_usage_mb() <= self.memory_budget_mb:
+                break
+            if node != keep and self.stages[node].function is not None:
+                del self._cache[node]
+                self.stats['evicted'] += 1
+
+    def memory_usage_mb(self):
+        """
+        Returns the estimated size of the memoized results in MB.
+        """
+        return sum(size for _, size in self._cache.values())
+
+    def cached(self):
+        """
+        Returns the names of the nodes currently memoized, least recently used first.
+        """
+        return list(self._cache)
+
+
+#=======================================================================================
+# the notebook chain
+#=======================================================================================
+# the per-route fe_ steps of main.ipynb: (node, function, input node)
+_ROUTE_FE_CHAIN = [
+    ('master_df_grouped_by_route_v2', 'fe_create_multiple_mean_values_with_count', 'master_df_grouped_by_route_v1'),
+    ('master_df_grouped_by_route_v3', 'fe_calculate_route_delay_cost', 'master_df_grouped_by_route_v2'),
+    ('master_df_grouped_by_route_v4', 'fe_calculate_round_trip_route_dio_cost', 'master_df_grouped_by_route_v3'),
+    ('master_df_grouped_by_route_v5', 'fe_calculate_round_trip_route_fomc_cost', 'master_df_grouped_by_route_v4'),
+    ('master_df_grouped_by_route_v6', 'fe_calculate_round_trip_route_fare_revenue', 'master_df_grouped_by_route_v5'),
+    ('master_df_grouped_by_route_v7', 'fe_calculate_round_trip_route_baggage_revenue', 'master_df_grouped_by_route_v6'),
+    ('master_df_grouped_by_route_v8', 'fe_calculate_round_trip_total_revenue', 'master_df_grouped_by_route_v7'),
+    ('master_df_grouped_by_route_v9', 'fe_calculate_round_trip_total_variable_cost', 'master_df_grouped_by_route_v8'),
+    ('master_df_grouped_by_route_v10', 'fe_calculate_per_round_trip_route_profit', 'master_df_grouped_by_route_v9'),
+    ('master_df_grouped_by_route_v11',
+     'fe_calculate_break_even_point_in_number_of_round_trip_flights_for_route', 'master_df_grouped_by_route_v10'),
+    ('master_df_grouped_by_route_v12', 'fe_calculate_total_profit_for_route_2019q1', 'master_df_grouped_by_route_v11'),
+]
+
+
+# the RouteEconomicsParameters fields each fe_ stage actually reads
+_PARAMETER_FIELDS = {
+    'fe_calculate_route_airport_operations_cost': ('large_airport_fee', 'medium_airport_fee'),
+    'fe_calculate_route_delay_cost': ('delay_threshold_minutes', 'delay_cost_per_minute'),
+    'fe_calculate_round_trip_route_dio_cost': ('dio_cost_per_mile',),
+    'fe_calculate_round_trip_route_fomc_cost': ('fomc_cost_per_mile',),
+    'fe_calculate_round_trip_route_fare_revenue': ('seats_per_round_trip',),
+    'fe_calculate_round_trip_route_baggage_revenue': ('seats_per_round_trip', 'bag_share', 'bag_fee_per_round_trip'),
+    'fe_calculate_break_even_point_in_number_of_round_trip_flights_for_route': ('aircraft_cost',),
+}
+
+
+def _takes_parameters(function):
+    return 'parameters' in inspect.signature(function).parameters
+
+
+def dw_notebook_dag(airport_codes, flights, tickets, parameters=ROUTE_ECONOMICS_DEFAULTS, memory_budget_mb=2048):
+    """
+    Declares the main.ipynb chain as a PipelineDAG, with the notebook's variable
+    names as node names (airport_codes_initial ... master_df_grouped_by_route_v12).
+
+    Parameters:
+    - airport_codes, flights, tickets: The csv paths, or the raw dataframes.
+    - parameters: The RouteEconomicsParameters of the fe_calculate_* stages.
+    - memory_budget_mb: See PipelineDAG.
+
+    Returns:
+    - dag: The PipelineDAG. Nothing is read or computed until a node is requested.
+    """
+    dag = PipelineDAG(memory_budget_mb)
+
+    for name, source in [('airport_codes', airport_codes), ('flights', flights), ('tickets', tickets)]:
+        if isinstance(source, pd.DataFrame):
+            dag.add_source(f'{name}_csv', source)
+        else:
+            dag.add_stage(f'{name}_csv', pd.read_csv, filepath_or_buffer=source)
+        dag.add_stage(f'{name}_initial', dw.process_dataframe, [f'{name}_csv'])
+
+    dag.add_stage('airport_codes_v1', dw.dw_subset_airport_codes_for_m_l_airports_US_only, ['airport_codes_initial'])
+    dag.add_stage('airport_codes_v2', dw.dw_subset_airport_codes_for_merger, ['airport_codes_v1'])
+
+    dag.add_stage('flights_v1', dw.dw_subset_flights_not_cancelled_only, ['flights_initial'])
+    dag.add_stage('flights_v2', dw.dw_convert_distance_column_to_int, ['flights_v1'])
+    dag.add_stage('flights_v3', dw.dw_convert_air_time_column_to_float, ['flights_v2'])
+
+    dag.add_stage('tickets_v1', dw.dw_subset_tickets_roundtrip_only, ['tickets_initial'])
+    dag.add_stage('tickets_v2', dw.dw_convert_itin_fare_column_to_float, ['tickets_v1'])
+    dag.add_stage('tickets_v3', dw.dw_replace_itin_fare_with_group_mean, ['tickets_v2'])
+
+    dag.add_stage('flights_w_routes', fe.fe_create_route, ['flights_v3'])
+    dag.add_stage('tickets_w_routes', fe.fe_create_route, ['tickets_v3'])
+    dag.add_stage('tickets_w_routes_grouped_v1', dw.dw_transform_calculate_mean_fare_by_route_to_merge_with_flights,
+                  ['tickets_w_routes'])
+    dag.add_stage('tickets_w_routes_grouped_v2', fe.fe_create_mean_route_fare_per_passenger,
+                  ['tickets_w_routes_grouped_v1'])
+
+    dag.add_stage('merged_flights_tickets_v1', dw.dw_merge_dataframes_with_fe_route,
+                  ['flights_w_routes', 'tickets_w_routes_grouped_v2'])
+    dag.add_stage('master_df_initial', dw.dw_merge_dataframes_with_origin_destination_sizes,
+                  ['merged_flights_tickets_v1', 'airport_codes_v2', 'airport_codes_v2'])
+    dag.add_stage('master_df_w_route_airport_operations_cost', fe.fe_calculate_route_airport_operations_cost,
+                  ['master_df_initial'], parameters=parameters)
+    dag.add_stage('master_df_grouped_by_route_v1', dw.dw_transform_calculate_varied_grouped_means_with_count,
+                  ['master_df_w_route_airport_operations_cost'])
+
+    for name, function_name, source in _ROUTE_FE_CHAIN:
+        function = getattr(fe, function_name)
+        params = {'parameters': parameters} if _takes_parameters(function) else {}
+        dag.add_stage(name, function, [source], **params)
+
+    return dag
+
+
+def dw_set_route_economics_parameters(dag, parameters):
+    """
+    Sets the RouteEconomicsParameters of every stage taking them. A stage is only
+    invalidated (with its downstream stages) when a field it reads changes, so e.g.
+    a new fomc_cost_per_mile keeps everything up to master_df_grouped_by_route_v4
+    memoized, while new airport fees rerun the merge-side airport cost and the grouping.
+
+    Returns:
+    - changed: The names of the stages whose parameters changed (their downstream
+      stages were invalidated with them).
+    """
+    changed = []
+    for stage in list(dag.stages.values()):
+        if 'parameters' not in stage.params:
+            continue
+        old = stage.params['parameters']
+        names = _PARAMETER_FIELDS.get(getattr(stage.function, '__name__', None))
+        if names is None or any(getattr(old, name) != getattr(parameters, name) for name in names):
+            if dag.set_params(stage.name, parameters=parameters):
+                changed.append(stage.name)
+        else:
+            stage.params['parameters'] = parameters
+
+    return changed
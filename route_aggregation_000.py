@@ -0,0 +1,455 @@
+#=======================================================================================
+"""
+Route Aggregation
+
+This file contains a streaming version of
+dw_transform_calculate_varied_grouped_means_with_count. Instead of building the
+merged master dataframe (flights x route fares x airport sizes) and grouping it,
+flight chunks are folded into per-route accumulators: a sum and a non-null count
+for every mean column, the set of distinct carriers and a row count.
+
+Accumulators can be merged, so chunks (or workers) can be aggregated separately
+and combined at the end. The finished table matches the one from the notebook
+when duplicate flight rows are dropped across all chunks, as process_dataframe
+drops them from the whole file: reading the flights from csv paths does that.
+
+QuarterlyRouteStore persists one accumulator per quarter. Loading a new quarter
+only writes that partition, and windows over several quarters (last N, year to
+date) are merged from the stored partitions without rescanning any flights.
+
+"""
+#=======================================================================================
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_wrangling_000 import (
+    DEFAULT_CHUNKSIZE,
+    FLIGHTS_NUMERIC_COLUMNS,
+    FLIGHTS_SCHEMA,
+    dw_read_csv_in_chunks,
+    dw_subset_flights_not_cancelled_only,
+)
+from dedup_000 import RowDeduplicator
+from feature_engineering_000 import (
+    IATA_CODE_SPACE,
+    fe_calculate_route_airport_operations_cost,
+    fe_decode_route_ids,
+    fe_encode_airport_codes,
+    fe_encode_route,
+    fe_route_ids_from_labels,
+)
+
+#=======================================================================================
+# accumulators
+#=======================================================================================
+# the columns averaged by dw_transform_calculate_varied_grouped_means_with_count, in order
+MEAN_COLUMNS = [
+    'air_time',
+    'distance',
+    'occupancy_rate',
+    'dep_delay',
+    'arr_delay',
+    'fe_route_airport_operations_cost',
+    'fe_mean_route_fare_per_passenger',
+]
+
+
+class RouteAccumulator:
+    """
+    Per-route running statistics that can be updated with chunks and merged.
+
+    The state is kept in two small dataframes:
+    - totals: indexed by 'fe_route_id', with '<column>_sum' and '<column>_count'
+      for every mean column plus 'row_count'.
+    - carriers: the distinct ('fe_route_id', 'op_carrier') pairs seen so far.
+    """
+
+    def __init__(self, mean_columns=MEAN_COLUMNS):
+        self.mean_columns = list(mean_columns)
+        columns = [f'{column}_{part}' for column in self.mean_columns for part in ('sum', 'count')]
+        self.totals = pd.DataFrame(columns=columns + ['row_count'], dtype=float,
+                                   index=pd.Index([], dtype=np.int64, name='fe_route_id'))
+        self.carriers = pd.DataFrame({'fe_route_id': pd.Series(dtype=np.int64),
+                                      'op_carrier': pd.Series(dtype=object)})
+
+    #-----------------------------------------------------------------------------------
+    def update(self, df, weights=None):
+        """
+        Folds a chunk into the accumulator.
+
+        Parameters:
+        - df: A dataframe with 'fe_route_id', 'op_carrier' and the mean columns.
+        - weights: Optional number of times each row counts (default 1 each).
+          This is how row multiplication by an inner join is accounted for
+          without materializing the join.
+
+        Returns:
+        - self
+        """
+        route_ids = df['fe_route_id'].to_numpy()
+        weights = np.ones(len(df)) if weights is None else np.asarray(weights, dtype=float)
+
+        chunk = {}
+        for column in self.mean_columns:
+            values = df[column].to_numpy(dtype=float, na_value=np.nan)
+            present = ~np.isnan(values)
+            chunk[f'{column}_sum'] = np.where(present, values, 0.0) * weights
+            chunk[f'{column}_count'] = present * weights
+        chunk['row_count'] = weights
+
+        chunk_totals = pd.DataFrame(chunk, index=pd.Index(route_ids, name='fe_route_id'))
+        chunk_totals = chunk_totals[weights > 0].groupby(level=0).sum()
+        self.totals = self.totals.add(chunk_totals, fill_value=0)
+
+        carriers = df.loc[weights > 0, ['fe_route_id', 'op_carrier']].dropna()
+        self.carriers = pd.concat([self.carriers, carriers], ignore_index=True).drop_duplicates()
+
+        return self
+
+    def merge(self, other):
+        """
+        Combines the state of another accumulator into this one.
+
+        Returns:
+        - self
+        """
+        self.totals = self.totals.add(other.totals, fill_value=0)
+        self.carriers = pd.concat([self.carriers, other.carriers], ignore_index=True).drop_duplicates()
+
+        return self
+
+    #-----------------------------------------------------------------------------------
+    def save(self, directory):
+        """
+        Persists the state (not the finished means) as .npy files in a directory.
+        The files are written next to it first. The old directory is then renamed
+        aside, the new one renamed in and only then the old one deleted, so a reader
+        never sees a half-written state and a failed save keeps the old one.
+        """
+        directory = os.fspath(directory).rstrip(os.sep)
+        staging = directory + '.tmp'
+        retired = directory + '.old'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        np.save(os.path.join(staging, 'route_ids.npy'), self.totals.index.to_numpy(dtype=np.int64))
+        np.save(os.path.join(staging, 'totals.npy'), self.totals.to_numpy(dtype=float))
+        np.save(os.path.join(staging, 'carrier_route_ids.npy'), self.carriers['fe_route_id'].to_numpy(dtype=np.int64))
+        np.save(os.path.join(staging, 'carriers.npy'), self.carriers['op_carrier'].to_numpy(dtype=str))
+        with open(os.path.join(staging, 'columns.json'), 'w') as f:
+            json.dump({'mean_columns': self.mean_columns, 'totals': list(self.totals.columns)}, f)
+
+        shutil.rmtree(retired, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, retired)
+        os.replace(staging, directory)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Reads a state written by save().
+        """
+        with open(os.path.join(directory, 'columns.json')) as f:
+            columns = json.load(f)
+
+        accumulator = cls(columns['mean_columns'])
+        accumulator.totals = pd.DataFrame(np.load(os.path.join(directory, 'totals.npy')), columns=columns['totals'],
+                                          index=pd.Index(np.load(os.path.join(directory, 'route_ids.npy')),
+                                                         name='fe_route_id'))
+        accumulator.carriers = pd.DataFrame({
+            'fe_route_id': np.load(os.path.join(directory, 'carrier_route_ids.npy')),
+            'op_carrier': pd.Series(np.load(os.path.join(directory, 'carriers.npy')), dtype=object),
+        })
+
+        return accumulator
+
+    #-----------------------------------------------------------------------------------
+    def result(self, route_column='fe_route'):
+        """
+        Finishes the means and counts. The layout matches the output of
+        dw_transform_calculate_varied_grouped_means_with_count: one row per route
+        (sorted), the mean columns, 'op_carrier' as the distinct carrier count and
+        'fe_number_of_flights_per_route'.
+
+        Parameters:
+        - route_column: 'fe_route' for readable labels, 'fe_route_id' for the ids.
+
+        Returns:
+        - grouped_data: The per-route dataframe.
+        """
+        totals = self.totals.sort_index()
+        grouped_data = pd.DataFrame(index=totals.index)
+
+        for column in self.mean_columns:
+            count = totals[f'{column}_count']
+            grouped_data[column] = (totals[f'{column}_sum'] / count).where(count > 0)
+
+        distinct_carriers = self.carriers.groupby('fe_route_id').size()
+        grouped_data['op_carrier'] = distinct_carriers.reindex(totals.index, fill_value=0).astype(np.int64)
+        grouped_data['fe_number_of_flights_per_route'] = totals['row_count'].round().astype(np.int64)
+
+        grouped_data = grouped_data.reset_index()
+        if route_column == 'fe_route':
+            grouped_data.insert(0, 'fe_route', fe_decode_route_ids(grouped_data.pop('fe_route_id')))
+
+        return grouped_data
+
+
+#=======================================================================================
+# streaming the flights
+#=======================================================================================
+def _airport_size_cost(types):
+    """Per-airport cost of each airport type, as charged by fe_calculate_route_airport_operations_cost."""
+    sized = fe_calculate_route_airport_operations_cost(
+        pd.DataFrame({'type_origin': types, 'type_destination': None}))
+
+    return sized['airport_origin_cost'].to_numpy(dtype=float)
+
+
+def _route_fares_by_id(route_fares):
+    """Returns the route fare table as a series indexed by 'fe_route_id'."""
+    if 'fe_route_id' in route_fares.columns:
+        route_ids = route_fares['fe_route_id'].to_numpy()
+    else:
+        route_ids = fe_route_ids_from_labels(route_fares['fe_route'])
+
+    fares = pd.Series(route_fares['fe_mean_route_fare_per_passenger'].to_numpy(), index=route_ids)
+
+    return fares[fares.index >= 0]
+
+
+def dw_read_flight_chunks(paths, chunksize=DEFAULT_CHUNKSIZE, deduplicator=None):
+    """
+    Reads flight csv files as cleaned chunks (cancelled flights dropped, 'distance'
+    and 'air_time' parsed), with duplicate rows dropped across all chunks and files
+    as process_dataframe drops them from the whole dataframe.
+
+    Parameters:
+    - paths: A csv file path or a list of them.
+    - chunksize: The number of csv rows read at a time.
+    - deduplicator: The RowDeduplicator to drop duplicates with (default: a new one).
+      Pass the same one to several calls to drop duplicates across them too.
+
+    Returns:
+    - a generator of dataframes, one per chunk.
+    """
+    if deduplicator is None:
+        # a deduplicator of its own is closed (and its spilled runs removed) at the end
+        with RowDeduplicator() as deduplicator:
+            yield from dw_read_flight_chunks(paths, chunksize, deduplicator)
+        return
+
+    for path in [paths] if isinstance(paths, (str, os.PathLike)) else paths:
+        yield from dw_read_csv_in_chunks(path, FLIGHTS_SCHEMA, [dw_subset_flights_not_cancelled_only],
+                                         FLIGHTS_NUMERIC_COLUMNS, chunksize, deduplicator=deduplicator)
+
+
+def dw_stream_route_statistics(flights, route_fares, airport_codes, accumulator=None, sketches=None,
+                               chunksize=DEFAULT_CHUNKSIZE, deduplicator=None):
+    """
+    Aggregates flights per route chunk by chunk without building the master dataframe.
+
+    Each chunk is joined to the route fares and the airport sizes by array lookups.
+    A flight counts once for each matching pair of airport rows, exactly as it would
+    appear in the inner merges of dw_merge_dataframes_with_origin_destination_sizes.
+    Each row also gets the 'fe_route_airport_operations_cost' that
+    fe_calculate_route_airport_operations_cost would add.
+
+    The result matches dw_transform_calculate_varied_grouped_means_with_count only if
+    duplicate flight rows are dropped across chunks, as process_dataframe drops them
+    from the whole file. Given csv paths, the flights are read that way
+    (dw_read_flight_chunks). Chunks given directly must already be free of such
+    duplicates, e.g. read with dw_read_csv_in_chunks(..., deduplicator=RowDeduplicator()).
+
+    Parameters:
+    - flights: A flights csv path or a list of them, or an iterable of cleaned flight
+      dataframes without duplicates across them.
+    - route_fares: The route fare table (tickets_w_routes_grouped_v2), keyed by
+      'fe_route' or 'fe_route_id', with 'fe_mean_route_fare_per_passenger'.
+    - airport_codes: The airport codes table with 'iata_code' and 'type' (airport_codes_v2).
+    - accumulator: An optional RouteAccumulator to continue from.
+    - sketches: An optional RouteSketches (route_sketches_000), updated in the same pass.
+    - chunksize: With csv paths, the number of csv rows read at a time.
+    - deduplicator: With csv paths, the RowDeduplicator to use (default: a new one).
+
+    Returns:
+    - accumulator: The RouteAccumulator. Call .result() for the grouped dataframe.
+    """
+    if isinstance(flights, (str, os.PathLike)) or (isinstance(flights, (list, tuple)) and flights
+                                                    and all(isinstance(path, (str, os.PathLike)) for path in flights)):
+        flight_chunks = dw_read_flight_chunks(flights, chunksize, deduplicator)
+    elif deduplicator is not None:
+        # cleaned chunks can no longer be compared with the raw rows process_dataframe compares
+        raise ValueError("A deduplicator needs csv paths; pass it to dw_read_csv_in_chunks for chunks.")
+    else:
+        flight_chunks = flights
+
+    accumulator = accumulator or RouteAccumulator()
+    fares = _route_fares_by_id(route_fares)
+
+    # per airport id: how many airport rows match it, and the sum of their costs
+    airport_ids = fe_encode_airport_codes(airport_codes['iata_code'])
+    known = airport_ids >= 0
+    matches = np.bincount(airport_ids[known], minlength=IATA_CODE_SPACE).astype(float)
+    cost_sums = np.bincount(airport_ids[known], weights=_airport_size_cost(airport_codes['type'])[known],
+                            minlength=IATA_CODE_SPACE)
+
+    for chunk in flight_chunks:
+        origin_ids = fe_encode_airport_codes(chunk['origin'])
+        destination_ids = fe_encode_airport_codes(chunk['destination'])
+        route_ids = fe_encode_route(chunk['origin'], chunk['destination'])
+
+        fare_position = fares.index.get_indexer(route_ids)
+        has_fare = (fare_position >= 0) & (route_ids >= 0)
+
+        origin_matches = np.where(origin_ids >= 0, matches[origin_ids], 0.0)
+        destination_matches = np.where(destination_ids >= 0, matches[destination_ids], 0.0)
+        weights = origin_matches * destination_matches * has_fare
+
+        # mean cost over the joined rows of each flight
+        with np.errstate(invalid='ignore', divide='ignore'):
+            operations_cost = (destination_matches * cost_sums[origin_ids]
+                               + origin_matches * cost_sums[destination_ids]) / (origin_matches * destination_matches)
+
+        chunk = chunk.assign(fe_route_id=route_ids,
+                             fe_mean_route_fare_per_passenger=np.where(has_fare, fares.to_numpy()[fare_position], np.nan),
+                             fe_route_airport_operations_cost=operations_cost)
+        accumulator.update(chunk, weights)
+        if sketches is not None:
+            sketches.update(chunk, weights)
+
+    return accumulator
+
+
+#=======================================================================================
+# quarterly partitions
+#=======================================================================================
+_QUARTER_PATTERN = re.compile(r'^(\d{4})Q([1-4])$')
+
+
+def dw_quarter_labels(dates):
+    """
+    Returns the quarter label ('2019Q1') of each date, e.g. of the 'fl_date' column.
+    """
+    periods = pd.to_datetime(pd.Series(dates)).dt.to_period('Q')
+
+    return periods.astype(str).to_numpy(dtype=object)
+
+
+def _quarter_key(quarter):
+    match = _QUARTER_PATTERN.match(quarter)
+    if match is None:
+        raise ValueError(f"'{quarter}' is not a quarter label like '2019Q1'.")
+    return int(match.group(1)), int(match.group(2))
+
+
+def _check_quarter(quarter):
+    _quarter_key(quarter)
+    return quarter
+
+
+class QuarterlyRouteStore:
+    """
+    Route accumulators persisted per quarter, in one subdirectory per quarter label.
+
+    Parameters:
+    - directory: The root directory of the partitions (created if missing).
+    """
+
+    def __init__(self, directory='route_partitions'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def quarters(self):
+        """
+        Returns the stored quarter labels in time order.
+        """
+        labels = [name for name in os.listdir(self.directory) if _QUARTER_PATTERN.match(name)]
+
+        return sorted(labels, key=_quarter_key)
+
+    #-----------------------------------------------------------------------------------
+    def update(self, quarter, flights, route_fares, airport_codes, append=False, deduplicator=None):
+        """
+        Aggregates the flights of one quarter and stores its partition. No other
+        partition is read or written.
+
+        Parameters:
+        - quarter: The quarter label, e.g. '2019Q2'.
+        - flights, route_fares, airport_codes: As for dw_stream_route_statistics,
+          with that quarter's flights (csv paths, or chunks without duplicates
+          across them) and route fares.
+        - append: Add the flights to the stored partition (late-arriving flights)
+          instead of replacing it. The partition keeps totals, not rows, so the new
+          flights must not repeat rows already loaded; pass the deduplicator of the
+          earlier loads to drop such repeats.
+        - deduplicator: With csv paths, the RowDeduplicator to use (default: a new one).
+
+        Returns:
+        - accumulator: The RouteAccumulator of the quarter.
+        """
+        path = os.path.join(self.directory, _check_quarter(quarter))
+        accumulator = RouteAccumulator.load(path) if append and os.path.exists(path) else None
+
+        accumulator = dw_stream_route_statistics(flights, route_fares, airport_codes, accumulator,
+                                                 deduplicator=deduplicator)
+        accumulator.save(path)
+
+        return accumulator
+
+    def load(self, quarter):
+        """
+        Returns the stored RouteAccumulator of a quarter.
+        """
+        return RouteAccumulator.load(os.path.join(self.directory, _check_quarter(quarter)))
+
+    def drop(self, quarter):
+        """
+        Deletes the partition of a quarter.
+        """
+        shutil.rmtree(os.path.join(self.directory, _check_quarter(quarter)))
+
+    #-----------------------------------------------------------------------------------
+    def window(self, quarters):
+        """
+        Merges the partitions of the given quarters into one accumulator.
+        """
+        quarters = list(quarters)
+        if not quarters:
+            raise ValueError("The window contains no stored quarter.")
+
+        accumulator = self.load(quarters[0])
+        for quarter in quarters[1:]:
+            accumulator.merge(self.load(quarter))
+
+        return accumulator
+
+    def last_n_quarters(self, n, through=None):
+        """
+        Returns the merged accumulator of the last n stored quarters, up to and
+        including the quarter 'through' (default: the latest one).
+        """
+        if n < 1:
+            raise ValueError(f"n must be at least 1, got {n}.")
+        quarters = self.quarters()
+        if through is not None:
+            quarters = [quarter for quarter in quarters if _quarter_key(quarter) <= _quarter_key(through)]
+
+        return self.window(quarters[-n:])
+
+    def year_to_date(self, year, through=None):
+        """
+        Returns the merged accumulator of the stored quarters of a year, up to and
+        including the quarter 'through' (default: all of them).
+        """
+        quarters = [quarter for quarter in self.quarters() if _quarter_key(quarter)[0] == year]
+        if through is not None:
+            quarters = [quarter for quarter in quarters if _quarter_key(quarter) <= _quarter_key(through)]
+
+        return self.window(quarters)
@@ -0,0 +1,220 @@
+#=======================================================================================
+"""
+Route Bootstrap
+
+This file contains bootstrap confidence intervals for the route profit, total profit
+and break-even features. The fe_ chain computes them from route means, so a route
+with 3 flights ranks next to one with 3,000 as if both means were equally certain.
+
+The flights behind dw_transform_calculate_varied_grouped_means_with_count (the
+merged per-flight table, master_df_w_route_airport_operations_cost) are resampled
+with replacement within each route, the route means are recomputed from every
+resample, and fe_route_economics_arrays turns them into one profit per route and
+resample. All routes are resampled at once: the flights are sorted by route, a
+batch of resamples is one (resamples x flights) array of random row positions,
+and the means are np.add.reduceat sums over the route boundaries. There is no
+per-route Python loop. Batches can be spread over processes (workers=...), each
+with its own independent random stream, and the result does not depend on the
+number of workers.
+
+The fare and the airport operations cost are the same for every flight of a route
+(they are merged on per route), so they are not resampled.
+
+Every resample of a route with one flight is that flight, so its interval would have
+zero width and make the least certain routes look exactly known. Routes with fewer
+than min_flights flights (default 2) get NaN intervals instead.
+
+"""
+#=======================================================================================
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering_000 import ROUTE_ECONOMICS_DEFAULTS, fe_route_economics_arrays
+
+# per-flight columns of the merged table resampled for the ROUTE_ECONOMICS_INPUTS keys
+RESAMPLED_COLUMNS = {
+    'distance': 'distance',
+    'occupancy_rate': 'occupancy_rate',
+    'dep_delay': 'dep_delay',
+    'arr_delay': 'arr_delay',
+}
+# per-route constants of the merged table
+ROUTE_CONSTANT_COLUMNS = {
+    'fare': 'fe_mean_route_fare_per_passenger',
+    'airport_cost': 'fe_route_airport_operations_cost',
+}
+INTERVAL_METRICS = [
+    'fe_per_round_trip_route_profit',
+    'fe_total_profit_for_route_2019q1',
+    'fe_break_even_point_in_number_of_round_trip_flights_for_route',
+]
+
+# resamples per batch are chosen so that a batch draws about this many flight rows
+_BATCH_DRAWS = 10_000_000
+
+# per-worker copy of the sorted flight arrays, set once by the pool initializer
+_WORKER_ARRAYS = {}
+
+
+#=======================================================================================
+# resampling
+#=======================================================================================
+def _route_arrays(master_df, route_column):
+    """The per-flight columns sorted by route, with the route boundaries and constants."""
+    codes, routes = pd.factorize(master_df[route_column], sort=True)
+    # rows without a route are left out, as by the groupby
+    master_df, codes = master_df[codes >= 0], codes[codes >= 0]
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes, minlength=len(routes))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    values = np.column_stack([master_df[column].to_numpy(dtype=float, na_value=np.nan)[order]
+                              for column in RESAMPLED_COLUMNS.values()])
+    constants = {name: master_df[column].groupby(codes).mean().to_numpy(dtype=float, na_value=np.nan)
+                 for name, column in ROUTE_CONSTANT_COLUMNS.items()}
+
+    return {
+        'routes': routes,
+        'starts': starts,
+        'sizes': sizes,
+        # a NaN is left out of a mean, as in the groupby: sum the filled values, count the valid ones
+        'filled': np.nan_to_num(values),
+        'valid': (~np.isnan(values)).astype(float),
+        'constants': constants,
+    }
+
+
+def _resample_profits(arrays, n_resamples, seed, parameters, batch_draws=_BATCH_DRAWS):
+    """
+    The per-round-trip profit of every route for n_resamples resamples.
+
+    Returns:
+    - profits: A (n_resamples, routes) float array.
+    """
+    starts, sizes = arrays['starts'], arrays['sizes']
+    route_starts = np.repeat(starts, sizes)
+    route_sizes = np.repeat(sizes, sizes)
+    rng = np.random.default_rng(seed)
+
+    profits = np.empty((n_resamples, len(starts)))
+    batch = max(1, batch_draws // max(len(route_starts), 1))
+    for first in range(0, n_resamples, batch):
+        count = min(batch, n_resamples - first)
+        # row positions: each draw stays within the flights of its own route
+        positions = route_starts + (rng.random((count, len(route_starts))) * route_sizes).astype(np.int64)
+
+        inputs = dict(arrays['constants'], flights=sizes)
+        for column, name in enumerate(RESAMPLED_COLUMNS):
+            sums = np.add.reduceat(arrays['filled'][positions, column], starts, axis=1)
+            counts = np.add.reduceat(arrays['valid'][positions, column], starts, axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                inputs[name] = sums / counts
+        profits[first:first + count] = fe_route_economics_arrays(inputs, parameters)['fe_per_round_trip_route_profit']
+
+    return profits
+
+
+def _init_worker(arrays):
+    _WORKER_ARRAYS.update(arrays)
+
+
+def _run_resample_task(task):
+    n_resamples, seed, parameters, batch_draws = task
+    return _resample_profits(_WORKER_ARRAYS, n_resamples, seed, parameters, batch_draws)
+
+
+#=======================================================================================
+# features
+#=======================================================================================
+def fe_bootstrap_route_profit_intervals(master_df, parameters=ROUTE_ECONOMICS_DEFAULTS, n_resamples=1000,
+                                        confidence=0.9, seed=0, workers=1, route_column='fe_route',
+                                        batch_draws=_BATCH_DRAWS, min_flights=2):
+    """
+    Bootstraps percentile confidence intervals of the route profit features.
+
+    The break-even interval comes from the profit interval (break-even = aircraft cost
+    / profit falls as the profit rises), with inf where the profit bound is not
+    positive: at that end of the interval the route never breaks even.
+
+    Parameters:
+    - master_df: The merged per-flight table that dw_transform_calculate_varied_grouped_means_with_count
+      groups ('fe_route', 'distance', 'occupancy_rate', 'dep_delay', 'arr_delay',
+      'fe_mean_route_fare_per_passenger', 'fe_route_airport_operations_cost').
+    - parameters: The RouteEconomicsParameters.
+    - n_resamples: The number of bootstrap resamples.
+    - confidence: The coverage of the intervals (0.9 = 5th to 95th percentile).
+    - seed: Seed of the random streams; the same seed gives the same intervals for
+      any number of workers.
+    - workers: The number of processes (1 = in this process).
+    - route_column: The route key ('fe_route' or 'fe_route_id').
+    - batch_draws: About how many flight rows one batch draws (bounds the memory).
+    - min_flights: Routes with fewer flights get NaN intervals and standard error
+      (a route with one flight would get a zero-width interval).
+
+    Returns:
+    - intervals: A dataframe per route with '<metric>_ci_low' and '<metric>_ci_high'
+      for the INTERVAL_METRICS and 'fe_per_round_trip_route_profit_se' (the bootstrap
+      standard error), NaN for the routes below min_flights.
+    """
+    arrays = _route_arrays(master_df, route_column)
+
+    # one independent stream per chunk of 100 resamples, whoever computes it
+    chunks = [min(100, n_resamples - first) for first in range(0, n_resamples, 100)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(count, chunk_seed, parameters, batch_draws) for count, chunk_seed in zip(chunks, seeds)]
+
+    if workers == 1:
+        profits = [_resample_profits(arrays, *task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(arrays,)) as pool:
+            profits = list(pool.map(_run_resample_task, tasks))
+    profits = np.concatenate(profits)
+
+    tail = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # routes whose profit is NaN in every resample ('All-NaN slice', 'Degrees of freedom <= 0')
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanquantile(profits, [tail, 1 - tail], axis=0)
+        standard_error = np.nanstd(profits, axis=0, ddof=1)
+    flights = arrays['sizes']
+    too_few = flights < min_flights
+    low[too_few] = high[too_few] = standard_error[too_few] = np.nan
+    with np.errstate(divide='ignore'):
+        break_even_low = np.where(high > 0, parameters.aircraft_cost / high, np.inf)
+        break_even_high = np.where(low > 0, parameters.aircraft_cost / low, np.inf)
+    unknown = np.isnan(low)
+
+    return pd.DataFrame({
+        route_column: arrays['routes'],
+        'fe_per_round_trip_route_profit_ci_low': low,
+        'fe_per_round_trip_route_profit_ci_high': high,
+        'fe_per_round_trip_route_profit_se': standard_error,
+        'fe_total_profit_for_route_2019q1_ci_low': low * flights,
+        'fe_total_profit_for_route_2019q1_ci_high': high * flights,
+        'fe_break_even_point_in_number_of_round_trip_flights_for_route_ci_low': np.where(unknown, np.nan, break_even_low),
+        'fe_break_even_point_in_number_of_round_trip_flights_for_route_ci_high': np.where(unknown, np.nan, break_even_high),
+    })
+
+
+def fe_add_route_profit_intervals(df, intervals, route_column='fe_route'):
+    """
+    Adds the columns of fe_bootstrap_route_profit_intervals to the grouped route table.
+
+    Parameters:
+    - df: The grouped route table.
+    - intervals: The result of fe_bootstrap_route_profit_intervals.
+    - route_column: The route key both tables have.
+
+    Returns:
+    - df: The input dataframe with the interval columns added (NaN for routes not bootstrapped).
+    """
+    matched = intervals.set_index(route_column).reindex(df[route_column].to_numpy())
+    for column in matched.columns:
+        df[column] = matched[column].to_numpy()
+
+    return df
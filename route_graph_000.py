@@ -0,0 +1,221 @@
+#=======================================================================================
+"""
+Route Graph
+
+This file contains a graph index over the final grouped route table, for the
+network questions the flat groupby keys cannot answer: the degree of the hubs,
+which medium airports connect to which large hubs, and which airports are
+reachable within N legs.
+
+The airports are numbered 0..n-1 (in IATA code order) and the routes are stored
+as CSR adjacency arrays: the neighbors of airport i are
+indices[indptr[i]:indptr[i + 1]], sorted, and every per-route metric (flights,
+mean profit, ...) is an array aligned with indices. The routes are undirected
+(fe_encode_route does not tell ATL->LGA from LGA->ATL), so each one is stored in
+both directions. A route from an airport to itself is not an edge.
+
+All queries are array operations over indptr/indices; the k-hop search expands a
+whole frontier per leg.
+
+    graph = AirportRouteGraph(master_df_grouped_by_route_v12, airport_codes_v2)
+    graph.degree().nlargest(10)
+    graph.connections('medium', 'large', min_flights=100)
+    graph.k_hop(['TWF'], 2)
+
+"""
+#=======================================================================================
+import numpy as np
+import pandas as pd
+
+from feature_engineering_000 import (
+    IATA_CODE_SPACE,
+    fe_decode_airport_ids,
+    fe_encode_airport_codes,
+    fe_route_ids_from_labels,
+)
+
+# edge metric name -> column of the route table
+EDGE_METRICS = {
+    'flights': 'fe_number_of_flights_per_route',
+    'profit': 'fe_per_round_trip_route_profit',
+}
+
+# airport sizes as stored per airport
+AIRPORT_SIZES = {'unknown': 0, 'medium': 1, 'large': 2}
+_AIRPORT_TYPES = {'medium_airport': AIRPORT_SIZES['medium'], 'large_airport': AIRPORT_SIZES['large']}
+
+
+#=======================================================================================
+# the graph
+#=======================================================================================
+class AirportRouteGraph:
+    """
+    CSR adjacency of the airports, with per-route metrics on the edges.
+
+    Parameters:
+    - df: The grouped route table with 'fe_route' (or 'fe_route_id') and the metric columns.
+    - airport_codes: Optional airport codes table ('iata_code', 'type'), for the
+      airport sizes (airport_codes_v2: the medium and large US airports).
+    - metrics: A dict of edge metric name -> route table column (default: EDGE_METRICS,
+      those present in df).
+    """
+
+    def __init__(self, df, airport_codes=None, metrics=None):
+        route_ids = df['fe_route_id'].to_numpy(dtype=np.int64) if 'fe_route_id' in df.columns \
+            else fe_route_ids_from_labels(df['fe_route']).astype(np.int64)
+        metrics = {name: column for name, column in (metrics or EDGE_METRICS).items() if column in df.columns}
+
+        usable = (route_ids >= 0) & (route_ids // IATA_CODE_SPACE != route_ids % IATA_CODE_SPACE)
+        low, high = route_ids[usable] // IATA_CODE_SPACE, route_ids[usable] % IATA_CODE_SPACE
+        values = {name: df[column].to_numpy(dtype=float, na_value=np.nan)[usable] for name, column in metrics.items()}
+
+        # compact airport numbers: the position in the sorted airport ids
+        self.airport_ids, ends = np.unique(np.concatenate([low, high]), return_inverse=True)
+        source = ends
+        target = np.concatenate([ends[len(low):], ends[:len(low)]])
+        order = np.lexsort((target, source))
+
+        self.indices = target[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(source, minlength=len(self.airport_ids)))])
+        self.edges = {name: np.concatenate([value, value])[order] for name, value in values.items()}
+        # the airport of every stored edge (the CSR rows expanded)
+        self.sources = source[order]
+        self.codes = fe_decode_airport_ids(self.airport_ids).astype(str)
+
+        self.sizes = np.zeros(len(self.airport_ids), dtype=np.int8)
+        if airport_codes is not None:
+            types = airport_codes['type'].map(_AIRPORT_TYPES).fillna(AIRPORT_SIZES['unknown']).to_numpy(dtype=np.int8)
+            ids = fe_encode_airport_codes(airport_codes['iata_code'])
+            position = np.searchsorted(self.airport_ids, ids)
+            known = (ids >= 0) & (position < len(self.airport_ids))
+            known[known] = self.airport_ids[position[known]] == ids[known]
+            self.sizes[position[known]] = types[known]
+
+    def __len__(self):
+        return len(self.airport_ids)
+
+    #-----------------------------------------------------------------------------------
+    def ids(self, codes):
+        """
+        Returns the graph numbers of IATA codes (-1 for airports not in the graph).
+        """
+        ids = fe_encode_airport_codes(pd.Series(np.atleast_1d(np.asarray(codes, dtype=object))))
+        position = np.minimum(np.searchsorted(self.airport_ids, ids), max(len(self) - 1, 0))
+        found = (ids >= 0) & (self.airport_ids[position] == ids) if len(self) else np.zeros(len(ids), dtype=bool)
+        return np.where(found, position, -1)
+
+    def _edge_mask(self, min_flights):
+        if min_flights is None:
+            return np.ones(len(self.indices), dtype=bool)
+        return self.edges['flights'] >= min_flights
+
+    def _edge_positions(self, airports):
+        """The positions in indices of all edges of the given airports."""
+        starts, stops = self.indptr[airports], self.indptr[airports + 1]
+        lengths = stops - starts
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return offsets + np.arange(lengths.sum())
+
+    #-----------------------------------------------------------------------------------
+    def degree(self, weight=None, min_flights=None, neighbor_size=None):
+        """
+        Returns the degree of every airport: its number of routes, or the sum of an
+        edge metric over them (e.g. weight='flights').
+
+        Parameters:
+        - weight: Optional edge metric to sum instead of counting.
+        - min_flights: Only count routes with at least this many flights.
+        - neighbor_size: Only count routes to 'medium' or 'large' airports.
+
+        Returns:
+        - degree: A series indexed by IATA code.
+        """
+        mask = self._edge_mask(min_flights)
+        if neighbor_size is not None:
+            mask &= self.sizes[self.indices] == AIRPORT_SIZES[neighbor_size]
+        values = np.where(mask, 1.0 if weight is None else self.edges[weight], 0.0)
+        degree = np.bincount(self.sources, weights=values, minlength=len(self))
+
+        return pd.Series(degree.astype(np.int64) if weight is None else degree, index=self.codes,
+                         name='degree' if weight is None else weight)
+
+    def neighbors(self, airports, min_flights=None):
+        """
+        Returns the routes of some airports with their edge metrics.
+
+        Parameters:
+        - airports: An IATA code or a list of them.
+        - min_flights: Only routes with at least this many flights.
+
+        Returns:
+        - routes: A dataframe with 'airport', 'neighbor', 'neighbor_size' and the edge metrics.
+        """
+        ids = self.ids(airports)
+        ids = ids[ids >= 0]
+        positions = self._edge_positions(ids)
+        keep = self._edge_mask(min_flights)[positions]
+        sources = np.repeat(ids, np.diff(self.indptr)[ids])[keep]
+        positions = positions[keep]
+        neighbors = self.indices[positions]
+
+        size_names = np.array(list(AIRPORT_SIZES))
+        return pd.DataFrame({
+            'airport': self.codes[sources],
+            'neighbor': self.codes[neighbors],
+            'neighbor_size': size_names[self.sizes[neighbors]],
+            **{name: values[positions] for name, values in self.edges.items()},
+        })
+
+    def connections(self, from_size='medium', to_size='large', min_flights=None):
+        """
+        Returns every route between two airport size classes, e.g. which medium
+        airports connect to which large hubs.
+
+        Returns:
+        - routes: A dataframe with 'airport' (of from_size), 'neighbor' (of to_size)
+          and the edge metrics, sorted by airport.
+        """
+        sources = self.sources
+        mask = (self._edge_mask(min_flights) & (self.sizes[sources] == AIRPORT_SIZES[from_size])
+                & (self.sizes[self.indices] == AIRPORT_SIZES[to_size]))
+        if from_size == to_size:
+            # each route once
+            mask &= sources < self.indices
+
+        return pd.DataFrame({
+            'airport': self.codes[sources[mask]],
+            'neighbor': self.codes[self.indices[mask]],
+            **{name: values[mask] for name, values in self.edges.items()},
+        })
+
+    def k_hop(self, airports, k, min_flights=None):
+        """
+        Returns the airports reachable from some airports within k legs.
+
+        Parameters:
+        - airports: An IATA code or a list of them (the start set).
+        - k: The maximum number of legs.
+        - min_flights: Only travel routes with at least this many flights.
+
+        Returns:
+        - hops: A series of the fewest legs to each reachable airport (0 for the
+          start set), indexed by IATA code, nearest first.
+        """
+        hops = np.full(len(self), -1, dtype=np.int64)
+        frontier = self.ids(airports)
+        frontier = np.unique(frontier[frontier >= 0])
+        hops[frontier] = 0
+        usable = self._edge_mask(min_flights)
+
+        for leg in range(1, k + 1):
+            if not len(frontier):
+                break
+            positions = self._edge_positions(frontier)
+            reached = np.unique(self.indices[positions[usable[positions]]])
+            frontier = reached[hops[reached] < 0]
+            hops[frontier] = leg
+
+        reachable = np.flatnonzero(hops >= 0)
+        order = np.argsort(hops[reachable], kind='stable')
+
+        return pd.Series(hops[reachable][order], index=self.codes[reachable][order], name='hops')
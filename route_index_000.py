@@ -0,0 +1,205 @@
+#=======================================================================================
+"""
+Route Index
+
+This file contains a ranking index over the final grouped route table
+(master_df_grouped_by_route_v12). The notebook answers its questions by sorting
+the whole table each time:
+
+    master_df_grouped_by_route_v12.sort_values(by='fe_route_delay_cost', ascending=False).head(20)
+    grouped_profit_df.nlargest(10, 'fe_total_profit_for_route_2019q1')
+
+RouteRankingIndex sorts each ranked metric once. A top-K or bottom-K query then
+walks the presorted order block by block, applying the filters (airport sizes,
+flight count, carrier count) only until K routes are found. New or changed routes
+go into a small unsorted delta that is merged at query time and folded into the
+presorted order once it grows too large.
+
+"""
+#=======================================================================================
+import numpy as np
+import pandas as pd
+
+from feature_engineering_000 import (
+    ROUTE_ECONOMICS_DEFAULTS,
+    RouteEconomicsParameters,
+    fe_route_airport_fees,
+    fe_route_ids_from_labels,
+)
+
+# the metrics the notebook ranks routes by (only those present in the table are indexed)
+RANKED_METRICS = [
+    'fe_total_profit_for_route_2019q1',
+    'fe_per_round_trip_route_profit',
+    'fe_route_delay_cost',
+    'fe_number_of_flights_per_route',
+    'fe_break_even_point_in_number_of_round_trip_flights_for_route',
+    'fe_route_mean_dep_delay',
+]
+
+# airport_size filter values -> number of large endpoints of the route
+AIRPORT_SIZES = {'medium': 0, 'mixed': 1, 'large': 2}
+
+# positions of the presorted order checked per step of a query
+_BLOCK = 1024
+
+
+#=======================================================================================
+# the index
+#=======================================================================================
+class RouteRankingIndex:
+    """
+    Presorted orders of the ranked metrics of a route table, for top-K / bottom-K queries.
+
+    Parameters:
+    - df: The grouped route table with 'fe_route', 'fe_number_of_flights_per_route',
+      'fe_route_distinct_op_carrier_count' and the metrics.
+    - metrics: The columns to index (default: the RANKED_METRICS present in df).
+    - airport_codes: The airport codes table ('iata_code', 'type'), used to tell the
+      airport sizes of each route. Without it they are read off
+      'fe_route_airport_operations_cost' with the fees of parameters.
+    - parameters: The RouteEconomicsParameters the table was computed with.
+    - rebuild_fraction: The delta is folded into the presorted orders once it holds
+      more than this share of the indexed routes.
+    """
+
+    def __init__(self, df, metrics=None, airport_codes=None, parameters=ROUTE_ECONOMICS_DEFAULTS,
+                 rebuild_fraction=0.1):
+        self.metrics = [metric for metric in (metrics or RANKED_METRICS) if metric in df.columns]
+        self.airport_codes = airport_codes
+        self.parameters = parameters
+        self.rebuild_fraction = rebuild_fraction
+        self.stats = {'rebuilds': 0, 'updates': 0}
+
+        self._frame = df.reset_index(drop=True)
+        self._large_endpoints = self._count_large_endpoints(self._frame)
+        self._rebuild()
+
+    #-----------------------------------------------------------------------------------
+    def _count_large_endpoints(self, df):
+        if self.airport_codes is not None:
+            route_ids = df['fe_route_id'].to_numpy() if 'fe_route_id' in df.columns \
+                else fe_route_ids_from_labels(df['fe_route'])
+            only_large = RouteEconomicsParameters(large_airport_fee=1, medium_airport_fee=0)
+            return fe_route_airport_fees(route_ids, self.airport_codes, only_large)
+
+        cost = df['fe_route_airport_operations_cost'].to_numpy(dtype=float, na_value=np.nan)
+        large, medium = self.parameters.large_airport_fee, self.parameters.medium_airport_fee
+        return np.round((cost - 2 * medium) / (large - medium))
+
+    def _rebuild(self):
+        """Sorts every metric over the live rows and empties the delta."""
+        live = self._frame.index.to_numpy()
+        self._alive = np.ones(len(self._frame), dtype=bool)
+        self._positions = pd.Series(live, index=self._frame['fe_route'].to_numpy())
+        self._delta = np.array([], dtype=np.int64)
+
+        self._values, self._ascending, self._descending = {}, {}, {}
+        for metric in self.metrics:
+            values = self._frame[metric].to_numpy(dtype=float, na_value=np.nan)
+            present = np.flatnonzero(~np.isnan(values))
+            self._values[metric] = values
+            # stable sorts: ties keep the table order, as in nsmallest / nlargest
+            self._ascending[metric] = present[np.argsort(values[present], kind='stable')]
+            self._descending[metric] = present[np.argsort(-values[present], kind='stable')]
+
+        self.stats['rebuilds'] += 1
+
+    #-----------------------------------------------------------------------------------
+    def update(self, rows):
+        """
+        Adds new routes, or replaces the rows of routes already indexed.
+
+        Parameters:
+        - rows: A dataframe with the same columns as the indexed table, one row per route.
+
+        Returns:
+        - self
+        """
+        rows = rows.reset_index(drop=True)
+        replaced = self._positions.reindex(rows['fe_route'].to_numpy()).dropna().to_numpy(dtype=np.int64)
+        self._alive[replaced] = False
+
+        start = len(self._frame)
+        self._frame = pd.concat([self._frame, rows], ignore_index=True)
+        self._large_endpoints = np.concatenate([self._large_endpoints, self._count_large_endpoints(rows)])
+        self._alive = np.concatenate([self._alive, np.ones(len(rows), dtype=bool)])
+        new_positions = np.arange(start, start + len(rows))
+        self._positions = pd.concat([self._positions.drop(rows['fe_route'].to_numpy(), errors='ignore'),
+                                     pd.Series(new_positions, index=rows['fe_route'].to_numpy())])
+        self._delta = np.concatenate([self._delta, new_positions])
+        for metric in self.metrics:
+            self._values[metric] = np.concatenate([self._values[metric],
+                                                   rows[metric].to_numpy(dtype=float, na_value=np.nan)])
+        self.stats['updates'] += 1
+
+        if len(self._delta) + (~self._alive).sum() > self.rebuild_fraction * len(self._positions):
+            self._frame = self._frame[self._alive].reset_index(drop=True)
+            self._large_endpoints = self._large_endpoints[self._alive]
+            self._rebuild()
+
+        return self
+
+    #-----------------------------------------------------------------------------------
+    def _mask(self, positions, min_flights, min_carriers, max_carriers, airport_size):
+        """Whether each row passes the filters (and is still live)."""
+        keep = self._alive[positions]
+        if min_flights is not None:
+            keep &= self._frame['fe_number_of_flights_per_route'].to_numpy()[positions] >= min_flights
+        if min_carriers is not None:
+            keep &= self._frame['fe_route_distinct_op_carrier_count'].to_numpy()[positions] >= min_carriers
+        if max_carriers is not None:
+            keep &= self._frame['fe_route_distinct_op_carrier_count'].to_numpy()[positions] <= max_carriers
+        if airport_size is not None:
+            keep &= self._large_endpoints[positions] == AIRPORT_SIZES[airport_size]
+        return keep
+
+    def _query(self, metric, k, largest, filters):
+        if metric not in self._values:
+            raise KeyError(f"'{metric}' is not indexed.")
+        if filters.get('airport_size') not in (None, *AIRPORT_SIZES):
+            raise ValueError(f"airport_size must be one of {list(AIRPORT_SIZES)}.")
+
+        # presorted part: walk blocks until k rows pass the filters
+        order = self._descending[metric] if largest else self._ascending[metric]
+        found = []
+        for start in range(0, len(order), _BLOCK):
+            block = order[start:start + _BLOCK]
+            found.append(block[self._mask(block, **filters)])
+            if sum(len(part) for part in found) >= k:
+                break
+        found = np.concatenate(found)[:k] if found else np.array([], dtype=np.int64)
+
+        # delta part: small, so it is filtered and sorted at query time
+        values = self._values[metric]
+        delta = self._delta[self._mask(self._delta, **filters) & ~np.isnan(values[self._delta])]
+        if len(delta):
+            candidates = np.concatenate([found, delta])
+            ranked = np.argsort(-values[candidates] if largest else values[candidates], kind='stable')
+            found = candidates[ranked[:k]]
+
+        return self._frame.iloc[found]
+
+    def top(self, metric, k=10, min_flights=None, min_carriers=None, max_carriers=None, airport_size=None):
+        """
+        Returns the k routes with the largest values of a metric.
+
+        Parameters:
+        - metric: An indexed column, e.g. 'fe_total_profit_for_route_2019q1'.
+        - k: The number of routes.
+        - min_flights: Only routes with at least this 'fe_number_of_flights_per_route'.
+        - min_carriers, max_carriers: Bounds of 'fe_route_distinct_op_carrier_count'.
+        - airport_size: 'large' (both ends large airports), 'medium' (both medium) or 'mixed'.
+
+        Returns:
+        - routes: The rows of the route table, best first.
+        """
+        return self._query(metric, k, True, dict(min_flights=min_flights, min_carriers=min_carriers,
+                                                 max_carriers=max_carriers, airport_size=airport_size))
+
+    def bottom(self, metric, k=10, min_flights=None, min_carriers=None, max_carriers=None, airport_size=None):
+        """
+        Returns the k routes with the smallest values of a metric. Same filters as top().
+        """
+        return self._query(metric, k, False, dict(min_flights=min_flights, min_carriers=min_carriers,
+                                                  max_carriers=max_carriers, airport_size=airport_size))
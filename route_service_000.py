@@ -0,0 +1,286 @@
+#=======================================================================================
+"""
+Route Service
+
+This file contains a small local HTTP/JSON service over the final route table
+(master_df_grouped_by_route_v12), so a route's economics can be looked up without
+reopening main.ipynb. The table is loaded once and kept in memory:
+
+- GET /route/ABE_ATL                   one route (either code order)
+- GET /top?metric=...&k=10             top-K (order=asc for bottom-K; min_flights,
+                                       min_carriers, max_carriers, airport_size filters)
+- GET /whatif?fomc_cost_per_mile=9     the routes re-evaluated with other
+      &route=ABE_ATL&k=10              RouteEconomicsParameters (one route, or summary and top-K)
+- GET /stats                           request latency percentiles and what-if cache hits
+
+Point lookups return JSON encoded once at start-up. What-if evaluations are kept
+in an LRU cache keyed on the (frozen, hashable) parameters.
+
+    python route_service_000.py --table master_df_grouped_by_route_v12.csv --port 8765
+
+"""
+#=======================================================================================
+import argparse
+import functools
+import json
+import math
+import time
+from collections import defaultdict, deque
+from dataclasses import fields, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering_000 import (
+    ROUTE_ECONOMICS_COLUMNS,
+    ROUTE_ECONOMICS_DEFAULTS,
+    ROUTE_ECONOMICS_INPUTS,
+    RouteEconomicsParameters,
+    fe_calculate_route_economics,
+)
+from route_index_000 import RouteRankingIndex
+
+PARAMETER_TYPES = {field.name: field.type for field in fields(RouteEconomicsParameters)}
+
+# latencies kept per endpoint for the percentiles
+_LATENCY_WINDOW = 10_000
+
+
+def _json_value(value):
+    """numpy scalars to Python, NaN and inf to null (JSON has no NaN)."""
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if not math.isfinite(value) else float(value)
+    return value
+
+
+def _records(df):
+    return [{column: _json_value(value) for column, value in row.items()} for row in df.to_dict(orient='records')]
+
+
+def _route_key(route):
+    """'ATL_ABE' and 'ABE_ATL' are the same route: the codes are kept in sorted order."""
+    codes = unquote(route).upper().split('_')
+    return '_'.join(sorted(codes)) if len(codes) == 2 else unquote(route)
+
+
+class ServiceError(Exception):
+    """A request the service cannot answer, with the HTTP status to answer it with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+#=======================================================================================
+# the service
+#=======================================================================================
+class RouteService:
+    """
+    The query logic, independent of HTTP (so it can be used in-process too).
+
+    Parameters:
+    - df: The final route table, with 'fe_route' and the fe_ columns.
+    - airport_codes: Optional airport codes table; needed for what-if requests
+      that change the airport fees.
+    - cache_size: The number of what-if parameter sets kept.
+    """
+
+    def __init__(self, df, airport_codes=None, cache_size=128):
+        self.df = df.reset_index(drop=True)
+        self.airport_codes = airport_codes
+        self.index = RouteRankingIndex(self.df, airport_codes=airport_codes)
+        self.routes = pd.Index(self.df['fe_route'])
+
+        # point lookups: each route encoded once
+        self._encoded = {record['fe_route']: json.dumps(record).encode() for record in _records(self.df)}
+        self.latencies = defaultdict(lambda: deque(maxlen=_LATENCY_WINDOW))
+        self._evaluate = functools.lru_cache(maxsize=cache_size)(self._evaluate_parameters)
+
+    #-----------------------------------------------------------------------------------
+    def route(self, route):
+        """Returns one route as JSON bytes."""
+        encoded = self._encoded.get(_route_key(route))
+        if encoded is None:
+            raise ServiceError(404, f"Unknown route '{route}'.")
+        return encoded
+
+    def top(self, metric='fe_total_profit_for_route_2019q1', k=10, order='desc', **filters):
+        """Returns the top (or bottom) k routes of a metric as a list of records."""
+        if metric not in self.index.metrics:
+            raise ServiceError(400, f"'{metric}' is not a ranked metric: {self.index.metrics}.")
+        query = self.index.top if order == 'desc' else self.index.bottom
+        try:
+            return _records(query(metric, int(k), **filters))
+        except ValueError as error:
+            raise ServiceError(400, str(error))
+
+    def _evaluate_parameters(self, parameters):
+        """The route economics of every route under a parameter set (cached by the LRU)."""
+        inputs = self.df[['fe_route', *ROUTE_ECONOMICS_INPUTS.values()]]
+        evaluated = fe_calculate_route_economics(inputs, parameters, airport_codes=self.airport_codes)
+        return evaluated.set_index('fe_route')[ROUTE_ECONOMICS_COLUMNS]
+
+    def whatif(self, overrides, route=None, k=10, rank_by='fe_total_profit_for_route_2019q1'):
+        """
+        Re-evaluates the routes with some RouteEconomicsParameters overridden.
+
+        Returns:
+        - result: For a route, its re-evaluated economics next to the baseline. Otherwise
+          the total profit, the number of profitable routes and the top k routes.
+        """
+        unknown = [name for name in overrides if name not in PARAMETER_TYPES]
+        if unknown:
+            raise ServiceError(400, f"Unknown parameters: {unknown}.")
+        fee_change = any(name in overrides for name in ('large_airport_fee', 'medium_airport_fee'))
+        if fee_change and self.airport_codes is None:
+            raise ServiceError(400, "Airport fee what-ifs need the service to be started with airport codes.")
+        if rank_by not in ROUTE_ECONOMICS_COLUMNS:
+            raise ServiceError(400, f"Cannot rank by '{rank_by}'.")
+
+        parameters = replace(ROUTE_ECONOMICS_DEFAULTS, **{name: float(value) for name, value in overrides.items()})
+        evaluated = self._evaluate(parameters)
+
+        if route is not None:
+            key = _route_key(route)
+            if key not in evaluated.index:
+                raise ServiceError(404, f"Unknown route '{route}'.")
+            baseline = self.df.loc[self.routes.get_loc(key), ROUTE_ECONOMICS_COLUMNS]
+            return {'fe_route': key, 'parameters': parameters.as_dict(),
+                    'whatif': {column: _json_value(value) for column, value in evaluated.loc[key].items()},
+                    'baseline': {column: _json_value(value) for column, value in baseline.items()}}
+
+        ranked = evaluated[rank_by].nlargest(int(k))
+        return {'parameters': parameters.as_dict(),
+                'fe_total_profit_all_routes': _json_value(np.nansum(evaluated['fe_total_profit_for_route_2019q1'])),
+                'profitable_routes': int((evaluated['fe_per_round_trip_route_profit'] > 0).sum()),
+                'top': [{'fe_route': name, rank_by: _json_value(value)} for name, value in ranked.items()]}
+
+    #-----------------------------------------------------------------------------------
+    def record_latency(self, endpoint, seconds):
+        self.latencies[endpoint].append(seconds)
+
+    def stats(self):
+        """Returns the latency percentiles (in ms) per endpoint and the what-if cache counters."""
+        endpoints = {}
+        for endpoint, samples in self.latencies.items():
+            values = np.array(samples) * 1000
+            endpoints[endpoint] = {'requests': len(values),
+                                   **{f'p{q}_ms': float(np.percentile(values, q)) for q in (50, 90, 99)}}
+        cache = self._evaluate.cache_info()
+
+        return {'endpoints': endpoints, 'routes': len(self.df),
+                'whatif_cache': {'hits': cache.hits, 'misses': cache.misses,
+                                 'size': cache.currsize, 'max_size': cache.maxsize}}
+
+
+#=======================================================================================
+# HTTP
+#=======================================================================================
+_FILTERS = {'min_flights': float, 'min_carriers': float, 'max_carriers': float, 'airport_size': str}
+
+
+def _make_handler(service):
+    class RouteRequestHandler(BaseHTTPRequestHandler):
+
+        def _dispatch(self, path, query):
+            if path.startswith('/route/'):
+                return 'route', service.route(path[len('/route/'):])
+            if path == '/top':
+                filters = {name: cast(query[name]) for name, cast in _FILTERS.items() if name in query}
+                result = service.top(query.get('metric', 'fe_total_profit_for_route_2019q1'),
+                                     query.get('k', 10), query.get('order', 'desc'), **filters)
+                return 'top', json.dumps(result).encode()
+            if path == '/whatif':
+                overrides = {name: value for name, value in query.items() if name in PARAMETER_TYPES}
+                options = {name: value for name, value in query.items() if name not in PARAMETER_TYPES}
+                unknown = [name for name in options if name not in ('route', 'k', 'rank_by')]
+                if unknown:
+                    raise ServiceError(400, f"Unknown parameters: {unknown}.")
+                return 'whatif', json.dumps(service.whatif(overrides, **options)).encode()
+            if path == '/stats':
+                return 'stats', json.dumps(service.stats()).encode()
+            if path == '/health':
+                return 'health', b'{"status": "ok"}'
+            raise ServiceError(404, f"Unknown path '{path}'.")
+
+        def do_GET(self):
+            start = time.perf_counter()
+            url = urlsplit(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                endpoint, body = self._dispatch(url.path, query)
+                status = 200
+            except ServiceError as error:
+                endpoint, status, body = 'error', error.status, json.dumps({'error': str(error)}).encode()
+            except (TypeError, ValueError) as error:
+                endpoint, status, body = 'error', 400, json.dumps({'error': str(error)}).encode()
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            service.record_latency(endpoint, time.perf_counter() - start)
+
+        def log_message(self, format, *args):
+            # one line per request on stderr would dominate the latency
+            pass
+
+    return RouteRequestHandler
+
+
+def serve(df, host='127.0.0.1', port=8765, airport_codes=None, cache_size=128):
+    """
+    Starts the service over a route table and blocks until interrupted.
+
+    Returns:
+    - never; stop it with Ctrl+C. Use make_server for a server you control.
+    """
+    server = make_server(df, host, port, airport_codes, cache_size)
+    print(f"Serving {len(df)} routes on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def make_server(df, host='127.0.0.1', port=8765, airport_codes=None, cache_size=128):
+    """
+    Returns a ThreadingHTTPServer over the route table (not yet serving), with the
+    RouteService as .service.
+    """
+    service = RouteService(df, airport_codes, cache_size)
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    server.service = service
+
+    return server
+
+
+#=======================================================================================
+# command line
+#=======================================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the route table over local HTTP/JSON.')
+    parser.add_argument('--table', required=True, help='csv of master_df_grouped_by_route_v12')
+    parser.add_argument('--airport-codes', help='Airport_Codes.csv, for airport fee what-ifs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=128)
+    args = parser.parse_args(argv)
+
+    airport_codes = None
+    if args.airport_codes:
+        from pipeline_000 import dw_prepare_airport_codes
+        airport_codes = dw_prepare_airport_codes(pd.read_csv(args.airport_codes))
+
+    serve(pd.read_csv(args.table), args.host, args.port, airport_codes, args.cache_size)
+
+
+if __name__ == '__main__':
+    main()
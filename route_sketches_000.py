@@ -0,0 +1,233 @@
+#=======================================================================================
+"""
+Route Sketches
+
+This file contains small mergeable summaries (sketches) per route, built in the same
+single pass over the flights as the RouteAccumulator:
+
+- a HyperLogLog sketch of the distinct 'op_carrier' values, and
+- a relative-error quantile sketch (log-spaced buckets, as in DDSketch) of
+  'dep_delay', 'arr_delay' and 'air_time'.
+
+Both merge exactly (register maximum, bucket count sum), so chunks, workers and
+quarters can be sketched separately and combined. From the sketches come the
+p50/p90/p99 features and the expected delay beyond the threshold per flight, which
+fe_calculate_route_delay_cost(method='distribution') turns into a delay cost that
+does not hide heavy tails behind a mean.
+
+"""
+#=======================================================================================
+import numpy as np
+import pandas as pd
+
+from feature_engineering_000 import ROUTE_ECONOMICS_DEFAULTS, fe_route_ids_from_labels
+
+SKETCH_COLUMNS = ['dep_delay', 'arr_delay', 'air_time']
+DELAY_COLUMNS = ['dep_delay', 'arr_delay']
+QUANTILES = (0.5, 0.9, 0.99)
+
+# 2**8 registers per route: about 6.5% standard error, exact-ish for the few carriers a route has
+HLL_PRECISION = 8
+
+
+def _bit_length(values):
+    """The bit length of each uint64, exactly (float64 holds any 32-bit half without rounding)."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+#=======================================================================================
+# the sketches
+#=======================================================================================
+class RouteSketches:
+    """
+    Per-route HyperLogLog registers for the distinct carriers and bucket counts for
+    the quantiles of the sketched columns.
+
+    Parameters:
+    - columns: The numeric columns to sketch.
+    - precision: The HyperLogLog precision (2**precision registers per route).
+    - relative_accuracy: The relative error of the quantiles (0.01 = within 1%).
+    - min_value: Values closer to 0 than this share one bucket (reported as 0).
+    """
+
+    def __init__(self, columns=SKETCH_COLUMNS, precision=HLL_PRECISION, relative_accuracy=0.01, min_value=0.5):
+        self.columns = list(columns)
+        self.precision = precision
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+        # bucket i holds magnitudes in (gamma**(i-1), gamma**i]; the smallest used bucket gets key 1
+        self._key_offset = int(np.ceil(np.log(min_value) / self._log_gamma)) - 1
+
+        self.route_ids = pd.Index([], dtype=np.int64, name='fe_route_id')
+        self.registers = np.zeros((0, 2 ** precision), dtype=np.uint8)
+        empty = pd.MultiIndex.from_arrays([np.array([], dtype=np.int64)] * 2, names=['fe_route_id', 'key'])
+        self.buckets = {column: pd.Series(dtype=float, index=empty) for column in self.columns}
+
+    #-----------------------------------------------------------------------------------
+    def _keys(self, values):
+        """Signed bucket keys, increasing with the value: negative, 0 (near zero), positive."""
+        magnitude = np.abs(values)
+        small = magnitude < self.min_value
+        index = np.ceil(np.log(np.where(small, 1.0, magnitude)) / self._log_gamma) - self._key_offset
+        return np.where(small, 0, np.sign(values) * index).astype(np.int64)
+
+    def _bucket_values(self, keys):
+        """The value each bucket stands for, within the relative accuracy of all its values."""
+        value = 2 * self._gamma ** (np.abs(keys) + self._key_offset) / (self._gamma + 1)
+        return np.where(keys == 0, 0.0, np.sign(keys) * value)
+
+    def _positions(self, route_ids):
+        """Register rows of the given routes, adding rows for new routes."""
+        new = pd.Index(route_ids).unique().difference(self.route_ids)
+        if len(new):
+            self.route_ids = self.route_ids.append(new.astype(np.int64)).rename('fe_route_id')
+            self.registers = np.vstack([self.registers,
+                                        np.zeros((len(new), self.registers.shape[1]), dtype=np.uint8)])
+        return self.route_ids.get_indexer(route_ids)
+
+    #-----------------------------------------------------------------------------------
+    def update(self, df, weights=None):
+        """
+        Folds a chunk into the sketches.
+
+        Parameters:
+        - df: A dataframe with 'fe_route_id', 'op_carrier' and the sketched columns.
+        - weights: Optional number of times each row counts, as in RouteAccumulator.update.
+
+        Returns:
+        - self
+        """
+        route_ids = df['fe_route_id'].to_numpy()
+        weights = np.ones(len(df)) if weights is None else np.asarray(weights, dtype=float)
+        counted = weights > 0
+
+        carriers = df['op_carrier']
+        present = counted & carriers.notna().to_numpy()
+        if present.any():
+            hashes = pd.util.hash_array(carriers[present].to_numpy(dtype=object))
+            register = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+            # a guard bit caps the rank at 64 - precision + 1
+            rest = (hashes << np.uint64(self.precision)) | np.uint64(1 << (self.precision - 1))
+            rank = (64 - _bit_length(rest) + 1).astype(np.uint8)
+            positions = self._positions(route_ids[present])
+            np.maximum.at(self.registers, (positions, register), rank)
+
+        for column in self.columns:
+            values = df[column].to_numpy(dtype=float, na_value=np.nan)
+            present = counted & ~np.isnan(values)
+            chunk = pd.Series(weights[present], index=pd.MultiIndex.from_arrays(
+                [route_ids[present], self._keys(values[present])], names=['fe_route_id', 'key']))
+            self.buckets[column] = self.buckets[column].add(chunk.groupby(level=[0, 1]).sum(), fill_value=0)
+
+        return self
+
+    def merge(self, other):
+        """
+        Combines another RouteSketches (same settings) into this one.
+
+        Returns:
+        - self
+        """
+        positions = self._positions(other.route_ids)
+        self.registers[positions] = np.maximum(self.registers[positions], other.registers)
+        for column in self.columns:
+            self.buckets[column] = self.buckets[column].add(other.buckets[column], fill_value=0)
+
+        return self
+
+    #-----------------------------------------------------------------------------------
+    def distinct_carriers(self):
+        """
+        Returns the HyperLogLog estimate of the distinct carriers per route (a series by route id).
+        """
+        m = self.registers.shape[1]
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float), axis=1)
+
+        # linear counting for small cardinalities, which is every route here
+        zeros = (self.registers == 0).sum(axis=1)
+        small = (estimate <= 2.5 * m) & (zeros > 0)
+        estimate = np.where(small, m * np.log(m / np.maximum(zeros, 1)), estimate)
+
+        return pd.Series(estimate, index=self.route_ids, name='fe_route_distinct_op_carrier_estimate')
+
+    def _sorted_buckets(self, column):
+        counts = self.buckets[column]
+        counts = counts[counts > 0].sort_index()
+        route_ids = counts.index.get_level_values(0).to_numpy()
+        starts = np.flatnonzero(np.r_[True, route_ids[1:] != route_ids[:-1]]) if len(counts) else np.array([], int)
+        return route_ids, counts.index.get_level_values(1).to_numpy(), counts.to_numpy(), starts
+
+    def quantiles(self, column, quantiles=QUANTILES):
+        """
+        Returns the quantiles of a sketched column per route (one column per quantile,
+        indexed by route id), each within the relative accuracy of the true value.
+        """
+        route_ids, keys, weights, starts = self._sorted_buckets(column)
+        cumulative = np.cumsum(weights)
+        totals = np.add.reduceat(weights, starts) if len(starts) else weights
+        before = cumulative[starts] - weights[starts] if len(starts) else weights
+
+        result = pd.DataFrame(index=pd.Index(route_ids[starts], name='fe_route_id'))
+        for quantile in quantiles:
+            # the first bucket whose cumulative count passes rank q * (n - 1) of its route
+            position = np.searchsorted(cumulative, before + quantile * (totals - 1), side='right')
+            result[f'p{quantile * 100:g}'] = self._bucket_values(keys[position])
+
+        return result
+
+    def expected_excess(self, column, threshold):
+        """
+        Returns the mean of max(value - threshold, 0) per route, e.g. the expected
+        delay minutes beyond the 15 minute threshold per flight.
+        """
+        route_ids, keys, weights, starts = self._sorted_buckets(column)
+        excess = np.maximum(self._bucket_values(keys) - threshold, 0) * weights
+        if not len(starts):
+            return pd.Series(dtype=float, index=pd.Index([], dtype=np.int64, name='fe_route_id'))
+
+        return pd.Series(np.add.reduceat(excess, starts) / np.add.reduceat(weights, starts),
+                         index=pd.Index(route_ids[starts], name='fe_route_id'))
+
+
+#=======================================================================================
+# features
+#=======================================================================================
+def fe_add_route_distribution_features(df, sketches, parameters=ROUTE_ECONOMICS_DEFAULTS, quantiles=QUANTILES):
+    """
+    Adds the sketch features to a grouped route table:
+    - 'fe_route_p50_dep_delay', 'fe_route_p90_dep_delay', ... for every sketched column and quantile,
+    - 'fe_route_distinct_op_carrier_estimate',
+    - 'fe_route_mean_dep_delay_excess' and 'fe_route_mean_arr_delay_excess': the expected
+      minutes beyond parameters.delay_threshold_minutes per flight, as used by
+      fe_calculate_route_delay_cost(df, method='distribution').
+
+    Parameters:
+    - df: The grouped route table with 'fe_route' (or 'fe_route_id').
+    - sketches: The RouteSketches of the same flights.
+    - parameters: The RouteEconomicsParameters (for the delay threshold).
+    - quantiles: The quantiles to add.
+
+    Returns:
+    - df: The input dataframe with the added columns.
+    """
+    route_ids = df['fe_route_id'].to_numpy() if 'fe_route_id' in df.columns else fe_route_ids_from_labels(df['fe_route'])
+
+    for column in sketches.columns:
+        table = sketches.quantiles(column, quantiles).reindex(route_ids)
+        for quantile in table.columns:
+            df[f'fe_route_{quantile}_{column}'] = table[quantile].to_numpy()
+
+    df['fe_route_distinct_op_carrier_estimate'] = sketches.distinct_carriers().reindex(route_ids).to_numpy()
+
+    for column in DELAY_COLUMNS:
+        if column in sketches.columns:
+            excess = sketches.expected_excess(column, parameters.delay_threshold_minutes)
+            df[f'fe_route_mean_{column}_excess'] = excess.reindex(route_ids).to_numpy()
+
+    return df
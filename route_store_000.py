@@ -0,0 +1,214 @@
+#=======================================================================================
+"""
+Route Store
+
+This file contains a persisted, read-only format for the final grouped route table
+(master_df_grouped_by_route_v12), so dashboards, report jobs and other notebooks can
+open it instead of rebuilding or unpickling their own copy:
+
+- one .npy file per numeric column (fixed width, native byte order),
+- the route dictionary: the 'fe_route' labels as fixed-width bytes, plus their sorted
+  order for lookups by route,
+- columns.json with the column names and dtypes.
+
+Every save writes a new version subdirectory and then switches the store to it by
+replacing the one-line CURRENT file, an atomic rename. A reader maps all files of
+the version it opened, so a later save never changes what it sees, and there is no
+moment without a complete store. Older versions are removed after the switch.
+
+The files are opened with np.load(mmap_mode='r'): nothing is parsed or copied, the
+pages are read on first touch, and every process that opens the same store shares
+them through the OS page cache.
+
+    dw_save_route_metrics(master_df_grouped_by_route_v12, 'route_metrics')
+
+    store = RouteMetricsStore('route_metrics')
+    profit = store['fe_total_profit_for_route_2019q1']    # read-only numpy view
+    store.row('ABE_ATL')
+    df = store.frame()                                    # pandas frame over the views
+
+"""
+#=======================================================================================
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+ROUTE_COLUMN = 'fe_route'
+FORMAT_VERSION = 1
+
+# the file naming the current version subdirectory, e.g. 'v000003'
+_CURRENT_FILE = 'CURRENT'
+_VERSION_PATTERN = re.compile(r'^v(\d{6})$')
+
+
+def _column_array(series):
+    """A fixed-width numpy array of a numeric column (nullable dtypes as float with NaN)."""
+    if pd.api.types.is_bool_dtype(series) and not series.hasnans:
+        return series.to_numpy(dtype=bool)
+    if pd.api.types.is_integer_dtype(series) and not series.hasnans:
+        return series.to_numpy(dtype=np.int64)
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+#=======================================================================================
+# writing
+#=======================================================================================
+def dw_save_route_metrics(df, directory='route_metrics', columns=None):
+    """
+    Writes a route table as a new version of a store for RouteMetricsStore. The
+    version is written completely before CURRENT is switched to it, so a reader never
+    opens a half-written store. Readers that already have it open keep the version
+    they mapped (its files stay readable after they are deleted).
+
+    Parameters:
+    - df: The grouped route table with 'fe_route', one row per route.
+    - directory: Where to write the store.
+    - columns: The columns to store (default: every numeric column).
+
+    Returns:
+    - directory: The directory written.
+    """
+    if columns is None:
+        columns = [column for column in df.columns
+                   if column != ROUTE_COLUMN and pd.api.types.is_numeric_dtype(df[column])]
+    not_numeric = [column for column in columns if not pd.api.types.is_numeric_dtype(df[column])]
+    if not_numeric:
+        raise ValueError(f"Only numeric columns can be stored: {not_numeric}")
+    if df[ROUTE_COLUMN].duplicated().any():
+        raise ValueError("The route table has more than one row for some routes.")
+
+    directory = os.fspath(directory).rstrip(os.sep)
+    if os.path.isdir(directory) and not os.path.exists(os.path.join(directory, _CURRENT_FILE)):
+        # a store of the layout without versions
+        shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+    versions = [int(match.group(1)) for match in map(_VERSION_PATTERN.match, os.listdir(directory)) if match]
+    version = f'v{max(versions, default=0) + 1:06d}'
+    staging = os.path.join(directory, version + '.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    routes = df[ROUTE_COLUMN].to_numpy(dtype=str).astype(np.bytes_)
+    np.save(os.path.join(staging, 'routes.npy'), routes)
+    np.save(os.path.join(staging, 'route_order.npy'), np.argsort(routes, kind='stable'))
+
+    dtypes = {}
+    for position, column in enumerate(columns):
+        values = _column_array(df[column])
+        np.save(os.path.join(staging, f'{position:04d}.npy'), values)
+        dtypes[column] = values.dtype.str
+    with open(os.path.join(staging, 'columns.json'), 'w') as f:
+        json.dump({'version': FORMAT_VERSION, 'rows': len(df), 'columns': dtypes}, f)
+
+    os.replace(staging, os.path.join(directory, version))
+    pointer = os.path.join(directory, _CURRENT_FILE + '.tmp')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(directory, _CURRENT_FILE))
+
+    for name in os.listdir(directory):
+        if name != version and _VERSION_PATTERN.match(name.removesuffix('.tmp')):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    return directory
+
+
+def _current_version(directory):
+    """The directory of the version CURRENT names."""
+    with open(os.path.join(directory, _CURRENT_FILE)) as f:
+        return os.path.join(directory, f.read().strip())
+
+
+#=======================================================================================
+# reading
+#=======================================================================================
+class RouteMetricsStore:
+    """
+    A read-only, memory-mapped view of the current version of a store written by
+    dw_save_route_metrics. All its files are mapped when it is opened, so it keeps
+    reading that version while newer ones are saved; open it again to see them.
+
+    Parameters:
+    - directory: The store directory.
+    """
+
+    def __init__(self, directory='route_metrics'):
+        self.directory = directory
+        while True:
+            self.version_directory = _current_version(directory)
+            try:
+                self._open()
+                break
+            except FileNotFoundError:
+                # a save switched CURRENT and removed this version while it was opened
+                if self.version_directory == _current_version(directory):
+                    raise
+
+    def _open(self):
+        with open(os.path.join(self.version_directory, 'columns.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported route store version {meta['version']} in '{self.directory}'.")
+
+        self.columns = list(meta['columns'])
+        self.routes = self._map('routes.npy')
+        self._order = self._map('route_order.npy')
+        self._sorted_routes = self.routes[self._order]
+        self._arrays = {column: self._map(f'{position:04d}.npy') for position, column in enumerate(self.columns)}
+
+    def _map(self, name):
+        # a plain ndarray view; the np.memmap it views keeps the file mapped
+        return np.load(os.path.join(self.version_directory, name), mmap_mode='r').view(np.ndarray)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def __contains__(self, column):
+        return column in self._arrays
+
+    #-----------------------------------------------------------------------------------
+    def __getitem__(self, column):
+        """Returns a column as a read-only numpy array over the mapped file."""
+        if column not in self._arrays:
+            raise KeyError(f"'{column}' is not in the route store.")
+        return self._arrays[column]
+
+    def positions(self, routes):
+        """
+        Returns the row positions of route labels ('ABE_ATL'), -1 where not stored.
+        """
+        labels = np.asarray(routes, dtype=str).astype(np.bytes_)
+        found = np.minimum(np.searchsorted(self._sorted_routes, labels), len(self) - 1)
+        hit = self._sorted_routes[found] == labels if len(self) else np.zeros(len(labels), dtype=bool)
+        return np.where(hit, self._order[found], -1)
+
+    def row(self, route, columns=None):
+        """
+        Returns one route's metrics as a dict, or None if the route is not stored.
+        """
+        position = self.positions([route])[0]
+        if position < 0:
+            return None
+        return {ROUTE_COLUMN: route, **{column: self[column][position].item() for column in columns or self.columns}}
+
+    def frame(self, columns=None, routes=True):
+        """
+        Returns the store as a pandas dataframe whose numeric columns are views of
+        the mapped files. New columns can be added to it, but changing stored values
+        in place raises (the mapping is read-only): take df.copy() for that.
+
+        Parameters:
+        - columns: The columns to include (default: all).
+        - routes: Whether to include 'fe_route' (decoded to str, which does copy the labels).
+
+        Returns:
+        - df: The route table.
+        """
+        data = {ROUTE_COLUMN: self.routes.astype(str)} if routes else {}
+        data.update({column: self[column] for column in columns or self.columns})
+
+        return pd.DataFrame(data, copy=False)
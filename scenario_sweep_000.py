@@ -0,0 +1,168 @@
+#=======================================================================================
+"""
+Scenario Sweep
+
+This file contains a sweep of the route economics over many assumption sets
+(scenarios) at once. The final route table (master_df_grouped_by_route_v12, or
+any table with the fe_route_mean_* inputs) is evaluated as a routes x scenarios
+matrix by broadcasting fe_route_economics_arrays, in batches of scenarios that
+fit a memory budget. Instead of rerunning the fe_ chain once per scenario,
+each batch is a handful of numpy array operations.
+
+"""
+#=======================================================================================
+from dataclasses import fields, replace
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering_000 import (
+    ROUTE_ECONOMICS_DEFAULTS,
+    ROUTE_ECONOMICS_INPUTS,
+    RouteEconomicsParameters,
+    fe_route_airport_fees,
+    fe_route_economics_arrays,
+    fe_route_ids_from_labels,
+)
+
+# scenario columns besides the RouteEconomicsParameters fields
+OCCUPANCY_MULTIPLIER = 'occupancy_multiplier'
+
+PARAMETER_NAMES = [field.name for field in fields(RouteEconomicsParameters)]
+
+# roughly how many routes x scenarios float64 arrays are alive while a batch is evaluated
+_ARRAYS_PER_BATCH = 16
+
+
+#=======================================================================================
+# building scenarios
+#=======================================================================================
+def fe_scenario_grid(**values):
+    """
+    Builds a scenario table from every combination of the given values.
+
+    Example:
+    fe_scenario_grid(fomc_cost_per_mile=[7, 8, 9], occupancy_multiplier=[0.8, 0.9, 1.0])
+    gives 9 scenarios.
+
+    Parameters:
+    - values: RouteEconomicsParameters field names (or 'occupancy_multiplier')
+      mapped to lists of values.
+
+    Returns:
+    - scenarios: A dataframe with one row per scenario.
+    """
+    _check_scenario_columns(values)
+    grid = pd.MultiIndex.from_product(list(values.values()), names=list(values.keys()))
+
+    return grid.to_frame(index=False)
+
+
+def _check_scenario_columns(columns):
+    unknown = [column for column in columns if column not in PARAMETER_NAMES + [OCCUPANCY_MULTIPLIER]]
+    if unknown:
+        raise ValueError(f"Unknown scenario columns: {unknown}")
+
+
+#=======================================================================================
+# sweeping
+#=======================================================================================
+def fe_sweep_route_scenarios(df, scenarios, top_k=10, rank_by='fe_total_profit_for_route_2019q1',
+                             base_parameters=ROUTE_ECONOMICS_DEFAULTS, airport_codes=None,
+                             memory_budget_bytes=512 * 1024 ** 2):
+    """
+    Evaluates the route economics of every route under every scenario.
+
+    Parameters:
+    - df: The grouped route table with the ROUTE_ECONOMICS_INPUTS columns and 'fe_route'.
+    - scenarios: A dataframe with one row per scenario. Its columns override
+      fields of base_parameters; 'occupancy_multiplier' scales the mean occupancy
+      rate of every route (capped at 1).
+    - top_k: The number of best routes reported per scenario.
+    - rank_by: 'fe_total_profit_for_route_2019q1' or 'fe_per_round_trip_route_profit'.
+    - base_parameters: The RouteEconomicsParameters used for everything not in scenarios.
+    - airport_codes: Needed when the scenarios change the airport fees; the route
+      endpoints are then re-priced (see fe_route_airport_fees).
+    - memory_budget_bytes: Upper bound for the working arrays of one batch.
+
+    Returns:
+    - summary: One row per scenario: the scenario values, the summed
+      'fe_total_profit_for_route_2019q1' over all routes, the number of
+      profitable routes and the median break-even point of the profitable routes.
+    - top_routes: top_k rows per scenario: 'scenario', 'rank', 'fe_route',
+      'fe_per_round_trip_route_profit', 'fe_total_profit_for_route_2019q1' and
+      'fe_break_even_point_in_number_of_round_trip_flights_for_route'.
+    """
+    _check_scenario_columns(scenarios.columns)
+    if not len(scenarios):
+        raise ValueError("No scenarios to sweep.")
+    if rank_by not in ('fe_total_profit_for_route_2019q1', 'fe_per_round_trip_route_profit'):
+        raise ValueError(f"Cannot rank by '{rank_by}'.")
+
+    inputs = {name: df[column].to_numpy(dtype=float, na_value=np.nan)[np.newaxis, :]
+              for name, column in ROUTE_ECONOMICS_INPUTS.items()}
+    routes = df['fe_route'].to_numpy()
+    n_routes = len(routes)
+    top_k = min(top_k, n_routes)
+
+    reprice_airports = any(name in scenarios.columns for name in ('large_airport_fee', 'medium_airport_fee'))
+    if reprice_airports:
+        if airport_codes is None:
+            raise ValueError("airport_codes is needed to sweep the airport fees.")
+        route_ids = df['fe_route_id'].to_numpy() if 'fe_route_id' in df.columns else fe_route_ids_from_labels(routes)
+        only_large = RouteEconomicsParameters(large_airport_fee=1, medium_airport_fee=0)
+        only_medium = RouteEconomicsParameters(large_airport_fee=0, medium_airport_fee=1)
+        large_visits = fe_route_airport_fees(route_ids, airport_codes, only_large)[np.newaxis, :]
+        medium_visits = fe_route_airport_fees(route_ids, airport_codes, only_medium)[np.newaxis, :]
+
+    batch_size = max(1, int(memory_budget_bytes // (_ARRAYS_PER_BATCH * 8 * max(n_routes, 1))))
+    summaries, top_frames = [], []
+
+    for start in range(0, len(scenarios), batch_size):
+        batch = scenarios.iloc[start:start + batch_size]
+        columns = {name: batch[name].to_numpy(dtype=float)[:, np.newaxis]
+                   for name in batch.columns if name in PARAMETER_NAMES}
+        parameters = replace(base_parameters, **columns)
+
+        batch_inputs = dict(inputs)
+        if OCCUPANCY_MULTIPLIER in batch.columns:
+            multiplier = batch[OCCUPANCY_MULTIPLIER].to_numpy(dtype=float)[:, np.newaxis]
+            batch_inputs['occupancy_rate'] = np.minimum(inputs['occupancy_rate'] * multiplier, 1.0)
+        if reprice_airports:
+            batch_inputs['airport_cost'] = (np.asarray(parameters.large_airport_fee) * large_visits +
+                                            np.asarray(parameters.medium_airport_fee) * medium_visits)
+
+        results = fe_route_economics_arrays(batch_inputs, parameters)
+        shape = (len(batch), n_routes)
+        profit = np.broadcast_to(results['fe_per_round_trip_route_profit'], shape)
+        total_profit = np.broadcast_to(results['fe_total_profit_for_route_2019q1'], shape)
+        break_even = np.broadcast_to(results['fe_break_even_point_in_number_of_round_trip_flights_for_route'], shape)
+
+        profitable = profit > 0
+        summary = batch.reset_index(drop=True)
+        summary.insert(0, 'scenario', np.arange(start, start + len(batch)))
+        summary['fe_total_profit_all_routes'] = np.nansum(total_profit, axis=1)
+        summary['profitable_routes'] = profitable.sum(axis=1)
+        with np.errstate(all='ignore'):
+            summary['median_break_even_of_profitable_routes'] = np.nanmedian(
+                np.where(profitable, break_even, np.nan), axis=1)
+        summaries.append(summary)
+
+        # top-K per scenario: partial selection, then sort only the K
+        ranking = total_profit if rank_by == 'fe_total_profit_for_route_2019q1' else profit
+        ranked = np.where(np.isnan(ranking), -np.inf, ranking)
+        best = np.argpartition(-ranked, top_k - 1, axis=1)[:, :top_k]
+        order = np.argsort(-np.take_along_axis(ranked, best, axis=1), axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+
+        top_frames.append(pd.DataFrame({
+            'scenario': np.repeat(summary['scenario'].to_numpy(), top_k),
+            'rank': np.tile(np.arange(1, top_k + 1), len(batch)),
+            'fe_route': routes[best.ravel()],
+            'fe_per_round_trip_route_profit': np.take_along_axis(profit, best, axis=1).ravel(),
+            'fe_total_profit_for_route_2019q1': np.take_along_axis(total_profit, best, axis=1).ravel(),
+            'fe_break_even_point_in_number_of_round_trip_flights_for_route':
+                np.take_along_axis(break_even, best, axis=1).ravel(),
+        }))
+
+    return pd.concat(summaries, ignore_index=True), pd.concat(top_frames, ignore_index=True)
@@ -0,0 +1,281 @@
+#=======================================================================================
+"""
+SQL Backend
+
+This file contains an out-of-core alternative to the dw_ stages of the notebook,
+run as set-based queries inside an on-disk SQLite database (sqlite3 ships with
+Python, so there is nothing to install). The csv files are streamed into raw
+tables in chunks. Every later step is a query: the duplicate drop, the filters,
+the dirty numeric coercion, the 11.0 fare imputation, the route keys, the two
+merges and the per-route aggregation. Only the final grouped route table is read
+back into pandas, for the fe_ stages.
+
+    connection = dw_sqlite_connect('dw_pipeline.sqlite')
+    dw_sqlite_load_csv_files(connection, 'Airport_Codes.csv', 'Flights.csv', 'Tickets.csv')
+    master_df_grouped_by_route_v1 = dw_sqlite_run_route_pipeline(connection)
+
+dw_compare_route_tables checks the result against the pandas path
+(pipeline_000.dw_run_route_pipeline).
+
+"""
+#=======================================================================================
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from data_wrangling_000 import (
+    AIRPORT_CODES_SCHEMA,
+    DEFAULT_CHUNKSIZE,
+    FLIGHTS_NUMERIC_COLUMNS,
+    FLIGHTS_SCHEMA,
+    TICKETS_NUMERIC_COLUMNS,
+    TICKETS_SCHEMA,
+)
+from feature_engineering_000 import ROUTE_ECONOMICS_DEFAULTS
+
+# the columns averaged per route, in the order of dw_transform_calculate_varied_grouped_means_with_count
+_ROUTE_MEAN_COLUMNS = ['air_time', 'distance', 'occupancy_rate', 'dep_delay', 'arr_delay',
+                       'fe_route_airport_operations_cost', 'fe_mean_route_fare_per_passenger']
+
+_SQL_TYPES = {'Int64': 'INTEGER', 'int64': 'INTEGER', 'float64': 'REAL', 'object': 'TEXT'}
+
+
+#=======================================================================================
+# loading
+#=======================================================================================
+def dw_sqlite_connect(path='dw_pipeline.sqlite', cache_size_mb=256):
+    """
+    Opens (or creates) the database. The page cache is bounded and temporary
+    sort and join structures go to disk, so memory stays flat whatever the data size.
+    """
+    connection = sqlite3.connect(path)
+    connection.execute(f'PRAGMA cache_size = -{cache_size_mb * 1024}')
+    connection.execute('PRAGMA temp_store = FILE')
+    # the database is a scratch copy of the csv files, so durability is not needed
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+
+    return connection
+
+
+def _create_table(connection, table, schema, numeric_columns=()):
+    """Creates a table from a dw_ schema. Dirty numeric columns get REAL affinity."""
+    columns = [f'"{column}" {"REAL" if column in numeric_columns else _SQL_TYPES[dtype]}'
+               for column, dtype in schema.items()]
+    connection.execute(f'DROP TABLE IF EXISTS {table}')
+    connection.execute(f'CREATE TABLE {table} ({", ".join(columns)})')
+
+
+def dw_sqlite_load_csv(connection, path, table, schema, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streams a csv file into a raw table, chunk by chunk, with the column types of a
+    dw_ schema (dirty numeric columns stay text, as in the file).
+
+    Parameters:
+    - connection: The sqlite3 connection.
+    - path: The csv file path.
+    - table: The name of the raw table, replaced if it exists.
+    - schema: A dict of lowercase column name -> dtype, e.g. FLIGHTS_SCHEMA.
+    - chunksize: The number of csv rows read at a time.
+
+    Returns:
+    - rows: The number of rows loaded.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    file_columns = {column.lower(): column for column in header}
+    schema = {column: dtype for column, dtype in schema.items() if column in file_columns}
+
+    _create_table(connection, table, schema)
+    placeholders = ', '.join('?' * len(schema))
+    rows = 0
+    for chunk in pd.read_csv(path, usecols=[file_columns[column] for column in schema],
+                             dtype={file_columns[column]: dtype for column, dtype in schema.items()},
+                             chunksize=chunksize):
+        chunk = chunk[[file_columns[column] for column in schema]].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        connection.executemany(f'INSERT INTO {table} VALUES ({placeholders})', chunk.itertuples(index=False))
+        rows += len(chunk)
+    connection.commit()
+
+    return rows
+
+
+def dw_sqlite_load_csv_files(connection, airport_codes_path, flights_path, tickets_path,
+                             chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Loads the three csv files into the raw tables airport_codes_raw, flights_raw and tickets_raw.
+
+    Returns:
+    - rows: A dict of table name -> rows loaded.
+    """
+    return {table: dw_sqlite_load_csv(connection, path, table, schema, chunksize)
+            for table, path, schema in [('airport_codes_raw', airport_codes_path, AIRPORT_CODES_SCHEMA),
+                                        ('flights_raw', flights_path, FLIGHTS_SCHEMA),
+                                        ('tickets_raw', tickets_path, TICKETS_SCHEMA)]}
+
+
+#=======================================================================================
+# the pipeline as queries
+#=======================================================================================
+def _table_columns(connection, table):
+    return [row[1] for row in connection.execute(f'PRAGMA table_info({table})')]
+
+
+def _deduplicate(connection, raw_table, table, schema, numeric_columns=()):
+    """
+    process_dataframe: drops duplicate rows. The distinct rows go into a table whose
+    dirty numeric columns have REAL affinity, so SQLite converts the well-formed
+    numbers on insert and keeps the junk strings as text.
+    """
+    columns = _table_columns(connection, raw_table)
+    _create_table(connection, table, {column: schema[column] for column in columns}, numeric_columns)
+    quoted = ', '.join(f'"{column}"' for column in columns)
+    connection.execute(f'INSERT INTO {table} ({quoted}) SELECT DISTINCT {quoted} FROM {raw_table}')
+
+
+def _numeric(column):
+    """pd.to_numeric(errors='coerce') on a REAL affinity column: the values left as text become NULL."""
+    return f"CASE WHEN typeof({column}) IN ('integer', 'real') THEN {column} END"
+
+
+def _route(origin='origin', destination='destination'):
+    """fe_create_route: the two codes in sorted order, joined by '_' (missing codes read 'nan', as in pandas)."""
+    origin, destination = f"COALESCE({origin}, 'nan')", f"COALESCE({destination}, 'nan')"
+    return (f"CASE WHEN {origin} <= {destination} THEN {origin} || '_' || {destination} "
+            f"ELSE {destination} || '_' || {origin} END")
+
+
+def _airport_fee(type_column, parameters):
+    """_fe_airport_fee: the fee charged at one end of the route."""
+    return (f"CASE {type_column} WHEN 'large_airport' THEN {float(parameters.large_airport_fee)} "
+            f"WHEN 'medium_airport' THEN {float(parameters.medium_airport_fee)} ELSE 0.0 END")
+
+
+def dw_sqlite_run_route_pipeline(connection, parameters=ROUTE_ECONOMICS_DEFAULTS, sentinel=11.0):
+    """
+    Runs the dw_ stages of main.ipynb as queries over the raw tables and returns the
+    per-route table (master_df_grouped_by_route_v1). The cleaned stages are kept as
+    tables named like the notebook variables (airport_codes_v2, flights_w_routes,
+    tickets_v2, tickets_w_routes_grouped_v2); the merged master table is only a view.
+
+    Parameters:
+    - connection: A connection with the raw tables (see dw_sqlite_load_csv_files).
+    - parameters: The RouteEconomicsParameters for fe_route_airport_operations_cost,
+      which is computed on the merged rows before the grouping.
+    - sentinel: The fare replaced by the mean fare of the reporting carrier.
+
+    Returns:
+    - grouped_data: The same columns and row order as
+      dw_transform_calculate_varied_grouped_means_with_count.
+    """
+    _deduplicate(connection, 'airport_codes_raw', 'airport_codes_initial', AIRPORT_CODES_SCHEMA)
+    _deduplicate(connection, 'flights_raw', 'flights_initial', FLIGHTS_SCHEMA, FLIGHTS_NUMERIC_COLUMNS)
+    _deduplicate(connection, 'tickets_raw', 'tickets_initial', TICKETS_SCHEMA, TICKETS_NUMERIC_COLUMNS)
+
+    script = f"""
+        DROP TABLE IF EXISTS airport_codes_v2;
+        CREATE TABLE airport_codes_v2 AS
+            SELECT type, iata_code FROM airport_codes_initial
+            WHERE iso_country = 'US' AND type IN ('medium_airport', 'large_airport');
+        CREATE INDEX airport_codes_v2_iata_code ON airport_codes_v2 (iata_code);
+
+        DROP TABLE IF EXISTS flights_w_routes;
+        CREATE TABLE flights_w_routes AS
+            SELECT origin, destination, op_carrier, occupancy_rate, dep_delay, arr_delay,
+                   {_numeric('air_time')} AS air_time,
+                   {_numeric('distance')} AS distance,
+                   {_route()} AS fe_route
+            FROM flights_initial
+            WHERE cancelled = 0.0;
+
+        DROP TABLE IF EXISTS tickets_v2;
+        CREATE TABLE tickets_v2 AS
+            SELECT reporting_carrier, {_route()} AS fe_route, {_numeric('itin_fare')} AS itin_fare
+            FROM tickets_initial
+            WHERE roundtrip = 1.0;
+
+        DROP TABLE IF EXISTS tickets_w_routes_grouped_v2;
+        CREATE TABLE tickets_w_routes_grouped_v2 AS
+            WITH carrier_means AS (
+                SELECT reporting_carrier, AVG(itin_fare) AS fill_value
+                FROM tickets_v2
+                WHERE itin_fare IS NOT NULL AND itin_fare <> {float(sentinel)} AND reporting_carrier IS NOT NULL
+                GROUP BY reporting_carrier
+            )
+            SELECT t.fe_route,
+                   AVG(CASE WHEN t.itin_fare = {float(sentinel)} AND m.fill_value IS NOT NULL
+                            THEN m.fill_value ELSE t.itin_fare END) AS fe_mean_route_fare_per_passenger
+            FROM tickets_v2 t LEFT JOIN carrier_means m ON m.reporting_carrier = t.reporting_carrier
+            GROUP BY t.fe_route;
+        CREATE INDEX tickets_w_routes_grouped_v2_fe_route ON tickets_w_routes_grouped_v2 (fe_route);
+
+        DROP VIEW IF EXISTS master_df_w_route_airport_operations_cost;
+        CREATE VIEW master_df_w_route_airport_operations_cost AS
+            SELECT f.*, r.fe_mean_route_fare_per_passenger,
+                   {_airport_fee('o.type', parameters)} + {_airport_fee('d.type', parameters)}
+                       AS fe_route_airport_operations_cost
+            FROM flights_w_routes f
+            JOIN tickets_w_routes_grouped_v2 r ON r.fe_route = f.fe_route
+            JOIN airport_codes_v2 o ON o.iata_code = f.origin
+            JOIN airport_codes_v2 d ON d.iata_code = f.destination;
+    """
+    connection.executescript(script)
+
+    means = ', '.join(f'AVG({column}) AS {column}' for column in _ROUTE_MEAN_COLUMNS)
+    grouped_data = pd.read_sql_query(f"""
+        SELECT fe_route, {means},
+               COUNT(DISTINCT op_carrier) AS op_carrier,
+               COUNT(*) AS fe_number_of_flights_per_route
+        FROM master_df_w_route_airport_operations_cost
+        GROUP BY fe_route
+        ORDER BY fe_route
+    """, connection)
+
+    # AVG over only NULLs comes back as None
+    for column in _ROUTE_MEAN_COLUMNS:
+        grouped_data[column] = grouped_data[column].astype(float)
+
+    return grouped_data
+
+
+def dw_sqlite_route_pipeline_from_csv(airport_codes_path, flights_path, tickets_path,
+                                      database='dw_pipeline.sqlite', chunksize=DEFAULT_CHUNKSIZE,
+                                      parameters=ROUTE_ECONOMICS_DEFAULTS):
+    """
+    Loads the three csv files into a database and runs dw_sqlite_run_route_pipeline.
+    """
+    connection = dw_sqlite_connect(database)
+    try:
+        dw_sqlite_load_csv_files(connection, airport_codes_path, flights_path, tickets_path, chunksize)
+        return dw_sqlite_run_route_pipeline(connection, parameters)
+    finally:
+        connection.close()
+
+
+#=======================================================================================
+# checking against pandas
+#=======================================================================================
+def dw_compare_route_tables(grouped_a, grouped_b, rtol=1e-9):
+    """
+    Compares two per-route tables, e.g. from the SQL and the pandas path. Means may
+    differ in the last bits because the sums are taken in another order.
+
+    Returns:
+    - differences: One row per route and column that does not match ('fe_route',
+      'column', 'a', 'b'); routes in only one table are listed with column 'fe_route'.
+      Empty when the tables match.
+    """
+    a = grouped_a.set_index('fe_route')
+    b = grouped_b.set_index('fe_route')
+    frames = [pd.DataFrame({'fe_route': a.index.symmetric_difference(b.index), 'column': 'fe_route'})]
+
+    routes = a.index.intersection(b.index)
+    for column in a.columns.intersection(b.columns):
+        values_a = a.loc[routes, column].to_numpy(dtype=float, na_value=np.nan)
+        values_b = b.loc[routes, column].to_numpy(dtype=float, na_value=np.nan)
+        differ = ~np.isclose(values_a, values_b, rtol=rtol, atol=0, equal_nan=True)
+        frames.append(pd.DataFrame({'fe_route': routes[differ], 'column': column,
+                                    'a': values_a[differ], 'b': values_b[differ]}))
+
+    return pd.concat(frames, ignore_index=True)
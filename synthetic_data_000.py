@@ -0,0 +1,240 @@
+#=======================================================================================
+"""
+Synthetic Data
+
+This file contains a seeded generator of synthetic Airport_Codes.csv, Flights.csv
+and Tickets.csv files with the same columns (uppercase headers) and the same
+quirks as the real ones, so the pipeline can be run and benchmarked without them:
+
+- junk strings in 'DISTANCE', 'AIR_TIME' and 'ITIN_FARE', and mixed types in 'OP_CARRIER_FL_NUM'
+- the 11.0 'ITIN_FARE' sentinel (and 0.0 fares)
+- cancelled flights and non-roundtrip tickets
+- exact duplicate rows
+- non-US, small and missing-IATA airports in the airport codes
+
+The files are written in chunks, so 100M rows never sit in memory at once.
+The same seed and sizes always give the same files.
+
+"""
+#=======================================================================================
+import os
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering_000 import IATA_CODE_SPACE, fe_decode_airport_ids
+
+CARRIERS = ['AA', 'AS', 'B6', 'DL', 'EV', 'F9', 'G4', 'HA', 'MQ', 'NK',
+            'OH', 'OO', 'UA', 'WN', 'YV', 'YX', '9E']
+
+STATES = ['AK', 'AL', 'AZ', 'CA', 'CO', 'FL', 'GA', 'HI', 'IL', 'MA', 'MI', 'MN',
+          'NC', 'NJ', 'NV', 'NY', 'OH', 'OR', 'PA', 'TX', 'UT', 'VA', 'WA']
+
+DISTANCE_JUNK = ['****', 'Hundred', 'NAN']
+AIR_TIME_JUNK = ['$$$', 'NA', '**']
+FARE_JUNK = ['$$$', '820$$$', 'NA', '200 $']
+FLIGHT_NUMBER_JUNK = ['****', 'Error']
+
+# quirk rates, close to the 2019 Q1 files
+DEFAULT_RATES = {
+    'cancelled': 0.025,
+    'non_roundtrip': 0.3,
+    'duplicate': 0.003,
+    'fare_sentinel': 0.025,
+    'fare_zero': 0.005,
+    'numeric_junk': 0.0002,
+}
+
+
+#=======================================================================================
+# airports
+#=======================================================================================
+def generate_airport_codes(n_us_airports=850, n_other_airports=5000, seed=0):
+    """
+    Generates the airport codes table: medium and large US airports (the ones
+    the pipeline keeps), plus small US airports, non-US airports and airports
+    without an IATA code.
+
+    Parameters:
+    - n_us_airports: The number of medium and large US airports.
+    - n_other_airports: The number of other airports.
+    - seed: The random seed.
+
+    Returns:
+    - airport_codes: A dataframe with the Airport_Codes.csv columns.
+    """
+    rng = np.random.default_rng(seed)
+    n = n_us_airports + n_other_airports
+
+    codes = fe_decode_airport_ids(rng.choice(IATA_CODE_SPACE, size=n, replace=False))
+    codes[n_us_airports:][rng.random(n_other_airports) < 0.5] = np.nan
+
+    is_us = np.arange(n) < n_us_airports
+    large = rng.random(n) < 0.15
+    types = np.where(is_us, np.where(large, 'large_airport', 'medium_airport'),
+                     rng.choice(['small_airport', 'heliport', 'medium_airport', 'large_airport'],
+                                size=n, p=[0.6, 0.2, 0.15, 0.05]))
+    other_small_us = ~is_us & (rng.random(n) < 0.3)
+
+    return pd.DataFrame({
+        'TYPE': np.where(other_small_us, 'small_airport', types),
+        'NAME': [f'Airport {i}' for i in range(n)],
+        'ELEVATION_FT': rng.integers(0, 8000, n).astype(float),
+        'CONTINENT': np.where(is_us | other_small_us, None, rng.choice(['EU', 'AS', 'SA', 'AF'], n)),
+        'ISO_COUNTRY': np.where(is_us | other_small_us, 'US', rng.choice(['CA', 'MX', 'GB', 'FR', 'BR'], n)),
+        'MUNICIPALITY': [f'City {i}' for i in range(n)],
+        'IATA_CODE': codes,
+        'COORDINATES': [f'{x:.4f}, {y:.4f}' for x, y in zip(rng.uniform(-160, -70, n), rng.uniform(20, 65, n))],
+    })
+
+
+def _us_airport_popularity(n_airports, rng):
+    """A skewed (Zipf-like) popularity, so a few hubs carry most of the traffic."""
+    weights = 1.0 / np.arange(1, n_airports + 1) ** 1.1
+    rng.shuffle(weights)
+
+    return weights / weights.sum()
+
+
+#=======================================================================================
+# flights and tickets
+#=======================================================================================
+def _with_junk(values, junk, rate, rng):
+    """Turns a numeric array into an object array with some junk strings mixed in."""
+    values = values.astype(object)
+    hit = rng.random(len(values)) < rate
+    values[hit] = rng.choice(junk, size=hit.sum())
+
+    return values
+
+
+def _with_duplicates(df, rate, rng):
+    """Appends exact copies of a share of the rows at random positions."""
+    copies = df.iloc[rng.choice(len(df), size=int(len(df) * rate), replace=False)]
+    df = pd.concat([df, copies], ignore_index=True)
+
+    return df.iloc[rng.permutation(len(df))]
+
+
+def _generate_flights_chunk(n, airports, popularity, rates, rng):
+    us = airports[airports['ISO_COUNTRY'].eq('US') & airports['TYPE'].isin(['medium_airport', 'large_airport'])
+                  & airports['IATA_CODE'].notna()]
+    # a few flights go to airports the pipeline does not keep
+    pool = pd.concat([us, airports[airports['IATA_CODE'].notna()].head(50)], ignore_index=True)
+    weights = np.concatenate([popularity * 0.99, np.full(len(pool) - len(us), 0.01 / max(len(pool) - len(us), 1))])
+    weights = weights / weights.sum()
+
+    origin = rng.choice(len(pool), size=n, p=weights)
+    destination = rng.choice(len(pool), size=n, p=weights)
+    same = origin == destination
+    destination[same] = (destination[same] + 1) % len(pool)
+
+    distance = np.abs(origin * 37 - destination * 53) % 2700 + 70
+    air_time = np.round(distance / 8.0 + rng.normal(20, 8, n))
+    cancelled = rng.random(n) < rates['cancelled']
+    dep_delay = np.round(rng.gamma(0.6, 25, n) - 8)
+    arr_delay = np.round(dep_delay + rng.normal(-4, 10, n))
+    dep_delay[cancelled] = np.nan
+    arr_delay[cancelled] = np.nan
+    air_time[cancelled] = np.nan
+
+    carriers = rng.choice(CARRIERS, size=n)
+    flight_numbers = rng.integers(1, 7000, n)
+    codes = pool['IATA_CODE'].to_numpy()
+    municipalities = pool['MUNICIPALITY'].to_numpy()
+
+    return pd.DataFrame({
+        'FL_DATE': (np.datetime64('2019-01-01') + rng.integers(0, 90, n)).astype(str),
+        'OP_CARRIER': carriers,
+        'TAIL_NUM': np.char.add('N', rng.integers(100, 999, n).astype(str)),
+        'OP_CARRIER_FL_NUM': _with_junk(flight_numbers, FLIGHT_NUMBER_JUNK, rates['numeric_junk'], rng),
+        'ORIGIN_AIRPORT_ID': 10000 + origin,
+        'ORIGIN': codes[origin],
+        'ORIGIN_CITY_NAME': municipalities[origin],
+        'DEST_AIRPORT_ID': 10000 + destination,
+        'DESTINATION': codes[destination],
+        'DEST_CITY_NAME': municipalities[destination],
+        'DEP_DELAY': dep_delay,
+        'ARR_DELAY': arr_delay,
+        'CANCELLED': cancelled.astype(float),
+        'AIR_TIME': _with_junk(air_time, AIR_TIME_JUNK, rates['numeric_junk'], rng),
+        'DISTANCE': _with_junk(distance.astype(float), DISTANCE_JUNK, rates['numeric_junk'], rng),
+        'OCCUPANCY_RATE': np.round(rng.uniform(0.3, 1.0, n), 2),
+    })
+
+
+def _generate_tickets_chunk(n, airports, popularity, rates, rng, first_itin_id):
+    us = airports[airports['ISO_COUNTRY'].eq('US') & airports['TYPE'].isin(['medium_airport', 'large_airport'])
+                  & airports['IATA_CODE'].notna()]
+    codes = us['IATA_CODE'].to_numpy()
+
+    origin = rng.choice(len(us), size=n, p=popularity)
+    destination = rng.choice(len(us), size=n, p=popularity)
+    same = origin == destination
+    destination[same] = (destination[same] + 1) % len(us)
+
+    fares = np.round(rng.lognormal(5.9, 0.45, n))
+    fares[rng.random(n) < rates['fare_sentinel']] = 11.0
+    fares[rng.random(n) < rates['fare_zero']] = 0.0
+    passengers = np.minimum(rng.zipf(2.2, n), 681).astype(float)
+
+    return pd.DataFrame({
+        'ITIN_ID': first_itin_id + np.arange(n),
+        'YEAR': 2019,
+        'QUARTER': 1,
+        'ORIGIN': codes[origin],
+        'ORIGIN_COUNTRY': 'US',
+        'ORIGIN_STATE_ABR': rng.choice(STATES, size=n),
+        'DESTINATION': codes[destination],
+        'ROUNDTRIP': (rng.random(n) >= rates['non_roundtrip']).astype(float),
+        'REPORTING_CARRIER': rng.choice(CARRIERS, size=n),
+        'PASSENGERS': passengers,
+        'ITIN_FARE': _with_junk(fares, FARE_JUNK, rates['numeric_junk'] * 10, rng),
+    })
+
+
+#=======================================================================================
+# writing the files
+#=======================================================================================
+def generate_synthetic_csv_files(directory, n_flights=1_000_000, n_tickets=None, seed=0,
+                                 chunksize=1_000_000, rates=None):
+    """
+    Writes synthetic Airport_Codes.csv, Flights.csv and Tickets.csv into a directory.
+
+    Parameters:
+    - directory: Where the files are written (created if missing).
+    - n_flights: The number of flight rows (before duplicates are added).
+    - n_tickets: The number of ticket rows (default: 0.6 x n_flights, as in 2019 Q1).
+    - seed: The random seed. Each chunk derives its own stream from it.
+    - chunksize: The number of rows generated and written at a time.
+    - rates: Optional overrides of DEFAULT_RATES.
+
+    Returns:
+    - paths: A dict with the 'airport_codes', 'flights' and 'tickets' file paths.
+    """
+    rates = {**DEFAULT_RATES, **(rates or {})}
+    n_tickets = int(0.6 * n_flights) if n_tickets is None else n_tickets
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, f'{file}.csv') for name, file in
+             [('airport_codes', 'Airport_Codes'), ('flights', 'Flights'), ('tickets', 'Tickets')]}
+
+    airports = generate_airport_codes(seed=seed)
+    _with_duplicates(airports, 0.01, np.random.default_rng([seed, 0])).to_csv(paths['airport_codes'], index=False)
+
+    n_us = (airports['ISO_COUNTRY'].eq('US') & airports['TYPE'].isin(['medium_airport', 'large_airport'])
+            & airports['IATA_CODE'].notna()).sum()
+    popularity = _us_airport_popularity(n_us, np.random.default_rng([seed, 1]))
+
+    for name, total, generate in [('flights', n_flights, _generate_flights_chunk),
+                                  ('tickets', n_tickets, _generate_tickets_chunk)]:
+        for number, start in enumerate(range(0, total, chunksize)):
+            rng = np.random.default_rng([seed, 2 if name == 'flights' else 3, number])
+            n = min(chunksize, total - start)
+            if name == 'flights':
+                chunk = generate(n, airports, popularity, rates, rng)
+            else:
+                chunk = generate(n, airports, popularity, rates, rng, first_itin_id=200000000000 + start)
+            chunk = _with_duplicates(chunk, rates['duplicate'], rng)
+            chunk.to_csv(paths[name], index=False, mode='w' if number == 0 else 'a', header=number == 0)
+
+    return paths
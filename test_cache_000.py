@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from cache_000 import StageCache
+
+
+def test_columns_round_trip(tmp_path):
+    df = pd.DataFrame({
+        'distance': np.array([762, 867, 946], dtype=np.int16),
+        'air_time': [95.5, np.nan, 120.0],
+        'passengers': pd.array([1, None, 3], dtype='Int16'),
+        'itin_fare': pd.array([250.0, None, 11.0], dtype='Float64'),
+        'roundtrip': pd.array([True, None, False], dtype='boolean'),
+        'op_carrier': pd.Series(['WN', 'DL', 'WN']).astype('category'),
+        'origin': ['ATL', None, 'BOS'],
+    }, index=[10, 11, 12])
+    cache = StageCache(str(tmp_path))
+    cache.put('key', df)
+
+    pd.testing.assert_frame_equal(cache.get('key'), df)
+
+
+def test_run_computes_once(tmp_path):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return pd.DataFrame({'fe_route': ['ATL_LGA'], 'fe_number_of_flights_per_route': [900]})
+
+    for _ in range(2):
+        df = StageCache(str(tmp_path)).run('routes', [], [compute], compute)
+
+    assert len(calls) == 1
+    assert df['fe_number_of_flights_per_route'].tolist() == [900]
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from data_wrangling_000 import dw_load_flights, dw_optimize_dtypes
+from synthetic_data_000 import generate_synthetic_csv_files
+
+
+def test_optimize_dtypes_keeps_values_and_nan():
+    df = pd.DataFrame({
+        'whole': [1.0, 2.0, 300.0],
+        'whole_with_nan': [1.0, np.nan, 3.0],
+        'fraction': [0.5, np.nan, 1.25],
+        'nullable': pd.array([1, None, 3], dtype='Int64'),
+        'huge': np.array([2 ** 63 + 1, 1, 2], dtype=np.uint64),
+    })
+    optimized = dw_optimize_dtypes(df, verbose=False)
+
+    assert optimized.dtypes.astype(str).to_dict() == {
+        'whole': 'int16', 'whole_with_nan': 'float32', 'fraction': 'float32', 'nullable': 'Int8', 'huge': 'uint64'}
+    # NaN stays NaN: masks work as before
+    assert optimized['whole_with_nan'].gt(2).tolist() == [False, False, True]
+
+
+def test_optimized_flights_match_plain_flights(tmp_path):
+    paths = generate_synthetic_csv_files(tmp_path, n_flights=5_000, seed=0)
+    plain = dw_load_flights(paths['flights'])
+    optimized = dw_load_flights(paths['flights'], optimize_dtypes=True)
+
+    for column in plain.columns:
+        if pd.api.types.is_numeric_dtype(plain[column]):
+            assert not isinstance(optimized[column].dtype, pd.api.extensions.ExtensionDtype), column
+            np.testing.assert_array_equal(optimized[column].to_numpy(dtype=float), plain[column].to_numpy(dtype=float))
+        else:
+            assert optimized[column].astype(object).equals(plain[column].astype(object)), column
+    assert len(optimized[optimized['dep_delay'] > 15]) == len(plain[plain['dep_delay'] > 15])
@@ -0,0 +1,49 @@
+import os
+
+import pandas as pd
+
+from dedup_000 import RowDeduplicator
+
+
+def _chunks():
+    return [pd.DataFrame({'origin': ['ATL', 'LGA', 'ATL'], 'distance': [762, 762, 762]}),
+            pd.DataFrame({'origin': ['LGA', 'BOS'], 'distance': [762, 200]})]
+
+
+def test_filter_drops_duplicates_across_chunks():
+    dedup = RowDeduplicator(max_memory_hashes=1)
+    kept = pd.concat([dedup.filter(chunk, source='flights') for chunk in _chunks()])
+
+    assert kept['origin'].tolist() == ['ATL', 'LGA', 'BOS']
+    assert dedup.distinct_rows() == 3
+    assert dedup.report()['duplicates'].tolist() == [2]
+    dedup.close()
+
+
+def test_close_removes_spilled_runs():
+    with RowDeduplicator(max_memory_hashes=1) as dedup:
+        for chunk in _chunks():
+            dedup.filter(chunk)
+        run_directory = dedup._run_directory
+        assert os.listdir(run_directory)
+
+    assert not os.path.exists(run_directory)
+    assert dedup.distinct_rows() == 0
+
+
+def test_shared_spill_directory(tmp_path):
+    first = RowDeduplicator(max_memory_hashes=1, spill_directory=str(tmp_path))
+    second = RowDeduplicator(max_memory_hashes=1, spill_directory=str(tmp_path))
+    rows = pd.DataFrame({'origin': ['ATL', 'LGA', 'BOS', 'DEN', 'SFO'], 'distance': [1, 2, 3, 4, 5]})
+    others = pd.DataFrame({'origin': ['ORD', 'MIA', 'SEA', 'PHX', 'DFW'], 'distance': [6, 7, 8, 9, 10]})
+
+    assert len(first.filter(rows)) == 5
+    assert len(second.filter(others)) == 5
+    # the runs of one deduplicator are not overwritten by the other's
+    assert first.filter(rows).empty
+    assert second.filter(others).empty
+
+    first.close()
+    second.close()
+    # the given directory is kept, only the runs are removed
+    assert os.path.isdir(tmp_path) and not os.listdir(tmp_path)
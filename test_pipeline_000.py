@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+from pipeline_000 import dw_run_route_pipeline, dw_run_route_pipeline_sharded
+from synthetic_data_000 import generate_synthetic_csv_files
+
+
+@pytest.fixture(scope='module')
+def raw_frames(tmp_path_factory):
+    paths = generate_synthetic_csv_files(tmp_path_factory.mktemp('data'), n_flights=20_000, seed=0)
+    return [pd.read_csv(paths[name]) for name in ('airport_codes', 'flights', 'tickets')]
+
+
+@pytest.mark.parametrize('workers', [2, 4])
+def test_sharded_pipeline_matches_serial(raw_frames, workers):
+    serial = dw_run_route_pipeline(*raw_frames)
+    sharded = dw_run_route_pipeline_sharded(*raw_frames, workers=workers)
+
+    assert len(serial) > 0
+    pd.testing.assert_frame_equal(sharded, serial.sort_values('fe_route', kind='stable').reset_index(drop=True))
+
+
+def test_sharded_pipeline_prints_one_report(raw_frames, capfd):
+    dw_run_route_pipeline(*raw_frames)
+    serial = capfd.readouterr().out
+    dw_run_route_pipeline_sharded(*raw_frames, workers=2)
+    sharded = capfd.readouterr().out
+
+    assert sharded.count("Successfully converted 'distance' column") == 1
+    assert sharded.count("Successfully converted 'air_time' column") == 1
+    assert sorted(sharded.splitlines()) == sorted(serial.splitlines())
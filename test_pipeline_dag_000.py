@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline_dag_000 import PipelineDAG, _size_mb
+
+
+def _frame(n=200_000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'origin': rng.choice(['ATL', 'LGA', 'BOS', 'SAN_FRANCISCO'], n),
+        'op_carrier': pd.Series(rng.choice(['WN', 'DL', 'AA'], n)).astype('category'),
+        'tail_num': pd.Series(rng.choice(['N123', 'N45678'], n), dtype=object),
+        'distance': rng.random(n),
+    })
+
+
+def test_size_estimate_is_close_to_deep_memory_usage():
+    df = _frame()
+
+    assert _size_mb(df) == pytest.approx(df.memory_usage(deep=True).sum() / 1024 ** 2, rel=0.02)
+    assert _size_mb(df['origin']) == pytest.approx(df['origin'].memory_usage(deep=True) / 1024 ** 2, rel=0.02)
+
+
+def test_eviction_keeps_results_within_budget():
+    df = _frame()
+    dag = PipelineDAG(memory_budget_mb=1.5 * _size_mb(df))
+    dag.add_source('raw', df)
+    dag.add_stage('first', lambda frame: frame.assign(double=frame['distance'] * 2), ['raw'])
+    dag.add_stage('second', lambda frame: frame.assign(triple=frame['distance'] * 3), ['first'])
+
+    assert dag['second']['triple'].iloc[0] == 3 * df['distance'].iloc[0]
+    assert dag.cached() == ['raw', 'second']
+    assert dag.stats['evicted'] == 1
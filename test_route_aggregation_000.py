@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+import pytest
+
+from data_wrangling_000 import (
+    FLIGHTS_NUMERIC_COLUMNS,
+    FLIGHTS_SCHEMA,
+    dw_read_csv_in_chunks,
+    dw_replace_itin_fare_with_group_mean,
+    dw_subset_flights_not_cancelled_only,
+    dw_transform_calculate_mean_fare_by_route_to_merge_with_flights,
+)
+from dedup_000 import RowDeduplicator
+from feature_engineering_000 import fe_create_mean_route_fare_per_passenger, fe_create_route
+from pipeline_000 import _clean_tickets, dw_prepare_airport_codes, dw_run_route_pipeline
+from route_aggregation_000 import QuarterlyRouteStore, dw_stream_route_statistics
+from synthetic_data_000 import generate_synthetic_csv_files
+
+# small enough that most duplicate rows land in another chunk than their original
+CHUNKSIZE = 2_000
+
+
+@pytest.fixture(scope='module')
+def flights_data(tmp_path_factory):
+    paths = generate_synthetic_csv_files(tmp_path_factory.mktemp('data'), n_flights=20_000, seed=0,
+                                         rates={'duplicate': 0.05})
+    airport_codes_initial = pd.read_csv(paths['airport_codes'])
+    tickets_initial = pd.read_csv(paths['tickets'])
+    expected = dw_run_route_pipeline(airport_codes_initial, pd.read_csv(paths['flights']), tickets_initial)
+    route_fares = fe_create_mean_route_fare_per_passenger(
+        dw_transform_calculate_mean_fare_by_route_to_merge_with_flights(
+            fe_create_route(dw_replace_itin_fare_with_group_mean(_clean_tickets(tickets_initial)))))
+
+    return paths, route_fares, dw_prepare_airport_codes(airport_codes_initial), expected
+
+
+def _assert_same_routes(result, expected):
+    result = result.sort_values('fe_route').reset_index(drop=True)
+    expected = expected.sort_values('fe_route').reset_index(drop=True)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_stream_from_csv_matches_grouped_means(flights_data):
+    paths, route_fares, airport_codes_v2, expected = flights_data
+    accumulator = dw_stream_route_statistics(paths['flights'], route_fares, airport_codes_v2, chunksize=CHUNKSIZE)
+
+    _assert_same_routes(accumulator.result(), expected)
+
+
+def test_stream_needs_dedup_across_chunks(flights_data):
+    paths, route_fares, airport_codes_v2, expected = flights_data
+    chunks = dw_read_csv_in_chunks(paths['flights'], FLIGHTS_SCHEMA, [dw_subset_flights_not_cancelled_only],
+                                   FLIGHTS_NUMERIC_COLUMNS, CHUNKSIZE)
+    accumulator = dw_stream_route_statistics(chunks, route_fares, airport_codes_v2)
+
+    # the duplicates span chunks: without a deduplicator some routes count them
+    with pytest.raises(AssertionError):
+        _assert_same_routes(accumulator.result(), expected)
+
+    chunks = dw_read_csv_in_chunks(paths['flights'], FLIGHTS_SCHEMA, [dw_subset_flights_not_cancelled_only],
+                                   FLIGHTS_NUMERIC_COLUMNS, CHUNKSIZE, deduplicator=RowDeduplicator())
+    accumulator = dw_stream_route_statistics(chunks, route_fares, airport_codes_v2)
+
+    _assert_same_routes(accumulator.result(), expected)
+
+
+def test_stream_rejects_deduplicator_for_cleaned_chunks(flights_data):
+    paths, route_fares, airport_codes_v2, _ = flights_data
+    with pytest.raises(ValueError):
+        dw_stream_route_statistics(iter([]), route_fares, airport_codes_v2, deduplicator=RowDeduplicator())
+
+
+def test_quarterly_store_update_from_csv(flights_data, tmp_path):
+    paths, route_fares, airport_codes_v2, expected = flights_data
+    store = QuarterlyRouteStore(str(tmp_path / 'store'))
+    store.update('2019Q1', paths['flights'], route_fares, airport_codes_v2)
+
+    _assert_same_routes(store.window(['2019Q1']).result(), expected)
+
+
+def test_quarterly_store_windows(flights_data, tmp_path):
+    paths, route_fares, airport_codes_v2, expected = flights_data
+    store = QuarterlyRouteStore(str(tmp_path / 'store'))
+    store.update('2019Q1', paths['flights'], route_fares, airport_codes_v2)
+    # replacing a stored partition swaps the new files in and leaves nothing next to it
+    store.update('2019Q1', paths['flights'], route_fares, airport_codes_v2)
+    store.update('2019Q2', paths['flights'], route_fares, airport_codes_v2)
+
+    assert sorted(os.listdir(tmp_path / 'store')) == ['2019Q1', '2019Q2']
+    _assert_same_routes(store.last_n_quarters(1, through='2019Q1').result(), expected)
+    assert store.last_n_quarters(2).result()['fe_number_of_flights_per_route'].sum() == \
+        2 * expected['fe_number_of_flights_per_route'].sum()
+    for n in (0, -1):
+        with pytest.raises(ValueError):
+            store.last_n_quarters(n)
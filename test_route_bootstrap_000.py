@@ -0,0 +1,61 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from route_bootstrap_000 import INTERVAL_METRICS, fe_bootstrap_route_profit_intervals
+
+
+@pytest.fixture(scope='module')
+def master_df():
+    rng = np.random.default_rng(0)
+    sizes = {'ABE_ATL': 1, 'ATL_LGA': 400, 'BOS_ORD': 60, 'DEN_SFO': 5, 'MIA_SEA': 3}
+    routes = np.repeat(list(sizes), list(sizes.values()))
+    df = pd.DataFrame({
+        'fe_route': routes,
+        'distance': rng.uniform(300, 2500, len(routes)).round(),
+        'occupancy_rate': rng.uniform(0.3, 1.0, len(routes)),
+        'dep_delay': rng.exponential(15, len(routes)),
+        'arr_delay': rng.exponential(15, len(routes)),
+        'fe_mean_route_fare_per_passenger': pd.Series(routes).map(
+            {'ABE_ATL': 200.0, 'ATL_LGA': 250.0, 'BOS_ORD': 180.0, 'DEN_SFO': 300.0, 'MIA_SEA': 220.0}),
+        'fe_route_airport_operations_cost': 10_000.0,
+    })
+    # a route without any known distance: its profit is NaN in every resample
+    df.loc[df['fe_route'] == 'MIA_SEA', 'distance'] = np.nan
+
+    return df.sample(frac=1, random_state=0)
+
+
+def test_intervals_shape(master_df):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        intervals = fe_bootstrap_route_profit_intervals(master_df, n_resamples=250, seed=1)
+
+    assert intervals['fe_route'].tolist() == ['ABE_ATL', 'ATL_LGA', 'BOS_ORD', 'DEN_SFO', 'MIA_SEA']
+    for metric in INTERVAL_METRICS:
+        assert f'{metric}_ci_low' in intervals and f'{metric}_ci_high' in intervals
+
+    known = intervals.set_index('fe_route').loc[['ATL_LGA', 'BOS_ORD', 'DEN_SFO']]
+    assert (known['fe_per_round_trip_route_profit_ci_low'] < known['fe_per_round_trip_route_profit_ci_high']).all()
+    assert (known['fe_per_round_trip_route_profit_se'] > 0).all()
+    # more flights, a narrower interval
+    width = known['fe_per_round_trip_route_profit_ci_high'] - known['fe_per_round_trip_route_profit_ci_low']
+    assert width['ATL_LGA'] < width['BOS_ORD'] < width['DEN_SFO']
+
+    # one flight (below min_flights) or no usable flight: no interval
+    assert intervals.set_index('fe_route').loc[['ABE_ATL', 'MIA_SEA']].isna().all().all()
+
+
+def test_min_flights(master_df):
+    intervals = fe_bootstrap_route_profit_intervals(master_df, n_resamples=100, min_flights=10).set_index('fe_route')
+
+    assert intervals['fe_per_round_trip_route_profit_ci_low'].notna().tolist() == [False, True, True, False, False]
+
+
+def test_intervals_do_not_depend_on_workers(master_df):
+    serial = fe_bootstrap_route_profit_intervals(master_df, n_resamples=250, seed=3, batch_draws=5_000)
+    parallel = fe_bootstrap_route_profit_intervals(master_df, n_resamples=250, seed=3, workers=2)
+
+    pd.testing.assert_frame_equal(serial, parallel)
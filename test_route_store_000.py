@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from route_store_000 import RouteMetricsStore, dw_save_route_metrics
+
+
+def _routes(routes, flights):
+    return pd.DataFrame({'fe_route': routes, 'fe_number_of_flights_per_route': flights,
+                         'fe_per_round_trip_route_profit': np.array(flights) * 10.0})
+
+
+def test_store_round_trip(tmp_path):
+    df = _routes(['BOS_ORD', 'ATL_LGA', 'DEN_SFO'], [300, 900, 600])
+    store = RouteMetricsStore(dw_save_route_metrics(df, str(tmp_path / 'store')))
+
+    assert store.row('ATL_LGA') == {'fe_route': 'ATL_LGA', 'fe_number_of_flights_per_route': 900,
+                                    'fe_per_round_trip_route_profit': 9000.0}
+    assert store.row('ABE_ATL') is None
+    pd.testing.assert_frame_equal(store.frame(), df)
+
+
+def test_open_reader_keeps_its_version_across_saves(tmp_path):
+    directory = str(tmp_path / 'store')
+    old = _routes(['ATL_LGA', 'BOS_ORD'], [100, 200])
+    new = _routes(['ABE_ATL', 'ATL_LGA', 'DEN_SFO'], [7, 8, 9])
+    dw_save_route_metrics(old, directory)
+    reader = RouteMetricsStore(directory)
+
+    dw_save_route_metrics(new, directory)
+    dw_save_route_metrics(new, directory)
+
+    assert reader.row('ATL_LGA')['fe_number_of_flights_per_route'] == 100
+    pd.testing.assert_frame_equal(reader.frame(), old)
+    pd.testing.assert_frame_equal(RouteMetricsStore(directory).frame(), new)
+    # only the current version is kept
+    assert len([name for name in os.listdir(directory) if name.startswith('v')]) == 1
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_engineering_000 import RouteEconomicsParameters, fe_calculate_route_economics
+from scenario_sweep_000 import fe_scenario_grid, fe_sweep_route_scenarios
+
+ROUTES = pd.DataFrame({
+    'fe_route': ['ATL_LGA', 'BOS_ORD', 'DEN_SFO', 'ATL_BOS'],
+    'fe_route_mean_distance': [762.0, 867.0, 967.0, 946.0],
+    'fe_route_mean_occupancy_rate': [0.65, 0.5, 0.8, 0.7],
+    'fe_mean_route_fare_per_passenger': [250.0, 180.0, 300.0, 90.0],
+    'fe_route_mean_dep_delay': [10.0, 30.0, 5.0, np.nan],
+    'fe_route_mean_arr_delay': [12.0, 25.0, 0.0, 20.0],
+    'fe_route_airport_operations_cost': [20_000.0, 15_000.0, 15_000.0, 15_000.0],
+    'fe_number_of_flights_per_route': [900, 300, 600, 450],
+})
+AIRPORT_CODES = pd.DataFrame({
+    'type': ['large_airport', 'large_airport', 'medium_airport', 'large_airport', 'large_airport', 'medium_airport'],
+    'iata_code': ['ATL', 'LGA', 'BOS', 'ORD', 'SFO', 'DEN'],
+})
+
+
+def _assert_matches_route_economics(scenario, parameters, airport_codes=None):
+    summary, top_routes = fe_sweep_route_scenarios(ROUTES, pd.DataFrame([scenario]), top_k=len(ROUTES),
+                                                   airport_codes=airport_codes)
+    expected = fe_calculate_route_economics(ROUTES.copy(), parameters, airport_codes=airport_codes)
+    expected = expected.sort_values('fe_total_profit_for_route_2019q1', ascending=False, kind='stable')
+
+    assert summary['fe_total_profit_all_routes'].iloc[0] == expected['fe_total_profit_for_route_2019q1'].sum()
+    assert summary['profitable_routes'].iloc[0] == (expected['fe_per_round_trip_route_profit'] > 0).sum()
+    assert top_routes['fe_route'].tolist() == expected['fe_route'].tolist()
+    for column in ('fe_per_round_trip_route_profit', 'fe_total_profit_for_route_2019q1',
+                   'fe_break_even_point_in_number_of_round_trip_flights_for_route'):
+        np.testing.assert_array_equal(top_routes[column].to_numpy(), expected[column].to_numpy())
+
+
+def test_one_scenario_matches_route_economics():
+    _assert_matches_route_economics({'delay_cost_per_minute': 90, 'bag_share': 0.6},
+                                    RouteEconomicsParameters(delay_cost_per_minute=90, bag_share=0.6))
+
+
+def test_one_scenario_reprices_airport_fees():
+    _assert_matches_route_economics({'large_airport_fee': 12_000, 'medium_airport_fee': 4_000},
+                                    RouteEconomicsParameters(large_airport_fee=12_000, medium_airport_fee=4_000),
+                                    AIRPORT_CODES)
+
+
+def test_sweep_one_row_per_scenario():
+    scenarios = fe_scenario_grid(occupancy_multiplier=[0.8, 1.0, 1.2], fomc_cost_per_mile=[8, 10])
+    summary, top_routes = fe_sweep_route_scenarios(ROUTES, scenarios, top_k=2)
+
+    assert summary['scenario'].tolist() == list(range(6))
+    assert len(top_routes) == 12
+    assert top_routes.groupby('scenario')['rank'].apply(list).eq([[1, 2]] * 6).all()
+
+
+def test_sweep_rejects_empty_grid():
+    with pytest.raises(ValueError, match='No scenarios to sweep'):
+        fe_sweep_route_scenarios(ROUTES, fe_scenario_grid(occupancy_multiplier=[]))
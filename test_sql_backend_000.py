@@ -0,0 +1,20 @@
+import pandas as pd
+
+from pipeline_000 import dw_run_route_pipeline
+from sql_backend_000 import dw_compare_route_tables, dw_sqlite_route_pipeline_from_csv
+from synthetic_data_000 import generate_synthetic_csv_files
+
+
+def test_sqlite_pipeline_matches_pandas(tmp_path):
+    paths = generate_synthetic_csv_files(tmp_path / 'data', n_flights=20_000, seed=0)
+    expected = dw_run_route_pipeline(pd.read_csv(paths['airport_codes']), pd.read_csv(paths['flights']),
+                                     pd.read_csv(paths['tickets']))
+
+    # a small chunksize, so the raw tables are loaded (and deduplicated) over several chunks
+    grouped_data = dw_sqlite_route_pipeline_from_csv(paths['airport_codes'], paths['flights'], paths['tickets'],
+                                                     database=str(tmp_path / 'pipeline.sqlite'), chunksize=3_000)
+
+    assert len(expected) > 0 and len(grouped_data) == len(expected)
+    assert list(grouped_data.columns) == list(expected.columns)
+    differences = dw_compare_route_tables(grouped_data, expected)
+    assert differences.empty, differences.head(20).to_string()